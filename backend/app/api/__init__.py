@@ -1,4 +1,4 @@
 """API routes package"""
-from . import chat, research
+from . import admin, chat, metrics, research
 
-__all__ = ["chat", "research"]
+__all__ = ["admin", "chat", "metrics", "research"]
@@ -0,0 +1,27 @@
+"""
+Operational endpoints for monitoring the running workers
+"""
+from fastapi import APIRouter
+import os
+
+from ..db import async_engine, engine
+
+router = APIRouter(prefix="/api/admin", tags=["admin"])
+
+
+@router.get("/db/pool")
+async def get_db_pool_stats() -> dict:
+    """
+    Connection pool statistics of this worker's database engines
+
+    Counters are per worker process; with several workers, repeated calls
+    may be answered by different workers (see "pid").
+
+    Returns:
+        Checkout counts, overflow and checkout wait times per engine
+    """
+    return {
+        "pid": os.getpid(),
+        "sync": engine.pool_stats.stats(),
+        "async": async_engine.sync_engine.pool_stats.stats(),
+    }
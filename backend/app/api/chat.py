@@ -2,9 +2,12 @@
 Chat API endpoints for CPS scaffolding
 """
 from fastapi import APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session as SQLAlchemySession
-from typing import List
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Callable, List, Optional, Tuple
 import uuid
+import json
+import time
 from datetime import datetime
 import logging
 
@@ -16,8 +19,12 @@ from ..models.schemas import (
     SessionResponse,
     Message
 )
+from ..services.context_builder import context_builder
+from ..services.conversation_history import conversation_history
 from ..services.gemini_service import gemini_service
-from ..db import get_db
+from ..services.intent_detector import detect_intent
+from ..services.write_behind import write_behind_writer
+from ..db import get_async_db, get_async_session_factory
 from .. import crud
 
 logger = logging.getLogger(__name__)
@@ -26,7 +33,7 @@ router = APIRouter(prefix="/api/chat", tags=["chat"])
 
 
 @router.post("/message", response_model=ChatResponse)
-async def send_message(request: ChatRequest, db: SQLAlchemySession = Depends(get_db)):
+async def send_message(request: ChatRequest, db: AsyncSession = Depends(get_async_db)):
     """
     Send a message and receive scaffolding question
 
@@ -34,151 +41,48 @@ async def send_message(request: ChatRequest, db: SQLAlchemySession = Depends(get
     then generates an appropriate scaffolding question to promote
     creative metacognition.
     """
+    started = time.perf_counter()
     try:
-        # Validate session exists if session_id provided
-        session_id = request.session_id
-        if session_id:
-            db_session = crud.get_session(db, session_id)
-            if not db_session:
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Session {session_id} not found. Please create a session first."
-                )
-        else:
-            raise HTTPException(
-                status_code=400,
-                detail="session_id is required. Please create a session first using /api/chat/session endpoint."
-            )
+        session_id = await _require_session(db, request.session_id)
 
-        # Save user message to database
-        crud.create_conversation(
-            db=db,
-            session_id=session_id,
-            role="user",
-            message=request.message
-        )
+        # History of previous turns, from stored messages; older turns are summarized
+        if write_behind_writer is not None:
+            await write_behind_writer.wait_for_session(session_id)
+        history, message_count = await conversation_history.get_async(db, session_id)
+        recent_history, context_summary = await context_builder.build_async(db, session_id, history)
 
-        # Convert conversation history to dict format
-        history = [
-            {"role": msg.role, "content": msg.content}
-            for msg in request.conversation_history
-        ]
-
-        # Get current stage from database if not provided
-        current_stage = request.current_stage
-        if not current_stage:
-            current_stage = crud.get_latest_stage(db, session_id)
-
-        # Check for explicit user transition request
-        user_wants_transition = False
-        requested_stage = None
-        user_message_lower = request.message.lower()
-
-        # Detect explicit transition keywords
-        transition_keywords = {
-            "아이디어": "아이디어_생성",
-            "아이디어 생성": "아이디어_생성",
-            "다음 단계": None,  # Generic next stage
-            "실행 준비": "실행_준비",
-            "실행": "실행_준비",
-        }
+        current_stage, forced_transition, forced_transition_message = await _resolve_stage(
+            db, session_id, request
+        )
+        reads_done = time.perf_counter()
 
-        # Check if user explicitly wants to move to next stage
-        transition_indicators = [
-            "넘어가" in user_message_lower,
-            "이동" in user_message_lower,
-            "가자" in user_message_lower,
-            "진행" in user_message_lower,
-            "싶습니다" in user_message_lower and "이동" in user_message_lower,
-            "싶어요" in user_message_lower and "이동" in user_message_lower,
-        ]
-
-        for keyword, stage in transition_keywords.items():
-            if keyword in user_message_lower and any(transition_indicators):
-                user_wants_transition = True
-                requested_stage = stage
-                break
-
-        # Handle user-requested stage transitions ONLY (no automatic turn limit transitions)
-        forced_transition = False
-        forced_transition_message = None
-
-        if user_wants_transition:
-            # Determine next stage based on current stage
-            stage_progression = {
-                "도전_이해": "아이디어_생성",
-                "아이디어_생성": "실행_준비",
-                "실행_준비": "실행_준비"  # Stay at final stage
-            }
-
-            # If user requested specific stage, use it; otherwise use progression
-            if requested_stage:
-                next_stage = requested_stage
-            else:
-                # Generic "next stage" request
-                next_stage = stage_progression.get(current_stage, "아이디어_생성")
-
-            # Only transition if not at final stage or if specific stage was requested
-            if current_stage != "실행_준비" or requested_stage:
-                forced_transition = True
-                prev_stage = current_stage
-                current_stage = next_stage
-
-                # Set transition message
-                forced_transition_message = f"학습자 요청에 따라 {next_stage} 단계로 진행합니다."
-                logger.info(f"User-requested stage transition for session {session_id}: {prev_stage} -> {next_stage}")
-
-        # Generate scaffolding using Gemini
-        scaffolding_data = gemini_service.generate_scaffolding(
+        # Generate scaffolding using Gemini (non-blocking)
+        scaffolding_data = await gemini_service.generate_scaffolding_async(
             user_message=request.message,
-            conversation_history=history,
-            current_stage=current_stage
+            conversation_history=recent_history,
+            current_stage=current_stage,
+            context_summary=context_summary
         )
 
-        # Update turn count for current stage
-        new_turns, max_turns, _ = crud.update_turn_count(db, session_id, scaffolding_data["current_stage"])
-
-        # Check if stage transition occurred (natural or forced)
-        new_stage = scaffolding_data["current_stage"]
-        if new_stage != current_stage or forced_transition:
-            # Record stage transition
-            crud.create_stage_transition(
-                db=db,
-                session_id=session_id,
-                from_stage=current_stage,
-                to_stage=new_stage,
-                transition_reason=scaffolding_data.get("reasoning"),
-                message_count=len(history) + 1
-            )
-
-        # Save agent message to database
-        crud.create_conversation(
-            db=db,
-            session_id=session_id,
-            role="agent",
-            message=scaffolding_data["scaffolding_question"],
-            cps_stage=scaffolding_data["current_stage"],
-            metacog_elements=scaffolding_data.get("detected_metacog_needs", []),
-            response_depth=scaffolding_data.get("response_depth"),
-            should_transition=scaffolding_data.get("should_transition"),
-            reasoning=scaffolding_data.get("reasoning")
+        # Save the learner message and the reply together
+        turn = await _persist_turn(
+            db, session_id, request.message, current_stage, forced_transition, scaffolding_data, message_count,
+            latency=_turn_latency(started, reads_done, time.perf_counter())
         )
 
-        # Get turn counts for all stages
-        turn_counts = crud.get_turn_counts(db, session_id)
-
         # Create response
         response = ChatResponse(
             session_id=session_id,
             agent_message=scaffolding_data["scaffolding_question"],
-            scaffolding_data=ScaffoldingResponse(**scaffolding_data),
-            turn_counts=turn_counts,
+            # Already validated by gemini_service; skip a second validation pass
+            scaffolding_data=ScaffoldingResponse.model_construct(**scaffolding_data),
+            turn_counts=turn.turn_counts,
             forced_transition=forced_transition,
             forced_transition_message=forced_transition_message,
             timestamp=datetime.now()
         )
 
-        logger.info(f"Generated response for session {session_id}, stage: {scaffolding_data['current_stage']}, turns: {new_turns}/{max_turns}")
+        logger.info(f"Generated response for session {session_id}, stage: {scaffolding_data['current_stage']}, turns: {turn.current_turns}/{turn.max_turns}")
         return response
 
     except HTTPException:
@@ -191,8 +95,241 @@ async def send_message(request: ChatRequest, db: SQLAlchemySession = Depends(get
         )
 
 
+@router.post("/message/stream")
+async def send_message_stream(
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_async_db),
+    session_factory: Callable[[], AsyncSession] = Depends(get_async_session_factory)
+):
+    """
+    Send a message and stream the scaffolding response as Server-Sent Events
+
+    Events:
+        delta: {"text": "..."} - learner-facing text as soon as Gemini produces it
+        done: final stage, depth and metacog metadata plus the persisted
+              conversation id (null with write-behind; agent_message is
+              authoritative and replaces the streamed text, e.g. when a
+              fallback response was used)
+        error: {"detail": "..."} - processing failed after the stream started
+    """
+    started = time.perf_counter()
+    try:
+        session_id = await _require_session(db, request.session_id)
+
+        if write_behind_writer is not None:
+            await write_behind_writer.wait_for_session(session_id)
+        history, message_count = await conversation_history.get_async(db, session_id)
+        recent_history, context_summary = await context_builder.build_async(db, session_id, history)
+
+        current_stage, forced_transition, forced_transition_message = await _resolve_stage(
+            db, session_id, request
+        )
+        reads_done = time.perf_counter()
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing message: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=500,
+            detail="Failed to process message. Please try again."
+        )
+
+    async def event_stream():
+        # get_async_db's session is closed before the body is sent, so the turn is written with a session of its own
+        stream_db = session_factory()
+        try:
+            scaffolding_data = None
+            async for event in gemini_service.generate_scaffolding_stream(
+                user_message=request.message,
+                conversation_history=recent_history,
+                current_stage=current_stage,
+                context_summary=context_summary
+            ):
+                if event["type"] == "delta":
+                    yield _sse_event("delta", {"text": event["text"]})
+                else:
+                    scaffolding_data = event["data"]
+
+            # The LLM time of a streamed reply is the whole stream
+            turn = await _persist_turn(
+                stream_db, session_id, request.message, current_stage, forced_transition, scaffolding_data, message_count,
+                latency=_turn_latency(started, reads_done, time.perf_counter())
+            )
+
+            yield _sse_event("done", {
+                "session_id": session_id,
+                "conversation_id": turn.agent_conversation_id,
+                "agent_message": scaffolding_data["scaffolding_question"],
+                "scaffolding_data": ScaffoldingResponse.model_construct(**scaffolding_data).model_dump(),
+                "turn_counts": turn.turn_counts,
+                "forced_transition": forced_transition,
+                "forced_transition_message": forced_transition_message,
+                "timestamp": datetime.now().isoformat()
+            })
+
+            logger.info(f"Streamed response for session {session_id}, stage: {scaffolding_data['current_stage']}, turns: {turn.current_turns}/{turn.max_turns}")
+
+        except Exception as e:
+            await stream_db.rollback()
+            logger.error(f"Error streaming message: {e}", exc_info=True)
+            yield _sse_event("error", {"detail": "Failed to process message. Please try again."})
+        finally:
+            await stream_db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # Disable proxy buffering (nginx)
+            "Content-Encoding": "identity"  # GZipMiddleware would hold every delta until the stream ends
+        }
+    )
+
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Event frame"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+async def _require_session(db: AsyncSession, session_id: Optional[str]) -> str:
+    """
+    Validate that the request refers to an existing session
+
+    Raises:
+        HTTPException: 400 if session_id is missing, 404 if it does not exist
+    """
+    if session_id:
+        if await crud.get_session_state_async(db, session_id) is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Session {session_id} not found. Please create a session first."
+            )
+    else:
+        raise HTTPException(
+            status_code=400,
+            detail="session_id is required. Please create a session first using /api/chat/session endpoint."
+        )
+    return session_id
+
+
+async def _resolve_stage(
+    db: AsyncSession,
+    session_id: str,
+    request: ChatRequest
+) -> Tuple[str, bool, Optional[str]]:
+    """
+    Determine the CPS stage for this turn, honoring explicit learner transition requests
+
+    Returns:
+        Tuple of (current_stage, forced_transition, forced_transition_message)
+    """
+    # Get current stage from the session state if not provided
+    current_stage = request.current_stage
+    if not current_stage:
+        current_stage = (await crud.get_session_state_async(db, session_id)).stage
+
+    # Check for explicit user transition request
+    intent = detect_intent(request.message)
+    user_wants_transition = intent.wants_transition
+    requested_stage = intent.target_stage
+
+    # Handle user-requested stage transitions ONLY (no automatic turn limit transitions)
+    forced_transition = False
+    forced_transition_message = None
+
+    if user_wants_transition:
+        # Determine next stage based on current stage
+        stage_progression = {
+            "도전_이해": "아이디어_생성",
+            "아이디어_생성": "실행_준비",
+            "실행_준비": "실행_준비"  # Stay at final stage
+        }
+
+        # If user requested specific stage, use it; otherwise use progression
+        if requested_stage:
+            next_stage = requested_stage
+        else:
+            # Generic "next stage" request
+            next_stage = stage_progression.get(current_stage, "아이디어_생성")
+
+        # Only transition if not at final stage or if specific stage was requested
+        if current_stage != "실행_준비" or requested_stage:
+            forced_transition = True
+            prev_stage = current_stage
+            current_stage = next_stage
+
+            # Set transition message
+            forced_transition_message = f"학습자 요청에 따라 {next_stage} 단계로 진행합니다."
+            logger.info(f"User-requested stage transition for session {session_id}: {prev_stage} -> {next_stage}")
+
+    return current_stage, forced_transition, forced_transition_message
+
+
+def _turn_latency(started: float, reads_done: float, reply_done: float) -> crud.TurnLatency:
+    """
+    Timings of a turn from perf_counter readings
+
+    Args:
+        started: Request received
+        reads_done: Session, history and stage read; the LLM call starts
+        reply_done: LLM reply complete; the turn is about to be written
+
+    persist_turn adds the time of the turn's learner message insert to db_ms
+    and total_ms.
+    """
+    return crud.TurnLatency(
+        llm_ms=round((reply_done - reads_done) * 1000),
+        db_ms=round((reads_done - started) * 1000),
+        total_ms=round((reply_done - started) * 1000)
+    )
+
+
+async def _persist_turn(
+    db: AsyncSession,
+    session_id: str,
+    user_message: str,
+    current_stage: str,
+    forced_transition: bool,
+    scaffolding_data: dict,
+    message_count: int,
+    latency: Optional[crud.TurnLatency] = None
+) -> crud.PersistedTurn:
+    """
+    Save the learner message, agent message, turn count and any stage transition in one transaction
+
+    With write-behind enabled only the counters are committed here; the
+    message and transition rows are queued for a background bulk insert.
+    The turn's latency is stored on the agent message and folded into the
+    session's average response time, in the same transaction.
+
+    Returns:
+        PersistedTurn with the agent conversation id and turn counts
+    """
+    # Check if stage transition occurred (natural or forced)
+    new_stage = scaffolding_data["current_stage"]
+
+    return await crud.persist_turn_async(
+        db=db,
+        session_id=session_id,
+        user_message=user_message,
+        agent_message=scaffolding_data["scaffolding_question"],
+        cps_stage=new_stage,
+        previous_stage=current_stage,
+        metacog_elements=scaffolding_data.get("detected_metacog_needs", []),
+        response_depth=scaffolding_data.get("response_depth"),
+        should_transition=scaffolding_data.get("should_transition"),
+        reasoning=scaffolding_data.get("reasoning"),
+        record_transition=new_stage != current_stage or forced_transition,
+        message_count=message_count + 1,
+        defer_rows=write_behind_writer.enqueue_async if write_behind_writer is not None else None,
+        latency=latency
+    )
+
+
 @router.post("/session", response_model=SessionResponse)
-async def create_session(request: SessionCreate, db: SQLAlchemySession = Depends(get_db)):
+async def create_session(request: SessionCreate, db: AsyncSession = Depends(get_async_db)):
     """
     Create a new conversation session
 
@@ -201,7 +338,7 @@ async def create_session(request: SessionCreate, db: SQLAlchemySession = Depends
     """
     try:
         # Create session in database
-        db_session = crud.create_session(db, request)
+        db_session = await crud.create_session_async(db, request)
 
         response = SessionResponse(
             session_id=db_session.id,
@@ -0,0 +1,21 @@
+"""
+Prometheus scrape endpoint
+"""
+from fastapi import APIRouter
+from fastapi.responses import Response
+
+from ..services.metrics import render_metrics
+
+router = APIRouter(tags=["monitoring"])
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics() -> Response:
+    """
+    Metrics in the Prometheus text format
+
+    With PROMETHEUS_MULTIPROC_DIR set, the samples of all workers are
+    aggregated, so any worker can answer the scrape.
+    """
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
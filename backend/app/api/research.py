@@ -1,17 +1,20 @@
 """
 Research data export API endpoints
 """
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session as SQLAlchemySession
-from typing import List, Optional
-import csv
-import io
+from typing import Callable, Optional
+from datetime import datetime, timezone
 from fastapi.responses import StreamingResponse
 import logging
 
-from ..db import get_db
+from ..core.config import settings
+from ..db import get_async_db, get_session_factory
 from .. import crud
-from ..models.database import Session, Conversation, StageTransition, SessionMetric
+from ..models.database import SessionMetric
+from ..services.research_export import parquet_available, stream_csv, stream_parquet, stream_session_bundles
 
 logger = logging.getLogger(__name__)
 
@@ -21,31 +24,37 @@ router = APIRouter(prefix="/api/research", tags=["research"])
 @router.get("/sessions")
 async def get_all_sessions(
     user_id: Optional[str] = None,
-    skip: int = 0,
-    limit: int = 100,
-    db: SQLAlchemySession = Depends(get_db)
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    count: str = Query("exact", pattern="^(exact|estimated|none)$"),
+    skip: int = Query(0, ge=0),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get all sessions for research analysis
+    Get all sessions for research analysis, newest first
+
+    Pages are keyed on (created_at, id): pass a page's next_cursor to get
+    the following page.
 
     Args:
         user_id: Optional filter by user ID
-        skip: Number of records to skip
         limit: Maximum number of records to return
+        cursor: next_cursor of the previous page
+        count: "exact", "estimated" (planner statistics where available) or "none"
+        skip: Offset of the first page (deprecated; use cursor)
         db: Database session
 
     Returns:
-        List of sessions with metadata
+        Page of sessions with metadata, total count and next_cursor
     """
     try:
-        if user_id:
-            sessions = crud.get_user_sessions(db, user_id, skip, limit)
-        else:
-            # Order by created_at descending (newest first)
-            sessions = db.query(Session).order_by(Session.created_at.desc()).offset(skip).limit(limit).all()
+        page = await crud.get_sessions_page_async(db, user_id=user_id, limit=limit, cursor=cursor, skip=skip)
+        total = None if count == "none" else await crud.count_sessions_async(db, user_id, estimated=count == "estimated")
 
         return {
-            "total": len(sessions),
+            **_total_fields(total),
+            "count": len(page.items),
+            "next_cursor": page.next_cursor,
             "sessions": [
                 {
                     "session_id": s.id,
@@ -56,10 +65,12 @@ async def get_all_sessions(
                     "completed_at": s.completed_at.isoformat() if s.completed_at else None,
                     "is_active": s.is_active
                 }
-                for s in sessions
+                for s in page.items
             ]
         }
 
+    except crud.InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception as e:
         logger.error(f"Error fetching sessions: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch sessions")
@@ -68,29 +79,39 @@ async def get_all_sessions(
 @router.get("/sessions/{session_id}/conversations")
 async def get_session_conversations_api(
     session_id: str,
-    db: SQLAlchemySession = Depends(get_db)
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get all conversations for a session
+    Get the conversations of a session in creation order
+
+    Pages are keyed on the conversation id: pass a page's next_cursor to
+    get the following page.
 
     Args:
         session_id: Session ID
+        limit: Maximum number of records to return
+        cursor: next_cursor of the previous page
         db: Database session
 
     Returns:
-        List of conversations with CPS annotations
+        Page of conversations with CPS annotations, total count and next_cursor
     """
     try:
         # Verify session exists
-        session = crud.get_session(db, session_id)
+        session = await crud.get_session_async(db, session_id)
         if not session:
             raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
 
-        conversations = crud.get_session_conversations(db, session_id, limit=1000)
+        page = await crud.get_conversations_page_async(db, session_id, limit=limit, cursor=cursor)
+        total = await crud.count_conversations_async(db, session_id)
 
         return {
             "session_id": session_id,
-            "total": len(conversations),
+            **_total_fields(total),
+            "count": len(page.items),
+            "next_cursor": page.next_cursor,
             "conversations": [
                 {
                     "id": c.id,
@@ -101,14 +122,19 @@ async def get_session_conversations_api(
                     "response_depth": c.response_depth,
                     "should_transition": c.should_transition,
                     "reasoning": c.reasoning,
+                    "llm_latency_ms": c.llm_latency_ms,
+                    "db_latency_ms": c.db_latency_ms,
+                    "total_latency_ms": c.total_latency_ms,
                     "created_at": c.created_at.isoformat()
                 }
-                for c in conversations
+                for c in page.items
             ]
         }
 
     except HTTPException:
         raise
+    except crud.InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception as e:
         logger.error(f"Error fetching conversations: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch conversations")
@@ -117,29 +143,36 @@ async def get_session_conversations_api(
 @router.get("/sessions/{session_id}/transitions")
 async def get_session_transitions_api(
     session_id: str,
-    db: SQLAlchemySession = Depends(get_db)
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
-    Get all stage transitions for a session
+    Get the stage transitions of a session in creation order
 
     Args:
         session_id: Session ID
+        limit: Maximum number of records to return
+        cursor: next_cursor of the previous page
         db: Database session
 
     Returns:
-        List of stage transitions
+        Page of stage transitions, total count and next_cursor
     """
     try:
         # Verify session exists
-        session = crud.get_session(db, session_id)
+        session = await crud.get_session_async(db, session_id)
         if not session:
             raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
 
-        transitions = crud.get_session_transitions(db, session_id)
+        page = await crud.get_transitions_page_async(db, session_id, limit=limit, cursor=cursor)
+        total = await crud.count_transitions_async(db, session_id)
 
         return {
             "session_id": session_id,
-            "total": len(transitions),
+            **_total_fields(total),
+            "count": len(page.items),
+            "next_cursor": page.next_cursor,
             "transitions": [
                 {
                     "id": t.id,
@@ -149,21 +182,64 @@ async def get_session_transitions_api(
                     "message_count": t.message_count,
                     "created_at": t.created_at.isoformat()
                 }
-                for t in transitions
+                for t in page.items
             ]
         }
 
     except HTTPException:
         raise
+    except crud.InvalidCursorError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
     except Exception as e:
         logger.error(f"Error fetching transitions: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to fetch transitions")
 
 
+def _total_fields(total: Optional[crud.Total]) -> dict:
+    """Total of a listing (cached for COUNT_CACHE_TTL_SECONDS) and whether it is an estimate"""
+    if total is None:
+        return {"total": None, "total_estimated": False}
+    return {"total": total.value, "total_estimated": total.estimated}
+
+
+@router.get("/analytics/summary")
+async def get_analytics_summary_api(
+    user_id: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Class-level analytics: response depth distribution and metacognitive
+    element frequency per CPS stage, and average turns per stage
+
+    Computed with GROUP BY queries and cached in-process until new
+    conversations are written.
+
+    Args:
+        user_id: Optional filter by user ID
+        start_date: Only sessions created at or after this time
+        end_date: Only sessions created before this time
+        db: Database session
+
+    Returns:
+        Aggregates of the filtered sessions
+    """
+    start_date, end_date = _naive_utc(start_date), _naive_utc(end_date)
+    if start_date and end_date and start_date >= end_date:
+        raise HTTPException(status_code=400, detail="start_date must be before end_date")
+
+    try:
+        return await crud.get_analytics_summary_async(db, user_id=user_id, start_date=start_date, end_date=end_date)
+    except Exception as e:
+        logger.error(f"Error computing analytics summary: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail="Failed to compute analytics summary")
+
+
 @router.get("/sessions/{session_id}/metrics")
 async def get_session_metrics_api(
     session_id: str,
-    db: SQLAlchemySession = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     Get aggregated metrics for a session
@@ -177,13 +253,11 @@ async def get_session_metrics_api(
     """
     try:
         # Verify session exists
-        session = crud.get_session(db, session_id)
+        session = await crud.get_session_async(db, session_id)
         if not session:
             raise HTTPException(status_code=404, detail=f"Session {session_id} not found")
 
-        metrics = db.query(SessionMetric).filter(
-            SessionMetric.session_id == session_id
-        ).first()
+        metrics = await db.scalar(select(SessionMetric).where(SessionMetric.session_id == session_id))
 
         if not metrics:
             raise HTTPException(status_code=404, detail=f"Metrics not found for session {session_id}")
@@ -216,154 +290,172 @@ async def get_session_metrics_api(
 @router.get("/export/conversations/csv")
 async def export_conversations_csv(
     user_id: Optional[str] = None,
-    db: SQLAlchemySession = Depends(get_db)
+    session_factory: Callable[[], SQLAlchemySession] = Depends(get_session_factory)
 ):
     """
     Export all conversations to CSV for research analysis
 
+    The file is streamed in chunks of EXPORT_CHUNK_ROWS rows read from a
+    server-side cursor, so memory use does not depend on its size.
+
     Args:
         user_id: Optional filter by user ID
-        db: Database session
+        session_factory: Creates the database session of the export
 
     Returns:
         CSV file with all conversation data
     """
-    try:
-        # Query conversations
-        query = db.query(Conversation).join(Session)
-
-        if user_id:
-            query = query.filter(Session.user_id == user_id)
-
-        conversations = query.order_by(Conversation.created_at).all()
-
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Write header
-        writer.writerow([
-            "conversation_id",
-            "session_id",
-            "user_id",
-            "role",
-            "message",
-            "cps_stage",
-            "metacog_elements",
-            "response_depth",
-            "should_transition",
-            "reasoning",
-            "created_at"
-        ])
-
-        # Write data
-        for c in conversations:
-            writer.writerow([
-                c.id,
-                c.session_id,
-                c.session.user_id,
-                c.role,
-                c.message,
-                c.cps_stage,
-                ",".join(c.metacog_elements) if c.metacog_elements else "",
-                c.response_depth,
-                c.should_transition,
-                c.reasoning,
-                c.created_at.isoformat()
-            ])
-
-        output.seek(0)
-
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=conversations.csv"}
-        )
-
-    except Exception as e:
-        logger.error(f"Error exporting conversations: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Failed to export conversations")
+    return StreamingResponse(
+        stream_csv(
+            session_factory,
+            crud.conversation_export_query(user_id),
+            crud.CONVERSATION_EXPORT_COLUMNS,
+            chunk_size=settings.EXPORT_CHUNK_ROWS
+        ),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=conversations.csv"}
+    )
 
 
 @router.get("/export/metrics/csv")
 async def export_metrics_csv(
     user_id: Optional[str] = None,
-    db: SQLAlchemySession = Depends(get_db)
+    session_factory: Callable[[], SQLAlchemySession] = Depends(get_session_factory)
 ):
     """
     Export session metrics to CSV for research analysis
 
+    Streamed like export_conversations_csv.
+
     Args:
         user_id: Optional filter by user ID
-        db: Database session
+        session_factory: Creates the database session of the export
 
     Returns:
         CSV file with session metrics
     """
-    try:
-        # Query metrics
-        query = db.query(SessionMetric).join(Session)
-
-        if user_id:
-            query = query.filter(Session.user_id == user_id)
-
-        metrics = query.all()
-
-        # Create CSV in memory
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Write header
-        writer.writerow([
-            "session_id",
-            "user_id",
-            "total_messages",
-            "user_messages",
-            "agent_messages",
-            "shallow_responses",
-            "medium_responses",
-            "deep_responses",
-            "stages_completed",
-            "total_stage_transitions",
-            "monitoring_count",
-            "control_count",
-            "knowledge_count",
-            "session_duration_seconds",
-            "avg_response_time_seconds",
-            "completed",
-            "created_at"
-        ])
-
-        # Write data
-        for m in metrics:
-            writer.writerow([
-                m.session_id,
-                m.session.user_id,
-                m.total_messages,
-                m.user_messages,
-                m.agent_messages,
-                m.shallow_responses,
-                m.medium_responses,
-                m.deep_responses,
-                ",".join(m.stages_completed) if m.stages_completed else "",
-                m.total_stage_transitions,
-                m.monitoring_count,
-                m.control_count,
-                m.knowledge_count,
-                m.session_duration_seconds,
-                m.avg_response_time_seconds,
-                m.completed,
-                m.created_at.isoformat()
-            ])
-
-        output.seek(0)
-
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=session_metrics.csv"}
-        )
+    return StreamingResponse(
+        stream_csv(
+            session_factory,
+            crud.metric_export_query(user_id),
+            crud.METRIC_EXPORT_COLUMNS,
+            chunk_size=settings.EXPORT_CHUNK_ROWS
+        ),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=session_metrics.csv"}
+    )
+
+
+@router.get("/export/conversations/parquet")
+async def export_conversations_parquet(
+    user_id: Optional[str] = None,
+    session_factory: Callable[[], SQLAlchemySession] = Depends(get_session_factory)
+):
+    """
+    Export all conversations to Parquet for research analysis
 
-    except Exception as e:
-        logger.error(f"Error exporting metrics: {e}", exc_info=True)
-        raise HTTPException(status_code=500, detail="Failed to export metrics")
+    Columns keep their types: timestamps, booleans and metacog_elements as a
+    list column. Row groups of EXPORT_PARQUET_ROW_GROUP_ROWS rows are built
+    from chunked reads and streamed as they are complete.
+
+    Args:
+        user_id: Optional filter by user ID
+        session_factory: Creates the database session of the export
+
+    Returns:
+        Parquet file with all conversation data
+
+    Raises:
+        HTTPException: 501 if pyarrow is not installed
+    """
+    return _parquet_response(
+        session_factory, crud.conversation_export_query(user_id), crud.CONVERSATION_EXPORT_COLUMNS, "conversations.parquet"
+    )
+
+
+@router.get("/export/metrics/parquet")
+async def export_metrics_parquet(
+    user_id: Optional[str] = None,
+    session_factory: Callable[[], SQLAlchemySession] = Depends(get_session_factory)
+):
+    """
+    Export session metrics to Parquet for research analysis
+
+    Streamed like export_conversations_parquet; stages_completed is a list column.
+
+    Args:
+        user_id: Optional filter by user ID
+        session_factory: Creates the database session of the export
+
+    Returns:
+        Parquet file with session metrics
+
+    Raises:
+        HTTPException: 501 if pyarrow is not installed
+    """
+    return _parquet_response(
+        session_factory, crud.metric_export_query(user_id), crud.METRIC_EXPORT_COLUMNS, "session_metrics.parquet"
+    )
+
+
+@router.get("/export/sessions.ndjson")
+async def export_sessions_ndjson(
+    user_id: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    session_factory: Callable[[], SQLAlchemySession] = Depends(get_session_factory)
+):
+    """
+    Export sessions as NDJSON, one line per session with its conversations,
+    stage transitions and metrics nested
+
+    Sessions are streamed oldest first in chunks of EXPORT_CHUNK_SESSIONS;
+    the children of a chunk are loaded together, not per session.
+
+    Args:
+        user_id: Optional filter by user ID
+        start_date: Only sessions created at or after this time
+        end_date: Only sessions created before this time
+        session_factory: Creates the database session of the export
+
+    Returns:
+        NDJSON file of session bundles
+    """
+    start_date, end_date = _naive_utc(start_date), _naive_utc(end_date)
+    if start_date and end_date and start_date >= end_date:
+        raise HTTPException(status_code=400, detail="start_date must be before end_date")
+
+    return StreamingResponse(
+        stream_session_bundles(
+            session_factory,
+            crud.session_bundle_query(user_id, start_date, end_date),
+            chunk_size=settings.EXPORT_CHUNK_SESSIONS
+        ),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=sessions.ndjson"}
+    )
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored as naive UTC; convert offset-aware filter values to match"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _parquet_response(session_factory, query, columns, filename: str) -> StreamingResponse:
+    # Checked up front: once streaming has started, a failure can only cut the file short
+    if not parquet_available():
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+
+    return StreamingResponse(
+        stream_parquet(
+            session_factory,
+            query,
+            columns,
+            chunk_size=settings.EXPORT_CHUNK_ROWS,
+            row_group_rows=settings.EXPORT_PARQUET_ROW_GROUP_ROWS
+        ),
+        media_type="application/vnd.apache.parquet",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
@@ -2,7 +2,7 @@
 Application configuration management
 """
 from pydantic_settings import BaseSettings
-from typing import List
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -13,12 +13,113 @@ class Settings(BaseSettings):
     LOG_LEVEL: str = "info"
     ENVIRONMENT: str = "development"
 
+    # LLM backend: "gemini" or "local" (deterministic offline backend for load tests)
+    LLM_BACKEND: str = "gemini"
+
     # Gemini API
-    GEMINI_API_KEY: str
+    GEMINI_API_KEY: str = ""
     GEMINI_MODEL: str = "gemini-2.0-flash-exp"
+    GEMINI_JSON_MODE: bool = True  # Schema-constrained JSON output
+
+    # Local LLM backend (only used when LLM_BACKEND=local)
+    LOCAL_LLM_LATENCY_MS: int = 0
+    LOCAL_LLM_LATENCY_JITTER_MS: int = 0
+    LOCAL_LLM_ERROR_RATE: float = 0.0
+    LOCAL_LLM_RESPONSES_PATH: Optional[str] = None  # JSON file with {"question": [...], "answer": [...]}
+    LOCAL_LLM_SEED: int = 0
+
+    # LLM call dispatching (per worker process)
+    LLM_MAX_IN_FLIGHT: int = 16  # Concurrent LLM calls
+    LLM_REQUESTS_PER_MINUTE: int = 0  # Token bucket rate; 0 disables
+    LLM_BURST: int = 0  # Token bucket size; 0 uses LLM_MAX_IN_FLIGHT
+    LLM_QUEUE_MAX_WAIT_SECONDS: float = 20.0  # Max wait for a slot per attempt; the deadline also bounds it
+    LLM_MAX_QUEUE_SIZE: int = 100  # Waiting calls beyond this are rejected immediately
+
+    # LLM deadline, retries and hedging
+    LLM_DEADLINE_SECONDS: float = 6.0  # Budget per chat turn from request entry, queueing included
+    LLM_MAX_ATTEMPTS: int = 3
+    LLM_RETRY_BASE_DELAY_SECONDS: float = 0.2
+    LLM_RETRY_MAX_DELAY_SECONDS: float = 1.0
+    LLM_HEDGING_ENABLED: bool = False
+    LLM_HEDGE_DELAY_SECONDS: float = 0.0  # Fixed hedge delay; 0 uses observed latency percentile
+    LLM_HEDGE_PERCENTILE: float = 0.9
+
+    # Circuit breaker around the LLM backend
+    CIRCUIT_BREAKER_ENABLED: bool = True
+    CIRCUIT_BREAKER_WINDOW_SIZE: int = 20  # Recent calls considered
+    CIRCUIT_BREAKER_MIN_CALLS: int = 10  # Calls needed before the breaker can open
+    CIRCUIT_BREAKER_FAILURE_RATE: float = 0.5
+    CIRCUIT_BREAKER_SLOW_CALL_SECONDS: float = 5.0
+    CIRCUIT_BREAKER_SLOW_CALL_RATE: float = 0.8
+    CIRCUIT_BREAKER_OPEN_SECONDS: float = 30.0  # Time before half-open probes
+    CIRCUIT_BREAKER_HALF_OPEN_PROBES: int = 2  # Successful probes needed to close
+
+    # Server-side conversation history (per-session ring buffers)
+    HISTORY_BUFFER_MESSAGES: int = 20  # Recent messages kept per session
+    HISTORY_BUFFER_MAX_SESSIONS: int = 1000  # Least recently used sessions are dropped beyond this
+
+    # Prompt context (recent messages verbatim, older learner messages summarized)
+    CONTEXT_TOKEN_BUDGET: int = 1200  # Estimated tokens for verbatim history
+    CONTEXT_SUMMARY_TOKEN_BUDGET: int = 300  # Estimated tokens for the rolling summary
+
+    # Response cache for repeated learner inputs
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_BACKEND: str = "memory"  # "memory" (per worker) or "redis" (shared)
+    RESPONSE_CACHE_TTL_SECONDS: int = 600
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1000
+    RESPONSE_CACHE_CONTEXT_TURNS: int = 2  # Trailing history messages included in the cache key
+
+    # Session hot-state cache (stage, turn counts, metric counters)
+    SESSION_STATE_CACHE_ENABLED: bool = True
+    SESSION_STATE_CACHE_BACKEND: str = "memory"  # "memory" (per worker) or "redis" (shared)
+    SESSION_STATE_CACHE_MAX_SESSIONS: int = 1000  # Memory backend only
+    SESSION_STATE_CACHE_TTL_SECONDS: int = 3600  # Redis backend only
+
+    # Cached totals of research listings
+    COUNT_CACHE_ENABLED: bool = True
+    COUNT_CACHE_BACKEND: str = "memory"  # "memory" (per worker) or "redis" (shared)
+    COUNT_CACHE_TTL_SECONDS: int = 60  # Totals may lag new rows by up to this long
+    COUNT_CACHE_MAX_ENTRIES: int = 1000  # Memory backend only
+
+    # In-process cache of research analytics summaries, keyed by filters and the max conversation id
+    ANALYTICS_CACHE_ENABLED: bool = True
+    ANALYTICS_CACHE_TTL_SECONDS: int = 300  # Bounds staleness of metric-only changes (no new conversations)
+    ANALYTICS_CACHE_MAX_ENTRIES: int = 256
+
+    # Research exports
+    EXPORT_CHUNK_ROWS: int = 1000  # Rows per database fetch and per streamed chunk
+    EXPORT_CHUNK_SESSIONS: int = 100  # Sessions per fetch of the NDJSON export; children are loaded per chunk
+    EXPORT_PARQUET_ROW_GROUP_ROWS: int = 50000  # Rows per Parquet row group (bounds export memory)
+
+    # Write-behind persistence of conversation and transition rows
+    WRITE_BEHIND_ENABLED: bool = False
+    WRITE_BEHIND_QUEUE_SIZE: int = 1000  # Queued turns; a full queue falls back to synchronous writes
+    WRITE_BEHIND_FLUSH_INTERVAL_MS: int = 50  # Longest a queued turn waits for its batch
+    WRITE_BEHIND_BATCH_ROWS: int = 200  # Rows per bulk insert
+    WRITE_BEHIND_WAIT_TIMEOUT_MS: int = 2000  # Longest a chat turn waits for its session's queued rows before reading without them
+
+    # Prometheus metrics (/metrics)
+    METRICS_ENABLED: bool = True
+    # Directory shared by all workers for multiprocess metrics; required with more than one worker.
+    # Must be empty at startup and is read before prometheus_client is first imported.
+    PROMETHEUS_MULTIPROC_DIR: str = ""
+
+    # Redis
+    REDIS_URL: str = "redis://localhost:6379/0"
 
     # Database
-    DATABASE_URL: str = "sqlite:///./univ_consult.db"
+    DATABASE_URL: str = "sqlite:///./univ_consult.db"  # PostgreSQL or SQLite
+    DB_ECHO: bool = False  # Log every SQL statement
+    DB_POOL_SIZE: int = 5  # Per engine; the sync and async engines each keep a pool
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT_SECONDS: float = 10.0  # Max wait for a pooled connection
+    DB_POOL_RECYCLE_SECONDS: int = 3600
+    DB_CONNECT_TIMEOUT_SECONDS: int = 10
+    DB_STATEMENT_TIMEOUT_MS: int = 30000  # PostgreSQL only; 0 disables
+    DB_APPLICATION_NAME: str = "cps-scaffolding-agent"  # PostgreSQL only; shown in pg_stat_activity
+    SQLITE_JOURNAL_MODE: str = "WAL"
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000  # Wait for a locked database before failing
+    SQLITE_SYNCHRONOUS: str = "NORMAL"  # NORMAL is durable with WAL except on power loss
 
     # CORS
     ALLOWED_ORIGINS: str = "http://localhost:3000,http://localhost:5173"
@@ -4,19 +4,65 @@ from .sessions import (
     get_session,
     get_user_sessions,
     update_session,
-    delete_session
+    delete_session,
+    create_session_async,
+    get_session_async
 )
 from .conversations import (
     create_conversation,
     get_conversation,
     get_session_conversations,
-    get_latest_conversations
+    get_latest_conversations,
+    get_conversations_after,
+    count_session_conversations,
+    get_latest_conversations_async,
+    get_conversations_after_async,
+    count_session_conversations_async
 )
 from .stage_transitions import (
     create_stage_transition,
     get_session_transitions,
     get_latest_stage
 )
+from .session_state import (
+    get_session_state,
+    load_session_state,
+    get_session_state_async,
+    load_session_state_async
+)
+from .turns import (
+    persist_turn,
+    persist_turn_async,
+    insert_turn_rows,
+    PersistedTurn,
+    TurnLatency,
+    TurnRows
+)
+from .exports import (
+    conversation_export_query,
+    metric_export_query,
+    session_bundle_query,
+    iter_export_chunks,
+    CONVERSATION_EXPORT_COLUMNS,
+    METRIC_EXPORT_COLUMNS
+)
+from .pagination import (
+    get_sessions_page_async,
+    get_conversations_page_async,
+    get_transitions_page_async,
+    count_sessions_async,
+    count_conversations_async,
+    count_transitions_async,
+    encode_cursor,
+    decode_cursor,
+    InvalidCursorError,
+    Page,
+    Total
+)
+from .analytics import (
+    get_analytics_summary_async,
+    get_conversations_high_water_mark_async
+)
 from .session_metrics import (
     get_or_create_session_metric,
     update_turn_count,
@@ -33,15 +79,56 @@ __all__ = [
     "get_user_sessions",
     "update_session",
     "delete_session",
+    "create_session_async",
+    "get_session_async",
     # Conversations
     "create_conversation",
     "get_conversation",
     "get_session_conversations",
     "get_latest_conversations",
+    "get_conversations_after",
+    "count_session_conversations",
+    "get_latest_conversations_async",
+    "get_conversations_after_async",
+    "count_session_conversations_async",
     # Stage transitions
     "create_stage_transition",
     "get_session_transitions",
     "get_latest_stage",
+    # Session state
+    "get_session_state",
+    "load_session_state",
+    "get_session_state_async",
+    "load_session_state_async",
+    # Turns
+    "persist_turn",
+    "persist_turn_async",
+    "insert_turn_rows",
+    "PersistedTurn",
+    "TurnLatency",
+    "TurnRows",
+    # Exports
+    "conversation_export_query",
+    "metric_export_query",
+    "session_bundle_query",
+    "iter_export_chunks",
+    "CONVERSATION_EXPORT_COLUMNS",
+    "METRIC_EXPORT_COLUMNS",
+    # Pagination
+    "get_sessions_page_async",
+    "get_conversations_page_async",
+    "get_transitions_page_async",
+    "count_sessions_async",
+    "count_conversations_async",
+    "count_transitions_async",
+    "encode_cursor",
+    "decode_cursor",
+    "InvalidCursorError",
+    "Page",
+    "Total",
+    # Analytics
+    "get_analytics_summary_async",
+    "get_conversations_high_water_mark_async",
     # Session metrics
     "get_or_create_session_metric",
     "update_turn_count",
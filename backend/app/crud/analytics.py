@@ -0,0 +1,120 @@
+"""
+Class-level aggregates for research analytics
+Computed with GROUP BY in the database; results are cached until new conversations arrive
+"""
+from sqlalchemy import case, func, literal_column, select, true
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Dict, Optional
+from datetime import datetime
+
+from ..models.database import Conversation, Session, SessionMetric
+from ..services.query_cache import analytics_cache, query_cache_key
+from ..services.session_state_cache import TURN_COLUMNS
+
+
+def _filtered(query, user_id: Optional[str], start_date: Optional[datetime], end_date: Optional[datetime]):
+    """Restrict a query joined with Session to a user and a session creation range"""
+    if user_id:
+        query = query.where(Session.user_id == user_id)
+    if start_date:
+        query = query.where(Session.created_at >= start_date)
+    if end_date:
+        query = query.where(Session.created_at < end_date)
+    return query
+
+
+def _agent_conversations(query, user_id: Optional[str], start_date: Optional[datetime], end_date: Optional[datetime]):
+    """Restrict a Conversation query to agent messages of the filtered sessions"""
+    query = query.join(Session, Session.id == Conversation.session_id).where(Conversation.role == "agent")
+    return _filtered(query, user_id, start_date, end_date)
+
+
+def _metacog_elements(dialect: str):
+    """Table-valued expansion of Conversation.metacog_elements, one row per element"""
+    column = Conversation.metacog_elements
+    if dialect == "postgresql":
+        # None is stored as JSON null, a scalar that json_array_elements_text rejects
+        array = case((func.json_typeof(column) == "array", column), else_=literal_column("'[]'::json"))
+        return func.json_array_elements_text(array).table_valued("value")
+    # json_each yields a single NULL value for JSON null
+    return func.json_each(column).table_valued("value")
+
+
+async def get_conversations_high_water_mark_async(db: AsyncSession) -> int:
+    """Largest conversation id (0 when empty); changes whenever a conversation is added"""
+    return await db.scalar(select(func.coalesce(func.max(Conversation.id), 0)))
+
+
+async def get_analytics_summary_async(
+    db: AsyncSession,
+    user_id: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+) -> Dict[str, Any]:
+    """
+    Depth distribution, metacognitive element frequency and average turns per CPS stage
+
+    Conversation aggregates count agent messages. Filters apply to the
+    session a row belongs to. Results are cached in-process under the
+    filters and the conversations high-water mark, so they are recomputed
+    only after new conversations are written (or after
+    ANALYTICS_CACHE_TTL_SECONDS, for metric-only changes).
+
+    Args:
+        db: Database session
+        user_id: Optional filter by user ID
+        start_date: Only sessions created at or after this time
+        end_date: Only sessions created before this time
+
+    Returns:
+        Summary dict; "high_water_mark" is the max conversation id it covers
+    """
+    high_water_mark = await get_conversations_high_water_mark_async(db)
+    key = query_cache_key(
+        "analytics_summary", user_id=user_id, start_date=start_date, end_date=end_date, high_water_mark=high_water_mark
+    )
+    if analytics_cache is not None:
+        cached = analytics_cache.get(key)
+        if cached is not None:
+            return cached
+
+    depth_rows = await db.execute(_agent_conversations(
+        select(Conversation.cps_stage, Conversation.response_depth, func.count()), user_id, start_date, end_date
+    ).group_by(Conversation.cps_stage, Conversation.response_depth))
+    depth_by_stage: Dict[str, Dict[str, int]] = {}
+    for stage, depth, count in depth_rows:
+        depth_by_stage.setdefault(stage, {})[depth] = count
+
+    elements = _metacog_elements(db.get_bind().dialect.name)
+    element_rows = await db.execute(_agent_conversations(
+        select(Conversation.cps_stage, elements.c.value, func.count()).select_from(Conversation).join(elements, true()),
+        user_id, start_date, end_date
+    ).where(elements.c.value.isnot(None)).group_by(Conversation.cps_stage, elements.c.value))
+    metacog_by_stage: Dict[str, Dict[str, int]] = {}
+    for stage, element, count in element_rows:
+        metacog_by_stage.setdefault(stage, {})[element] = count
+
+    metric_row = (await db.execute(_filtered(
+        select(
+            func.count(SessionMetric.id),
+            func.coalesce(func.sum(case((SessionMetric.completed, 1), else_=0)), 0),
+            *(func.avg(getattr(SessionMetric, column)) for column in TURN_COLUMNS.values())
+        ).join(Session, Session.id == SessionMetric.session_id),
+        user_id, start_date, end_date
+    ))).one()
+    sessions, completed, *turn_averages = metric_row
+
+    summary = {
+        "high_water_mark": high_water_mark,
+        "sessions": sessions,
+        "completed_sessions": completed,
+        "response_depth_by_stage": depth_by_stage,
+        "metacog_elements_by_stage": metacog_by_stage,
+        "avg_turns_by_stage": {
+            stage: round(float(average), 2) if average is not None else None
+            for stage, average in zip(TURN_COLUMNS, turn_averages)
+        },
+    }
+    if analytics_cache is not None:
+        analytics_cache.set(key, summary)
+    return summary
@@ -1,11 +1,14 @@
 """
 CRUD operations for Conversation model
 """
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session as SQLAlchemySession
-from typing import List, Optional
-from datetime import datetime
+from typing import Dict, List, Optional
 
-from ..models.database import Conversation, SessionMetric
+from ..models.database import Conversation
+from .counters import update_metric_counters
+from .session_state import write_through
 
 
 def create_conversation(
@@ -50,16 +53,13 @@ def create_conversation(
     db.add(conversation)
 
     # Update session metrics
-    _update_metrics_for_conversation(
-        db,
-        session_id,
-        role,
-        metacog_elements,
-        response_depth
+    counts = update_metric_counters(
+        db, session_id, conversation_metric_deltas(role, metacog_elements, response_depth)
     )
 
     db.commit()
     db.refresh(conversation)
+    write_through(session_id, counts.version, counters=counts.counters)
 
     return conversation
 
@@ -122,56 +122,118 @@ def get_latest_conversations(
     )
 
 
-def _update_metrics_for_conversation(
+async def get_latest_conversations_async(
+    db: AsyncSession,
+    session_id: str,
+    limit: int = 5
+) -> List[Conversation]:
+    """Async version of get_latest_conversations"""
+    result = await db.scalars(
+        select(Conversation)
+        .where(Conversation.session_id == session_id)
+        .order_by(Conversation.created_at.desc())
+        .limit(limit)
+    )
+    return list(result)
+
+
+def get_conversations_after(
     db: SQLAlchemySession,
     session_id: str,
+    after_id: int,
+    limit: int = 100,
+    until_id: Optional[int] = None
+) -> List[Conversation]:
+    """
+    Get conversations of a session created after a known conversation
+
+    Args:
+        db: Database session
+        session_id: Session ID
+        after_id: Only conversations with a greater id are returned
+        limit: Maximum number of records to return
+        until_id: If given, only conversations with an id up to this one are returned
+
+    Returns:
+        List of Conversation objects ordered by id
+    """
+    return list(db.scalars(_conversations_after_query(session_id, after_id, limit, until_id)))
+
+
+async def get_conversations_after_async(
+    db: AsyncSession,
+    session_id: str,
+    after_id: int,
+    limit: int = 100,
+    until_id: Optional[int] = None
+) -> List[Conversation]:
+    """Async version of get_conversations_after"""
+    return list(await db.scalars(_conversations_after_query(session_id, after_id, limit, until_id)))
+
+
+def _conversations_after_query(session_id: str, after_id: int, limit: int, until_id: Optional[int]):
+    query = select(Conversation).where(Conversation.session_id == session_id, Conversation.id > after_id)
+    if until_id is not None:
+        query = query.where(Conversation.id <= until_id)
+    return query.order_by(Conversation.id.asc()).limit(limit)
+
+
+def count_session_conversations(db: SQLAlchemySession, session_id: str) -> int:
+    """Count all conversation messages of a session"""
+    return db.query(func.count(Conversation.id)).filter(Conversation.session_id == session_id).scalar()
+
+
+async def count_session_conversations_async(db: AsyncSession, session_id: str) -> int:
+    """Async version of count_session_conversations"""
+    return await db.scalar(select(func.count(Conversation.id)).where(Conversation.session_id == session_id))
+
+
+# SessionMetric counters incremented per metacognitive element and response depth
+METACOG_COUNTERS = {
+    "점검": "monitoring_count",
+    "monitoring": "monitoring_count",
+    "조절": "control_count",
+    "control": "control_count",
+    "지식": "knowledge_count",
+    "knowledge": "knowledge_count",
+}
+DEPTH_COUNTERS = {
+    "shallow": "shallow_responses",
+    "medium": "medium_responses",
+    "deep": "deep_responses",
+}
+
+
+def conversation_metric_deltas(
     role: str,
     metacog_elements: Optional[List[str]],
     response_depth: Optional[str]
-):
+) -> Dict[str, int]:
     """
-    Update session metrics when a conversation is created
+    SessionMetric counter increments for one conversation message
 
     Args:
-        db: Database session
-        session_id: Session ID
         role: 'user' or 'agent'
         metacog_elements: List of metacognitive elements
         response_depth: Response depth assessment
-    """
-    metrics = db.query(SessionMetric).filter(
-        SessionMetric.session_id == session_id
-    ).first()
 
-    if not metrics:
-        # Create metrics if doesn't exist
-        metrics = SessionMetric(session_id=session_id)
-        db.add(metrics)
-
-    # Update message counts
-    metrics.total_messages += 1
+    Returns:
+        Mapping of counter column to increment
+    """
+    deltas = {"total_messages": 1}
     if role == "user":
-        metrics.user_messages += 1
+        deltas["user_messages"] = 1
     elif role == "agent":
-        metrics.agent_messages += 1
-
-    # Update metacognitive element counts
-    if metacog_elements:
-        for element in metacog_elements:
-            if element == "점검" or element == "monitoring":
-                metrics.monitoring_count += 1
-            elif element == "조절" or element == "control":
-                metrics.control_count += 1
-            elif element == "지식" or element == "knowledge":
-                metrics.knowledge_count += 1
-
-    # Update response depth counts
-    if response_depth:
-        if response_depth == "shallow":
-            metrics.shallow_responses += 1
-        elif response_depth == "medium":
-            metrics.medium_responses += 1
-        elif response_depth == "deep":
-            metrics.deep_responses += 1
-
-    metrics.updated_at = datetime.utcnow()
+        deltas["agent_messages"] = 1
+
+    for element in metacog_elements or []:
+        column = METACOG_COUNTERS.get(element)
+        if column:
+            deltas[column] = deltas.get(column, 0) + 1
+
+    column = DEPTH_COUNTERS.get(response_depth)
+    if column:
+        deltas[column] = deltas.get(column, 0) + 1
+
+    return deltas
+
@@ -0,0 +1,209 @@
+"""
+Atomic SessionMetric counter updates
+Counters are incremented in SQL (col = col + n) so concurrent turns from several workers or tabs never lose an update
+"""
+from sqlalchemy import DateTime, Float, Integer, cast, func, literal, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session as SQLAlchemySession
+from typing import Any, Dict, List, NamedTuple, Optional
+from datetime import datetime
+
+from ..models.database import SessionMetric
+from ..services.session_state_cache import COUNTER_COLUMNS, TURN_COLUMNS
+
+# Columns read back from every counter update
+_RETURNED_COLUMNS = (
+    ("state_version", "stages_completed")
+    + tuple(TURN_COLUMNS.values())
+    + COUNTER_COLUMNS
+)
+
+
+class CounterUpdate(NamedTuple):
+    """SessionMetric values right after a counter update, in the updating transaction"""
+    version: int
+    turns: Dict[str, int]  # By CPS stage
+    counters: Dict[str, int]
+    stages_completed: List[str]
+
+
+def update_metric_counters(
+    db: SQLAlchemySession,
+    session_id: str,
+    deltas: Dict[str, int],
+    values: Optional[Dict[str, Any]] = None,
+    expressions: Optional[Dict[str, Any]] = None
+) -> CounterUpdate:
+    """
+    Increment SessionMetric counters with a single UPDATE ... RETURNING
+
+    The session's state_version is bumped in the same statement. A missing
+    metric row is created with an INSERT ... ON CONFLICT upsert, so a row
+    created concurrently by another worker is updated instead. The row
+    stays locked until the caller commits.
+
+    Args:
+        db: Database session
+        session_id: Session ID
+        deltas: Increment per counter or turn column
+        values: Columns to set to a fixed value (e.g. current_stage)
+        expressions: Columns to set to SQL expressions over the current row
+            (e.g. from response_time_expressions); left unset when the row
+            is inserted
+
+    Returns:
+        CounterUpdate with the new values
+    """
+    statement, returned = _update_statement(session_id, deltas, values, expressions)
+    row = db.execute(statement, execution_options={"synchronize_session": False}).first()
+    if row is None:
+        upsert = _upsert_statement(db.get_bind().dialect.name, session_id, deltas, values, expressions)
+        row = db.execute(upsert.returning(*returned)).first()
+    return _counter_update(row)
+
+
+async def update_metric_counters_async(
+    db: AsyncSession,
+    session_id: str,
+    deltas: Dict[str, int],
+    values: Optional[Dict[str, Any]] = None,
+    expressions: Optional[Dict[str, Any]] = None
+) -> CounterUpdate:
+    """Async version of update_metric_counters"""
+    statement, returned = _update_statement(session_id, deltas, values, expressions)
+    row = (await db.execute(statement, execution_options={"synchronize_session": False})).first()
+    if row is None:
+        upsert = _upsert_statement(db.get_bind().dialect.name, session_id, deltas, values, expressions)
+        row = (await db.execute(upsert.returning(*returned))).first()
+    return _counter_update(row)
+
+
+def _update_statement(
+    session_id: str,
+    deltas: Dict[str, int],
+    values: Optional[Dict[str, Any]],
+    expressions: Optional[Dict[str, Any]] = None
+):
+    """UPDATE ... RETURNING of the counters, and the returned columns"""
+    returned = [getattr(SessionMetric, column) for column in _RETURNED_COLUMNS]
+    statement = (
+        update(SessionMetric)
+        .where(SessionMetric.session_id == session_id)
+        .values(
+            **{column: getattr(SessionMetric, column) + delta for column, delta in deltas.items() if delta},
+            **(values or {}),
+            **(expressions or {}),
+            state_version=SessionMetric.state_version + 1
+        )
+        .returning(*returned)
+    )
+    return statement, returned
+
+
+def _counter_update(row) -> CounterUpdate:
+    data = dict(zip(_RETURNED_COLUMNS, row))
+    return CounterUpdate(
+        version=data["state_version"],
+        turns={stage: data[column] for stage, column in TURN_COLUMNS.items()},
+        counters={column: data[column] for column in COUNTER_COLUMNS},
+        stages_completed=list(data["stages_completed"] or [])
+    )
+
+
+def _upsert_statement(
+    dialect: str,
+    session_id: str,
+    deltas: Dict[str, int],
+    values: Optional[Dict[str, Any]],
+    expressions: Optional[Dict[str, Any]] = None
+):
+    """
+    INSERT ... ON CONFLICT (session_id) DO UPDATE
+
+    Engines are only created for Postgres and SQLite (see
+    db.engine.SUPPORTED_BACKENDS), so a session bound elsewhere is a
+    configuration error.
+    """
+    values = values or {}
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise ValueError(f"Unsupported database backend {dialect!r} for counter upserts")
+
+    statement = insert(SessionMetric).values(session_id=session_id, state_version=1, **deltas, **values)
+    return statement.on_conflict_do_update(
+        index_elements=[SessionMetric.session_id],
+        set_={
+            **{column: getattr(SessionMetric, column) + statement.excluded[column] for column in deltas},
+            **values,
+            **(expressions or {}),
+            "state_version": SessionMetric.state_version + 1,
+            "updated_at": datetime.utcnow(),
+        }
+    )
+
+
+def response_time_expressions(dialect: str, deltas: Dict[str, int], now: datetime) -> Dict[str, Any]:
+    """
+    Running average response time and session duration, as SET expressions
+
+    Meant for the counter update that adds a reply's latency to
+    total_response_time_ms and 1 to timed_replies: SET expressions see the
+    row before the update, so the deltas are added here too.
+
+    Args:
+        dialect: Database dialect name
+        deltas: Counter deltas of the same update
+        now: Time of the reply
+
+    Returns:
+        Expressions for avg_response_time_seconds and session_duration_seconds
+    """
+    expressions = {"session_duration_seconds": _seconds_since(dialect, SessionMetric.created_at, now)}
+    replies = deltas.get("timed_replies", 0)
+    if replies:
+        response_ms = deltas.get("total_response_time_ms", 0)
+        expressions["avg_response_time_seconds"] = (
+            cast(SessionMetric.total_response_time_ms + response_ms, Float)
+            / (SessionMetric.timed_replies + replies) / 1000.0
+        )
+    return expressions
+
+
+def _seconds_since(dialect: str, column, now: datetime):
+    """Whole seconds from a timestamp column to now"""
+    now = literal(now, DateTime)
+    if dialect == "postgresql":
+        return cast(func.extract("epoch", now - column), Integer)
+    return cast((func.julianday(now) - func.julianday(column)) * 86400, Integer)
+
+
+def add_completed_stage(db: SQLAlchemySession, session_id: str, counter_update: CounterUpdate, stage: str) -> None:
+    """
+    Append a stage to stages_completed if it is not listed yet
+
+    Must follow update_metric_counters in the same transaction, whose row
+    lock keeps the returned list current.
+    """
+    if stage in counter_update.stages_completed:
+        return
+    db.execute(_completed_stage_statement(session_id, counter_update, stage), execution_options={"synchronize_session": False})
+
+
+async def add_completed_stage_async(db: AsyncSession, session_id: str, counter_update: CounterUpdate, stage: str) -> None:
+    """Async version of add_completed_stage"""
+    if stage in counter_update.stages_completed:
+        return
+    await db.execute(
+        _completed_stage_statement(session_id, counter_update, stage), execution_options={"synchronize_session": False}
+    )
+
+
+def _completed_stage_statement(session_id: str, counter_update: CounterUpdate, stage: str):
+    return (
+        update(SessionMetric)
+        .where(SessionMetric.session_id == session_id)
+        .values(stages_completed=counter_update.stages_completed + [stage])
+    )
@@ -0,0 +1,129 @@
+"""
+Column queries for research exports
+Rows are read as plain tuples of the exported columns, in chunks from a server-side cursor
+"""
+from sqlalchemy import select
+from sqlalchemy.orm import Session as SQLAlchemySession, selectinload
+from typing import Iterator, Optional, Sequence, Tuple
+from datetime import datetime
+
+from ..models.database import Conversation, Session, SessionMetric
+
+# (export column name, selected column)
+CONVERSATION_EXPORT_COLUMNS = (
+    ("conversation_id", Conversation.id),
+    ("session_id", Conversation.session_id),
+    ("user_id", Session.user_id),
+    ("role", Conversation.role),
+    ("message", Conversation.message),
+    ("cps_stage", Conversation.cps_stage),
+    ("metacog_elements", Conversation.metacog_elements),
+    ("response_depth", Conversation.response_depth),
+    ("should_transition", Conversation.should_transition),
+    ("reasoning", Conversation.reasoning),
+    ("llm_latency_ms", Conversation.llm_latency_ms),
+    ("db_latency_ms", Conversation.db_latency_ms),
+    ("total_latency_ms", Conversation.total_latency_ms),
+    ("created_at", Conversation.created_at),
+)
+
+METRIC_EXPORT_COLUMNS = (
+    ("session_id", SessionMetric.session_id),
+    ("user_id", Session.user_id),
+    ("total_messages", SessionMetric.total_messages),
+    ("user_messages", SessionMetric.user_messages),
+    ("agent_messages", SessionMetric.agent_messages),
+    ("shallow_responses", SessionMetric.shallow_responses),
+    ("medium_responses", SessionMetric.medium_responses),
+    ("deep_responses", SessionMetric.deep_responses),
+    ("stages_completed", SessionMetric.stages_completed),
+    ("total_stage_transitions", SessionMetric.total_stage_transitions),
+    ("monitoring_count", SessionMetric.monitoring_count),
+    ("control_count", SessionMetric.control_count),
+    ("knowledge_count", SessionMetric.knowledge_count),
+    ("session_duration_seconds", SessionMetric.session_duration_seconds),
+    ("avg_response_time_seconds", SessionMetric.avg_response_time_seconds),
+    ("completed", SessionMetric.completed),
+    ("created_at", SessionMetric.created_at),
+)
+
+
+def conversation_export_query(user_id: Optional[str] = None):
+    """Conversation columns joined with their session's user_id, in id order"""
+    query = (
+        select(*(column for _, column in CONVERSATION_EXPORT_COLUMNS))
+        .join(Session, Session.id == Conversation.session_id)
+        .order_by(Conversation.id)
+    )
+    if user_id:
+        query = query.where(Session.user_id == user_id)
+    return query
+
+
+def metric_export_query(user_id: Optional[str] = None):
+    """SessionMetric columns joined with their session's user_id, in id order"""
+    query = (
+        select(*(column for _, column in METRIC_EXPORT_COLUMNS))
+        .join(Session, Session.id == SessionMetric.session_id)
+        .order_by(SessionMetric.id)
+    )
+    if user_id:
+        query = query.where(Session.user_id == user_id)
+    return query
+
+
+def session_bundle_query(
+    user_id: Optional[str] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None
+):
+    """
+    Sessions with their conversations, stage transitions and metrics, oldest first
+
+    Children are loaded with selectinload: with yield_per, one IN query per
+    relationship and chunk of sessions, not per session.
+
+    Args:
+        user_id: Optional filter by user ID
+        start_date: Only sessions created at or after this time
+        end_date: Only sessions created before this time
+    """
+    query = (
+        select(Session)
+        .options(
+            selectinload(Session.conversations),
+            selectinload(Session.stage_transitions),
+            selectinload(Session.metrics)
+        )
+        .order_by(Session.created_at, Session.id)
+    )
+    if user_id:
+        query = query.where(Session.user_id == user_id)
+    if start_date:
+        query = query.where(Session.created_at >= start_date)
+    if end_date:
+        query = query.where(Session.created_at < end_date)
+    return query
+
+
+def iter_export_chunks(db: SQLAlchemySession, query, chunk_size: int = 1000) -> Iterator[Sequence[Tuple]]:
+    """
+    Execute an export query and yield its rows in chunks
+
+    yield_per streams the result (a named server-side cursor on PostgreSQL),
+    so at most one chunk of rows is held in memory.
+
+    Args:
+        db: Database session, kept open until the iterator is exhausted
+        query: Select of export columns
+        chunk_size: Rows fetched per round trip
+
+    Yields:
+        Lists of rows (one-element rows of an entity for an entity query)
+    """
+    result = db.execute(query.execution_options(yield_per=chunk_size))
+    try:
+        for partition in result.partitions():
+            yield partition
+    finally:
+        result.close()
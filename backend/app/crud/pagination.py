@@ -0,0 +1,216 @@
+"""
+Keyset pagination and cached totals for research listings
+A page continues after the last row of the previous one, so deep pages cost the same as the first
+"""
+from sqlalchemy import func, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+from datetime import datetime
+import base64
+import binascii
+import json
+
+from ..models.database import Conversation, Session, StageTransition
+from ..services.query_cache import count_cache, query_cache_key
+
+
+class InvalidCursorError(ValueError):
+    """Cursor token that was not issued by this API"""
+
+
+class Page(NamedTuple):
+    """Rows of one page and the cursor of the next, None on the last page"""
+    items: List[Any]
+    next_cursor: Optional[str]
+
+
+class Total(NamedTuple):
+    """Row count of a listing"""
+    value: int
+    estimated: bool  # From planner statistics rather than COUNT(*)
+
+
+def encode_cursor(values: Dict[str, Any]) -> str:
+    """Encode the sort key of a page's last row as an opaque URL-safe token"""
+    raw = json.dumps(values, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str, keys: Sequence[str]) -> Dict[str, Any]:
+    """
+    Decode a cursor token
+
+    Args:
+        cursor: Token from a previous page's next_cursor
+        keys: Sort key fields the token must contain
+
+    Returns:
+        Sort key values of the last row of the previous page
+
+    Raises:
+        InvalidCursorError: If the token is malformed or lacks a key
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise InvalidCursorError("Invalid cursor") from e
+
+    if not isinstance(values, dict) or any(key not in values for key in keys):
+        raise InvalidCursorError("Invalid cursor")
+    return values
+
+
+def _page(rows: List[Any], limit: int, cursor_values: Callable[[Any], Dict[str, Any]]) -> Page:
+    """Trim the extra row fetched to detect a next page"""
+    if len(rows) <= limit:
+        return Page(rows, None)
+    rows = rows[:limit]
+    return Page(rows, encode_cursor(cursor_values(rows[-1])))
+
+
+async def get_sessions_page_async(
+    db: AsyncSession,
+    user_id: Optional[str] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    skip: int = 0
+) -> Page:
+    """
+    Get a page of sessions, newest first, keyed on (created_at, id)
+
+    Args:
+        db: Database session
+        user_id: Optional filter by user ID
+        limit: Maximum number of sessions on the page
+        cursor: next_cursor of the previous page
+        skip: Offset of the first page (deprecated; ignored with a cursor)
+
+    Returns:
+        Page of Session objects
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed
+    """
+    query = select(Session)
+    if user_id:
+        query = query.where(Session.user_id == user_id)
+    if cursor:
+        values = decode_cursor(cursor, ("created_at", "id"))
+        try:
+            created_at = datetime.fromisoformat(values["created_at"])
+        except (TypeError, ValueError) as e:
+            raise InvalidCursorError("Invalid cursor") from e
+        if not isinstance(values["id"], str):
+            raise InvalidCursorError("Invalid cursor")
+        query = query.where(tuple_(Session.created_at, Session.id) < tuple_(created_at, values["id"]))
+    elif skip:
+        query = query.offset(skip)
+
+    rows = list(await db.scalars(query.order_by(Session.created_at.desc(), Session.id.desc()).limit(limit + 1)))
+    return _page(rows, limit, lambda s: {"created_at": s.created_at.isoformat(), "id": s.id})
+
+
+async def get_conversations_page_async(
+    db: AsyncSession,
+    session_id: str,
+    limit: int = 1000,
+    cursor: Optional[str] = None
+) -> Page:
+    """
+    Get a page of a session's conversations in creation order, keyed on id
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed
+    """
+    return await _id_page(db, Conversation, session_id, limit, cursor)
+
+
+async def get_transitions_page_async(
+    db: AsyncSession,
+    session_id: str,
+    limit: int = 1000,
+    cursor: Optional[str] = None
+) -> Page:
+    """
+    Get a page of a session's stage transitions in creation order, keyed on id
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed
+    """
+    return await _id_page(db, StageTransition, session_id, limit, cursor)
+
+
+async def _id_page(db: AsyncSession, model, session_id: str, limit: int, cursor: Optional[str]) -> Page:
+    query = select(model).where(model.session_id == session_id)
+    if cursor:
+        after_id = decode_cursor(cursor, ("id",))["id"]
+        if not isinstance(after_id, int):
+            raise InvalidCursorError("Invalid cursor")
+        query = query.where(model.id > after_id)
+
+    rows = list(await db.scalars(query.order_by(model.id.asc()).limit(limit + 1)))
+    return _page(rows, limit, lambda row: {"id": row.id})
+
+
+async def count_sessions_async(db: AsyncSession, user_id: Optional[str] = None, estimated: bool = False) -> Total:
+    """
+    Count sessions, optionally from planner statistics
+
+    The estimate is only available for the unfiltered PostgreSQL table
+    (pg_class.reltuples); otherwise an exact count is returned. Results are
+    cached for COUNT_CACHE_TTL_SECONDS.
+
+    Args:
+        db: Database session
+        user_id: Optional filter by user ID
+        estimated: Whether an estimate is acceptable
+
+    Returns:
+        Total
+    """
+    async def compute() -> Total:
+        if estimated and not user_id and db.get_bind().dialect.name == "postgresql":
+            reltuples = await db.scalar(
+                text("SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(:table)"),
+                {"table": Session.__tablename__}
+            )
+            if reltuples is not None and reltuples >= 0:  # -1 until the table is first analyzed
+                return Total(int(reltuples), True)
+
+        query = select(func.count()).select_from(Session)
+        if user_id:
+            query = query.where(Session.user_id == user_id)
+        return Total(await db.scalar(query), False)
+
+    return await _cached_total(query_cache_key("sessions", user_id=user_id, estimated=estimated), compute)
+
+
+async def count_conversations_async(db: AsyncSession, session_id: str) -> Total:
+    """Count a session's conversations; cached like count_sessions_async"""
+    async def compute() -> Total:
+        return Total(await db.scalar(select(func.count(Conversation.id)).where(Conversation.session_id == session_id)), False)
+
+    return await _cached_total(query_cache_key("conversations", session_id=session_id), compute)
+
+
+async def count_transitions_async(db: AsyncSession, session_id: str) -> Total:
+    """Count a session's stage transitions; cached like count_sessions_async"""
+    async def compute() -> Total:
+        return Total(
+            await db.scalar(select(func.count(StageTransition.id)).where(StageTransition.session_id == session_id)), False
+        )
+
+    return await _cached_total(query_cache_key("transitions", session_id=session_id), compute)
+
+
+async def _cached_total(key: str, compute) -> Total:
+    if count_cache is not None:
+        cached = count_cache.get(key)
+        if cached is not None:
+            return Total(cached["value"], cached["estimated"])
+
+    total = await compute()
+    if count_cache is not None:
+        count_cache.set(key, total._asdict())
+    return total
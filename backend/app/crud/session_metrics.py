@@ -7,6 +7,9 @@ from datetime import datetime
 import logging
 
 from ..models.database import SessionMetric
+from ..services.session_state_cache import TURN_COLUMNS
+from .counters import update_metric_counters
+from .session_state import get_session_state, write_through
 
 logger = logging.getLogger(__name__)
 
@@ -57,32 +60,21 @@ def update_turn_count(
     Returns:
         Tuple of (current_turns, max_turns, limit_reached)
     """
-    metric = get_or_create_session_metric(db, session_id)
-
-    # Map stage to column name
-    stage_column_map = {
-        "도전_이해": "challenge_understanding_turns",
-        "아이디어_생성": "idea_generation_turns",
-        "실행_준비": "action_preparation_turns",
-    }
-
-    column_name = stage_column_map.get(cps_stage)
+    column_name = TURN_COLUMNS.get(cps_stage)
 
     if not column_name:
         logger.warning(f"Unknown CPS stage: {cps_stage}, not counting turns")
         return 0, 0, False
 
-    # Increment turn count
-    current_value = getattr(metric, column_name)
-    new_value = current_value + 1
-    setattr(metric, column_name, new_value)
-
-    # Update current stage and timestamp
-    metric.current_stage = cps_stage
-    metric.last_updated = datetime.utcnow()
+    # Increment turn count and update current stage and timestamp
+    counts = update_metric_counters(
+        db, session_id, {column_name: 1},
+        values={"current_stage": cps_stage, "last_updated": datetime.utcnow()}
+    )
+    new_value = counts.turns[cps_stage]
 
     db.commit()
-    db.refresh(metric)
+    write_through(session_id, counts.version, turns=counts.turns, counters=counts.counters)
 
     # Check if limit reached
     max_turns = TURN_LIMITS.get(cps_stage, 999)
@@ -112,21 +104,21 @@ def get_turn_counts(db: Session, session_id: str) -> Dict[str, Dict[str, int]]:
             "실행_준비": {"current": 0, "max": 6}
         }
     """
-    metric = get_or_create_session_metric(db, session_id)
+    state = get_session_state(db, session_id)
+    if state is None:
+        metric = get_or_create_session_metric(db, session_id)
+        turns = {stage: getattr(metric, column) for stage, column in TURN_COLUMNS.items()}
+    else:
+        turns = state.turns
+
+    return format_turn_counts(turns)
 
+
+def format_turn_counts(turns: Dict[str, int]) -> Dict[str, Dict[str, int]]:
+    """Pair each stage's turn count with its limit, as returned by get_turn_counts"""
     return {
-        "도전_이해": {
-            "current": metric.challenge_understanding_turns,
-            "max": TURN_LIMITS["도전_이해"]
-        },
-        "아이디어_생성": {
-            "current": metric.idea_generation_turns,
-            "max": TURN_LIMITS["아이디어_생성"]
-        },
-        "실행_준비": {
-            "current": metric.action_preparation_turns,
-            "max": TURN_LIMITS["실행_준비"]
-        }
+        stage: {"current": turns[stage], "max": TURN_LIMITS[stage]}
+        for stage in TURN_COLUMNS
     }
 
 
@@ -139,20 +131,14 @@ def reset_stage_turns(db: Session, session_id: str, cps_stage: str) -> None:
         session_id: Session ID
         cps_stage: CPS stage to reset
     """
-    metric = get_or_create_session_metric(db, session_id)
-
-    stage_column_map = {
-        "도전_이해": "challenge_understanding_turns",
-        "아이디어_생성": "idea_generation_turns",
-        "실행_준비": "action_preparation_turns",
-    }
-
-    column_name = stage_column_map.get(cps_stage)
+    column_name = TURN_COLUMNS.get(cps_stage)
 
     if column_name:
-        setattr(metric, column_name, 0)
-        metric.last_updated = datetime.utcnow()
+        counts = update_metric_counters(
+            db, session_id, {}, values={column_name: 0, "last_updated": datetime.utcnow()}
+        )
         db.commit()
+        write_through(session_id, counts.version, turns=counts.turns, counters=counts.counters)
         logger.info(f"Reset turn count for session {session_id}, stage {cps_stage}")
 
 
@@ -168,20 +154,14 @@ def check_turn_limit(db: Session, session_id: str, cps_stage: str) -> Tuple[int,
     Returns:
         Tuple of (current_turns, max_turns, limit_reached)
     """
-    metric = get_or_create_session_metric(db, session_id)
-
-    stage_column_map = {
-        "도전_이해": "challenge_understanding_turns",
-        "아이디어_생성": "idea_generation_turns",
-        "실행_준비": "action_preparation_turns",
-    }
-
-    column_name = stage_column_map.get(cps_stage)
-
-    if not column_name:
+    if cps_stage not in TURN_COLUMNS:
         return 0, 0, False
 
-    current_turns = getattr(metric, column_name)
+    state = get_session_state(db, session_id)
+    if state is None:
+        current_turns = getattr(get_or_create_session_metric(db, session_id), TURN_COLUMNS[cps_stage])
+    else:
+        current_turns = state.turns[cps_stage]
     max_turns = TURN_LIMITS.get(cps_stage, 999)
     limit_reached = current_turns >= max_turns
 
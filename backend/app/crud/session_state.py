@@ -0,0 +1,162 @@
+"""
+Session hot state (current stage, turn counts, metric counters) backed by the session state cache
+"""
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session as SQLAlchemySession
+from typing import Dict, Optional
+
+from ..models.database import Session, SessionMetric, StageTransition
+from ..services.session_state_cache import COUNTER_COLUMNS, TURN_COLUMNS, SessionState, session_state_cache
+
+# Stage of a session that has no transitions yet
+DEFAULT_STAGE = "도전_이해_기회구성"
+
+
+def load_session_state(db: SQLAlchemySession, session_id: str) -> Optional[SessionState]:
+    """
+    Read a session's state from the database, bypassing the cache
+
+    Args:
+        db: Database session
+        session_id: Session ID
+
+    Returns:
+        SessionState, or None if the session does not exist
+    """
+    metric = db.query(SessionMetric).filter(SessionMetric.session_id == session_id).first()
+    if metric is None:
+        if db.query(Session.id).filter(Session.id == session_id).first() is None:
+            return None
+        metric = SessionMetric(session_id=session_id)
+        db.add(metric)
+        db.commit()
+
+    return _session_state(metric, db.execute(_latest_stage_query(session_id)).scalar())
+
+
+async def load_session_state_async(db: AsyncSession, session_id: str) -> Optional[SessionState]:
+    """Async version of load_session_state"""
+    metric = await db.scalar(select(SessionMetric).where(SessionMetric.session_id == session_id))
+    if metric is None:
+        if await db.scalar(select(Session.id).where(Session.id == session_id)) is None:
+            return None
+        metric = SessionMetric(session_id=session_id)
+        db.add(metric)
+        await db.commit()
+        await db.refresh(metric)
+
+    return _session_state(metric, await db.scalar(_latest_stage_query(session_id)))
+
+
+def _latest_stage_query(session_id: str):
+    return (
+        select(StageTransition.to_stage)
+        .where(StageTransition.session_id == session_id)
+        .order_by(StageTransition.created_at.desc())
+        .limit(1)
+    )
+
+
+def _session_state(metric: SessionMetric, latest_stage: Optional[str]) -> SessionState:
+    return SessionState(
+        metric.session_id,
+        metric.state_version,
+        latest_stage or DEFAULT_STAGE,
+        turns={stage: getattr(metric, column) for stage, column in TURN_COLUMNS.items()},
+        counters=metric_counters(metric)
+    )
+
+
+def get_session_state(db: SQLAlchemySession, session_id: str) -> Optional[SessionState]:
+    """
+    Get a session's current stage, turn counts and metric counters
+
+    With the cache enabled this costs one indexed lookup of the session's
+    state_version; the full state is only reloaded when the cached copy is
+    missing or older than the database.
+
+    Args:
+        db: Database session
+        session_id: Session ID
+
+    Returns:
+        SessionState, or None if the session does not exist
+    """
+    if session_state_cache is None:
+        return load_session_state(db, session_id)
+
+    version = db.query(SessionMetric.state_version).filter(SessionMetric.session_id == session_id).scalar()
+    if version is not None:
+        state = session_state_cache.get(session_id, version)
+        if state is not None:
+            return state
+
+    state = load_session_state(db, session_id)
+    if state is not None:
+        session_state_cache.put(state)
+    return state
+
+
+async def get_session_state_async(db: AsyncSession, session_id: str) -> Optional[SessionState]:
+    """Async version of get_session_state"""
+    if session_state_cache is None:
+        return await load_session_state_async(db, session_id)
+
+    version = await db.scalar(select(SessionMetric.state_version).where(SessionMetric.session_id == session_id))
+    if version is not None:
+        state = await session_state_cache.get_async(session_id, version)
+        if state is not None:
+            return state
+
+    state = await load_session_state_async(db, session_id)
+    if state is not None:
+        await session_state_cache.put_async(state)
+    return state
+
+
+def metric_counters(metric: SessionMetric) -> Dict[str, int]:
+    """Counter values of a SessionMetric row"""
+    return {column: getattr(metric, column) for column in COUNTER_COLUMNS}
+
+
+def cache_session_state(state: SessionState) -> None:
+    """Store the state of a session that was just created"""
+    if session_state_cache is not None:
+        session_state_cache.put(state)
+
+
+async def cache_session_state_async(state: SessionState) -> None:
+    """Async version of cache_session_state"""
+    if session_state_cache is not None:
+        await session_state_cache.put_async(state)
+
+
+def write_through(
+    session_id: str,
+    version: Optional[int],
+    stage: Optional[str] = None,
+    turns: Optional[Dict[str, int]] = None,
+    counters: Optional[Dict[str, int]] = None
+) -> None:
+    """Apply a committed change to the cached state (see SessionStateCache.update)"""
+    if session_state_cache is not None:
+        session_state_cache.update(session_id, version, stage=stage, turns=turns, counters=counters)
+
+
+async def write_through_async(
+    session_id: str,
+    version: Optional[int],
+    stage: Optional[str] = None,
+    turns: Optional[Dict[str, int]] = None,
+    counters: Optional[Dict[str, int]] = None
+) -> None:
+    """Async version of write_through"""
+    if session_state_cache is not None:
+        await session_state_cache.update_async(session_id, version, stage=stage, turns=turns, counters=counters)
+
+
+def invalidate_session_state(session_id: str) -> None:
+    """Drop a session's cached state"""
+    if session_state_cache is not None:
+        session_state_cache.invalidate(session_id)
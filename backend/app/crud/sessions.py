@@ -1,6 +1,7 @@
 """
 CRUD operations for Session model
 """
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session as SQLAlchemySession
 from typing import List, Optional
 from datetime import datetime
@@ -8,6 +9,8 @@ import uuid
 
 from ..models.database import Session, Conversation, StageTransition, SessionMetric
 from ..models.schemas import SessionCreate
+from ..services.session_state_cache import SessionState
+from .session_state import DEFAULT_STAGE, cache_session_state, cache_session_state_async, invalidate_session_state
 
 
 def create_session(db: SQLAlchemySession, session_data: SessionCreate) -> Session:
@@ -39,6 +42,29 @@ def create_session(db: SQLAlchemySession, session_data: SessionCreate) -> Sessio
     db.commit()
     db.refresh(db_session)
 
+    cache_session_state(SessionState(session_id, 0, DEFAULT_STAGE))
+
+    return db_session
+
+
+async def create_session_async(db: AsyncSession, session_data: SessionCreate) -> Session:
+    """Async version of create_session"""
+    session_id = str(uuid.uuid4())
+
+    db_session = Session(
+        id=session_id,
+        user_id=session_data.user_id,
+        assignment_text=session_data.assignment_text,
+        is_active=True
+    )
+    db.add(db_session)
+    db.add(SessionMetric(session_id=session_id))
+
+    # Column defaults are set on flush and the session does not expire on commit, so no refresh is needed
+    await db.commit()
+
+    await cache_session_state_async(SessionState(session_id, 0, DEFAULT_STAGE))
+
     return db_session
 
 
@@ -56,6 +82,11 @@ def get_session(db: SQLAlchemySession, session_id: str) -> Optional[Session]:
     return db.query(Session).filter(Session.id == session_id).first()
 
 
+async def get_session_async(db: AsyncSession, session_id: str) -> Optional[Session]:
+    """Async version of get_session"""
+    return await db.get(Session, session_id)
+
+
 def get_user_sessions(
     db: SQLAlchemySession,
     user_id: str,
@@ -140,5 +171,6 @@ def delete_session(db: SQLAlchemySession, session_id: str) -> bool:
 
     db.delete(db_session)
     db.commit()
+    invalidate_session_state(session_id)
 
     return True
@@ -4,7 +4,10 @@ CRUD operations for StageTransition model
 from sqlalchemy.orm import Session as SQLAlchemySession
 from typing import List, Optional
 
-from ..models.database import StageTransition, SessionMetric
+from ..models.database import StageTransition
+from ..services.metrics import count_stage_transition
+from .counters import add_completed_stage, update_metric_counters
+from .session_state import DEFAULT_STAGE, write_through
 
 
 def create_stage_transition(
@@ -40,10 +43,13 @@ def create_stage_transition(
     db.add(transition)
 
     # Update session metrics
-    _update_metrics_for_transition(db, session_id, to_stage)
+    counts = update_metric_counters(db, session_id, {"total_stage_transitions": 1})
+    add_completed_stage(db, session_id, counts, to_stage)
 
     db.commit()
     db.refresh(transition)
+    write_through(session_id, counts.version, stage=to_stage, counters=counts.counters)
+    count_stage_transition(from_stage, to_stage)
 
     return transition
 
@@ -88,36 +94,4 @@ def get_latest_stage(db: SQLAlchemySession, session_id: str) -> str:
         .first()
     )
 
-    return transition.to_stage if transition else "도전_이해_기회구성"
-
-
-def _update_metrics_for_transition(
-    db: SQLAlchemySession,
-    session_id: str,
-    new_stage: str
-):
-    """
-    Update session metrics when a stage transition occurs
-
-    Args:
-        db: Database session
-        session_id: Session ID
-        new_stage: New CPS stage
-    """
-    metrics = db.query(SessionMetric).filter(
-        SessionMetric.session_id == session_id
-    ).first()
-
-    if not metrics:
-        metrics = SessionMetric(session_id=session_id)
-        db.add(metrics)
-
-    # Update stages completed
-    if metrics.stages_completed is None:
-        metrics.stages_completed = []
-
-    if new_stage not in metrics.stages_completed:
-        metrics.stages_completed = metrics.stages_completed + [new_stage]
-
-    # Increment transition count
-    metrics.total_stage_transitions += 1
+    return transition.to_stage if transition else DEFAULT_STAGE
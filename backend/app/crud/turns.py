@@ -0,0 +1,379 @@
+"""
+Unit-of-work persistence of a complete chat turn
+"""
+from sqlalchemy import JSON, bindparam, insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session as SQLAlchemySession
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+from datetime import datetime
+import logging
+import time
+
+from ..models.database import Conversation, StageTransition
+from ..services.metrics import count_stage_transition
+from ..services.session_state_cache import TURN_COLUMNS
+from .conversations import conversation_metric_deltas
+from .counters import (
+    CounterUpdate,
+    add_completed_stage,
+    add_completed_stage_async,
+    response_time_expressions,
+    update_metric_counters,
+    update_metric_counters_async
+)
+from .session_metrics import TURN_LIMITS, format_turn_counts
+from .session_state import write_through, write_through_async
+
+logger = logging.getLogger(__name__)
+
+_CONVERSATION_COLUMNS = (
+    "session_id", "role", "message", "cps_stage", "metacog_elements",
+    "response_depth", "should_transition", "reasoning",
+    "llm_latency_ms", "db_latency_ms", "total_latency_ms", "created_at"
+)
+
+# Plain executemany INSERT; learner rows store SQL NULL (not JSON null) in metacog_elements, as the ORM does
+_INSERT_CONVERSATIONS = insert(Conversation.__table__).values(
+    metacog_elements=bindparam("metacog_elements", type_=JSON(none_as_null=True))
+)
+
+
+class TurnLatency(NamedTuple):
+    """Handler timings of a turn up to the reply, in milliseconds; persist_turn adds part of the turn's write"""
+    llm_ms: int  # Gemini call
+    db_ms: int  # Database reads before the reply
+    total_ms: int  # Request received to reply ready
+
+
+class TurnRows(NamedTuple):
+    """Column values of the rows a turn adds"""
+    session_id: str
+    conversations: List[Dict]  # Learner message, then agent message
+    transition: Optional[Dict]
+
+
+class PersistedTurn(NamedTuple):
+    """Values of a saved turn, captured before commit"""
+    user_conversation_id: Optional[int]  # None when the rows were deferred
+    agent_conversation_id: Optional[int]
+    turn_counts: Dict[str, Dict[str, int]]
+    current_turns: int
+    max_turns: int
+
+
+def persist_turn(
+    db: SQLAlchemySession,
+    session_id: str,
+    user_message: str,
+    agent_message: str,
+    cps_stage: str,
+    previous_stage: Optional[str],
+    metacog_elements: Optional[List[str]] = None,
+    response_depth: Optional[str] = None,
+    should_transition: Optional[bool] = None,
+    reasoning: Optional[str] = None,
+    record_transition: bool = False,
+    message_count: int = 0,
+    defer_rows: Optional[Callable[[TurnRows], None]] = None,
+    latency: Optional[TurnLatency] = None
+) -> PersistedTurn:
+    """
+    Save a learner message and the agent's reply in one transaction
+
+    The two messages, the stage transition (if any) and every SessionMetric
+    change are written with a single flush and commit. Values the caller
+    needs are read before committing, so no object is refreshed afterwards.
+
+    Args:
+        db: Database session
+        session_id: Session ID
+        user_message: Learner message
+        agent_message: Agent's scaffolding message
+        cps_stage: CPS stage of the agent's reply; its turn count is incremented
+        previous_stage: Stage before this turn
+        metacog_elements: Metacognitive elements of the reply
+        response_depth: Assessed depth of the learner message
+        should_transition: Whether the agent suggested a transition
+        reasoning: Agent's reasoning, also used as the transition reason
+        record_transition: Whether to record a transition previous_stage -> cps_stage
+        message_count: Number of messages in the previous stage, for the transition
+        defer_rows: If given, the conversation and transition rows are passed
+            to it after the commit instead of being inserted (write-behind);
+            only the metric counters are written here
+        latency: Timings stored on the agent message; total_ms also updates
+            the session's average response time and duration. The learner
+            message and transition are inserted first and their write time
+            is added to db_ms and total_ms; the agent message insert, counter
+            update and commit that record it are not included
+
+    Returns:
+        PersistedTurn with the new message ids and turn counts
+    """
+    write_started = time.perf_counter()
+    now = datetime.utcnow()
+    rows = _turn_rows(
+        session_id, user_message, agent_message, cps_stage, previous_stage, metacog_elements,
+        response_depth, should_transition, reasoning, record_transition, message_count, latency, now
+    )
+    user_conversation = agent_conversation = None
+    if defer_rows is None:
+        user_conversation = _add_learner_rows(db, rows)
+        db.flush()
+    latency = _add_write_time(rows, latency, write_started)
+    if defer_rows is None:
+        agent_conversation = _add_agent_row(db, rows)
+    deltas, values, expressions = _turn_counter_changes(
+        db.get_bind().dialect.name, cps_stage, metacog_elements, response_depth, record_transition, latency, now
+    )
+
+    counts = update_metric_counters(db, session_id, deltas, values=values, expressions=expressions)
+    if record_transition:
+        add_completed_stage(db, session_id, counts, cps_stage)
+
+    db.flush()
+    result = _persisted_turn(user_conversation, agent_conversation, counts, cps_stage)
+    db.commit()
+
+    _after_commit(rows, counts, cps_stage, previous_stage, record_transition)
+    if defer_rows is not None:
+        defer_rows(rows)
+
+    return result
+
+
+async def persist_turn_async(
+    db: AsyncSession,
+    session_id: str,
+    user_message: str,
+    agent_message: str,
+    cps_stage: str,
+    previous_stage: Optional[str],
+    metacog_elements: Optional[List[str]] = None,
+    response_depth: Optional[str] = None,
+    should_transition: Optional[bool] = None,
+    reasoning: Optional[str] = None,
+    record_transition: bool = False,
+    message_count: int = 0,
+    defer_rows: Optional[Callable[[TurnRows], Awaitable[None]]] = None,
+    latency: Optional[TurnLatency] = None
+) -> PersistedTurn:
+    """Async version of persist_turn; defer_rows is awaited"""
+    write_started = time.perf_counter()
+    now = datetime.utcnow()
+    rows = _turn_rows(
+        session_id, user_message, agent_message, cps_stage, previous_stage, metacog_elements,
+        response_depth, should_transition, reasoning, record_transition, message_count, latency, now
+    )
+    user_conversation = agent_conversation = None
+    if defer_rows is None:
+        user_conversation = _add_learner_rows(db, rows)
+        await db.flush()
+    latency = _add_write_time(rows, latency, write_started)
+    if defer_rows is None:
+        agent_conversation = _add_agent_row(db, rows)
+    deltas, values, expressions = _turn_counter_changes(
+        db.get_bind().dialect.name, cps_stage, metacog_elements, response_depth, record_transition, latency, now
+    )
+
+    counts = await update_metric_counters_async(db, session_id, deltas, values=values, expressions=expressions)
+    if record_transition:
+        await add_completed_stage_async(db, session_id, counts, cps_stage)
+
+    await db.flush()
+    result = _persisted_turn(user_conversation, agent_conversation, counts, cps_stage)
+    await db.commit()
+
+    await _after_commit_async(rows, counts, cps_stage, previous_stage, record_transition)
+    if defer_rows is not None:
+        await defer_rows(rows)
+
+    return result
+
+
+def _turn_rows(
+    session_id: str,
+    user_message: str,
+    agent_message: str,
+    cps_stage: str,
+    previous_stage: Optional[str],
+    metacog_elements: Optional[List[str]],
+    response_depth: Optional[str],
+    should_transition: Optional[bool],
+    reasoning: Optional[str],
+    record_transition: bool,
+    message_count: int,
+    latency: Optional[TurnLatency],
+    now: datetime
+) -> TurnRows:
+    """Column values of the rows a turn adds"""
+    return TurnRows(
+        session_id=session_id,
+        conversations=[
+            {"session_id": session_id, "role": "user", "message": user_message, "created_at": now},
+            {
+                "session_id": session_id,
+                "role": "agent",
+                "message": agent_message,
+                "cps_stage": cps_stage,
+                "metacog_elements": metacog_elements,
+                "response_depth": response_depth,
+                "should_transition": should_transition,
+                "reasoning": reasoning,
+                **({
+                    "llm_latency_ms": latency.llm_ms,
+                    "db_latency_ms": latency.db_ms,
+                    "total_latency_ms": latency.total_ms,
+                } if latency else {}),
+                "created_at": now,
+            },
+        ],
+        transition={
+            "session_id": session_id,
+            "from_stage": previous_stage,
+            "to_stage": cps_stage,
+            "transition_reason": reasoning,
+            "message_count": message_count,
+            "created_at": now,
+        } if record_transition else None
+    )
+
+
+def _add_learner_rows(db, rows: TurnRows) -> Conversation:
+    """Add a turn's learner message and transition to the session; returns the learner Conversation"""
+    conversation = Conversation(**rows.conversations[0])
+    db.add(conversation)
+    if rows.transition:
+        db.add(StageTransition(**rows.transition))
+    return conversation
+
+
+def _add_agent_row(db, rows: TurnRows) -> Conversation:
+    """Add a turn's agent message to the session"""
+    conversation = Conversation(**rows.conversations[1])
+    db.add(conversation)
+    return conversation
+
+
+def _turn_counter_changes(
+    dialect: str,
+    cps_stage: str,
+    metacog_elements: Optional[List[str]],
+    response_depth: Optional[str],
+    record_transition: bool,
+    latency: Optional[TurnLatency],
+    now: datetime
+) -> Tuple[Dict[str, int], Dict[str, Any], Optional[Dict[str, Any]]]:
+    """Counter deltas, fixed values and SET expressions of a turn's SessionMetric update"""
+    deltas = conversation_metric_deltas("user", None, None)
+    for column, delta in conversation_metric_deltas("agent", metacog_elements, response_depth).items():
+        deltas[column] = deltas.get(column, 0) + delta
+    values = {}
+
+    turn_column = TURN_COLUMNS.get(cps_stage)
+    if turn_column:
+        deltas[turn_column] = 1
+        values = {"current_stage": cps_stage, "last_updated": now}
+    else:
+        logger.warning(f"Unknown CPS stage: {cps_stage}, not counting turns")
+
+    if record_transition:
+        deltas["total_stage_transitions"] = 1
+
+    expressions = None
+    if latency:
+        deltas["timed_replies"] = 1
+        deltas["total_response_time_ms"] = latency.total_ms
+        expressions = response_time_expressions(dialect, deltas, now)
+
+    return deltas, values, expressions
+
+
+def _persisted_turn(
+    user_conversation: Optional[Conversation],
+    agent_conversation: Optional[Conversation],
+    counts: CounterUpdate,
+    cps_stage: str
+) -> PersistedTurn:
+    """Result of a flushed turn"""
+    turn_column = TURN_COLUMNS.get(cps_stage)
+    return PersistedTurn(
+        user_conversation_id=user_conversation.id if user_conversation else None,
+        agent_conversation_id=agent_conversation.id if agent_conversation else None,
+        turn_counts=format_turn_counts(counts.turns),
+        current_turns=counts.turns[cps_stage] if turn_column else 0,
+        max_turns=TURN_LIMITS.get(cps_stage, 999) if turn_column else 0
+    )
+
+
+def _add_write_time(rows: TurnRows, latency: Optional[TurnLatency], write_started: float) -> Optional[TurnLatency]:
+    """
+    Add the time since write_started to the db and total latency of the turn and its agent message values
+
+    Returns:
+        The updated latency, or None without one
+    """
+    if latency is None:
+        return None
+    write_ms = round((time.perf_counter() - write_started) * 1000)
+    latency = latency._replace(db_ms=latency.db_ms + write_ms, total_ms=latency.total_ms + write_ms)
+    rows.conversations[1].update(db_latency_ms=latency.db_ms, total_latency_ms=latency.total_ms)
+    return latency
+
+
+def _after_commit(
+    rows: TurnRows,
+    counts: CounterUpdate,
+    cps_stage: str,
+    previous_stage: Optional[str],
+    record_transition: bool
+) -> None:
+    """Apply a committed turn to the session state cache and metrics"""
+    write_through(
+        rows.session_id,
+        counts.version,
+        stage=cps_stage if record_transition else None,
+        turns=counts.turns,
+        counters=counts.counters
+    )
+    if record_transition:
+        count_stage_transition(previous_stage, cps_stage)
+
+
+async def _after_commit_async(
+    rows: TurnRows,
+    counts: CounterUpdate,
+    cps_stage: str,
+    previous_stage: Optional[str],
+    record_transition: bool
+) -> None:
+    """Async version of _after_commit"""
+    await write_through_async(
+        rows.session_id,
+        counts.version,
+        stage=cps_stage if record_transition else None,
+        turns=counts.turns,
+        counters=counts.counters
+    )
+    if record_transition:
+        count_stage_transition(previous_stage, cps_stage)
+
+
+def insert_turn_rows(db: SQLAlchemySession, batch: List[TurnRows]) -> int:
+    """
+    Insert the deferred rows of several turns with one executemany per table
+
+    The caller commits.
+
+    Returns:
+        Number of rows inserted
+    """
+    conversations = [
+        {column: values.get(column) for column in _CONVERSATION_COLUMNS}
+        for rows in batch for values in rows.conversations
+    ]
+    transitions = [rows.transition for rows in batch if rows.transition]
+    if conversations:
+        db.execute(_INSERT_CONVERSATIONS, conversations)
+    if transitions:
+        db.execute(insert(StageTransition.__table__), transitions)
+    return len(conversations) + len(transitions)
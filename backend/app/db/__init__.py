@@ -1,4 +1,8 @@
 """Database package"""
-from .session import get_db, get_db_context, init_db, SessionLocal, engine
+from .session import get_db, get_db_context, get_session_factory, init_db, SessionLocal, engine
+from .async_session import get_async_db, get_async_session_factory, AsyncSessionLocal, async_engine
 
-__all__ = ["get_db", "get_db_context", "init_db", "SessionLocal", "engine"]
+__all__ = [
+    "get_db", "get_db_context", "get_session_factory", "init_db", "SessionLocal", "engine",
+    "get_async_db", "get_async_session_factory", "AsyncSessionLocal", "async_engine",
+]
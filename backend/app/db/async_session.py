@@ -0,0 +1,71 @@
+"""
+Async database session management
+Uses the same DATABASE_URL as the sync engine, with its async driver (asyncpg, aiosqlite)
+"""
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from typing import AsyncGenerator, Callable
+
+from ..core.config import settings
+from .engine import create_async_db_engine
+
+# Sync driver prefixes and their async counterparts
+ASYNC_DRIVERS = {
+    "postgresql+psycopg2://": "postgresql+asyncpg://",
+    "postgresql://": "postgresql+asyncpg://",
+    "postgres://": "postgresql+asyncpg://",
+    "sqlite+pysqlite://": "sqlite+aiosqlite://",
+    "sqlite://": "sqlite+aiosqlite://",
+}
+
+
+def to_async_url(url: str) -> str:
+    """
+    Rewrite a database URL to use its async driver
+
+    URLs that already name an async driver are returned unchanged.
+
+    Args:
+        url: Database URL
+
+    Returns:
+        Database URL for create_async_engine
+    """
+    for prefix, async_prefix in ASYNC_DRIVERS.items():
+        if url.startswith(prefix):
+            return async_prefix + url[len(prefix):]
+    return url
+
+
+ASYNC_DATABASE_URL = to_async_url(settings.DATABASE_URL)
+
+async_engine = create_async_db_engine(ASYNC_DATABASE_URL)
+
+# Objects stay usable after commit without a lazy refresh, which async sessions cannot do implicitly
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency for FastAPI endpoints to get an async database session
+
+    Usage:
+        @app.get("/endpoint")
+        async def endpoint(db: AsyncSession = Depends(get_async_db)):
+            result = await db.execute(...)
+
+    Yields:
+        AsyncSession instance
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_async_session_factory() -> Callable[[], AsyncSession]:
+    """
+    Dependency for async endpoints that open sessions themselves
+
+    Streaming responses are generated after get_async_db's session is
+    closed, so their generators create (and close) their own session from
+    this factory.
+    """
+    return AsyncSessionLocal
@@ -0,0 +1,246 @@
+"""
+Engine profiles per database backend
+Pool settings, connection arguments and SQLite pragmas are selected from the URL scheme
+"""
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool, StaticPool
+from typing import Any, Dict, Optional
+import logging
+import threading
+import time
+
+from ..core.config import Settings, settings
+from ..services.metrics import observe_pool_checkout, track_checked_out
+
+logger = logging.getLogger(__name__)
+
+# Counter upserts, analytics JSON expansion and session durations are written for these backends only
+SUPPORTED_BACKENDS = ("postgresql", "sqlite")
+
+
+class PoolStats:
+    """
+    Checkout counters and wait times of a connection pool
+
+    Wait time is measured around the pool's own checkout, so it includes
+    time spent waiting for a free connection and opening a new one. Waits
+    and checked-out connections are also reported to Prometheus under the
+    engine's name.
+    """
+
+    def __init__(self, name: str = "sync"):
+        self.name = name
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.pool: Optional[Pool] = None
+
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        with self._lock:
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+            if timed_out:
+                self.timeouts += 1
+        observe_pool_checkout(self.name, seconds, timed_out)
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def listen(self, engine: Engine) -> None:
+        """Count the engine's pool events; they are kept when the pool is recreated"""
+        self.pool = engine.pool
+        event.listen(engine, "checkout", self._on_checkout)
+        event.listen(engine, "checkin", self._on_checkin)
+        event.listen(engine, "connect", lambda *args: self._count("connects"))
+        event.listen(engine, "invalidate", lambda *args: self._count("invalidations"))
+        event.listen(engine, "engine_disposed", self._track_pool)
+
+    def _on_checkout(self, *args) -> None:
+        self._count("checkouts")
+        track_checked_out(self.name, 1)
+
+    def _on_checkin(self, *args) -> None:
+        self._count("checkins")
+        track_checked_out(self.name, -1)
+
+    def _track_pool(self, engine: Engine) -> None:
+        self.pool = engine.pool
+
+    def stats(self) -> Dict[str, Any]:
+        """Pool occupancy and checkout counters for monitoring"""
+        pool = self.pool
+        with self._lock:
+            result = {
+                "pool_class": type(pool).__name__ if pool is not None else None,
+                "checkouts": self.checkouts,
+                "checkins": self.checkins,
+                "connects": self.connects,
+                "invalidations": self.invalidations,
+                "timeouts": self.timeouts,
+                "wait_ms_avg": round(self.wait_seconds_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_ms_max": round(self.wait_seconds_max * 1000, 3),
+            }
+        if isinstance(pool, QueuePool):
+            result.update({
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": pool.overflow(),
+                "max_overflow": pool._max_overflow,
+            })
+        return result
+
+
+def timed_pool_class(base: type, pool_stats: PoolStats) -> type:
+    """
+    Subclass of a queue pool that records checkout wait times
+
+    The subclass carries the stats object, so pools recreated by
+    engine.dispose() keep reporting to it.
+    """
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = base._do_get(self)
+        except Exception as e:
+            pool_stats.record_wait(time.perf_counter() - started, timed_out=isinstance(e, PoolTimeoutError))
+            raise
+        pool_stats.record_wait(time.perf_counter() - started)
+        return connection
+
+    return type(f"Timed{base.__name__}", (base,), {"_do_get": _do_get})
+
+
+def is_sqlite_memory(url: str) -> bool:
+    """Whether a SQLite URL names an in-memory database"""
+    parsed = make_url(url)
+    return parsed.database in (None, "", ":memory:") or parsed.query.get("mode") == "memory"
+
+
+def engine_options(url: str, pool_stats: PoolStats, config: Settings = settings) -> Dict[str, Any]:
+    """
+    create_engine / create_async_engine arguments for a database URL
+
+    Postgres uses a queue pool sized by DB_POOL_* with statement_timeout and
+    application_name set per connection. File-based SQLite uses a queue pool
+    whose connections can move between threads; in-memory SQLite a single
+    static connection.
+
+    Args:
+        url: Database URL, with a sync or async driver
+        pool_stats: Receives checkout wait times
+        config: Settings providing the DB_* and SQLITE_* values
+
+    Returns:
+        Keyword arguments for the engine
+
+    Raises:
+        ValueError: If the URL names a backend other than Postgres or SQLite
+    """
+    parsed = make_url(url)
+    if parsed.get_backend_name() not in SUPPORTED_BACKENDS:
+        raise ValueError(
+            f"Unsupported database backend {parsed.get_backend_name()!r}; "
+            f"DATABASE_URL must use one of: {', '.join(SUPPORTED_BACKENDS)}"
+        )
+    is_async = parsed.get_dialect().is_async
+    queue_pool = AsyncAdaptedQueuePool if is_async else QueuePool
+    options: Dict[str, Any] = {"echo": config.DB_ECHO}
+
+    if parsed.get_backend_name() == "postgresql":
+        if is_async:
+            server_settings = {"application_name": config.DB_APPLICATION_NAME}
+            if config.DB_STATEMENT_TIMEOUT_MS > 0:
+                server_settings["statement_timeout"] = str(config.DB_STATEMENT_TIMEOUT_MS)
+            connect_args = {"timeout": config.DB_CONNECT_TIMEOUT_SECONDS, "server_settings": server_settings}
+        else:
+            connect_args = {
+                "connect_timeout": config.DB_CONNECT_TIMEOUT_SECONDS,
+                "application_name": config.DB_APPLICATION_NAME,
+            }
+            if config.DB_STATEMENT_TIMEOUT_MS > 0:
+                connect_args["options"] = f"-c statement_timeout={config.DB_STATEMENT_TIMEOUT_MS}"
+        options.update(
+            poolclass=timed_pool_class(queue_pool, pool_stats),
+            pool_size=config.DB_POOL_SIZE,
+            max_overflow=config.DB_MAX_OVERFLOW,
+            pool_timeout=config.DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=config.DB_POOL_RECYCLE_SECONDS,
+            pool_pre_ping=True,
+            connect_args=connect_args
+        )
+    else:
+        options["connect_args"] = {"check_same_thread": False}
+        if is_sqlite_memory(url):
+            options["poolclass"] = StaticPool
+        else:
+            options.update(
+                poolclass=timed_pool_class(queue_pool, pool_stats),
+                pool_size=config.DB_POOL_SIZE,
+                max_overflow=config.DB_MAX_OVERFLOW,
+                pool_timeout=config.DB_POOL_TIMEOUT_SECONDS
+            )
+
+    return options
+
+
+def set_sqlite_pragmas(engine: Engine, url: str, config: Settings = settings) -> None:
+    """Apply SQLITE_JOURNAL_MODE, SQLITE_BUSY_TIMEOUT_MS and SQLITE_SYNCHRONOUS to every new connection"""
+    # WAL needs a database file; in-memory databases keep their own journal
+    journal_mode = None if is_sqlite_memory(url) else config.SQLITE_JOURNAL_MODE
+    pragmas = [
+        f"PRAGMA busy_timeout = {int(config.SQLITE_BUSY_TIMEOUT_MS)}",
+        f"PRAGMA synchronous = {config.SQLITE_SYNCHRONOUS}",
+    ]
+    if journal_mode:
+        pragmas.insert(0, f"PRAGMA journal_mode = {journal_mode}")
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def create_db_engine(url: str, config: Settings = settings) -> Engine:
+    """
+    Create a sync engine with the profile of its database backend
+
+    Pool statistics are available as engine.pool_stats.
+    """
+    pool_stats = PoolStats("sync")
+    engine = create_engine(url, **engine_options(url, pool_stats, config))
+    _configure(engine, url, pool_stats, config)
+    return engine
+
+
+def create_async_db_engine(url: str, config: Settings = settings) -> AsyncEngine:
+    """
+    Create an async engine with the profile of its database backend
+
+    Pool statistics are available as engine.sync_engine.pool_stats.
+    """
+    pool_stats = PoolStats("async")
+    engine = create_async_engine(url, **engine_options(url, pool_stats, config))
+    _configure(engine.sync_engine, url, pool_stats, config)
+    return engine
+
+
+def _configure(engine: Engine, url: str, pool_stats: PoolStats, config: Settings) -> None:
+    if engine.dialect.name == "sqlite":
+        set_sqlite_pragmas(engine, url, config)
+    pool_stats.listen(engine)
+    engine.pool_stats = pool_stats
+    logger.info(f"Database engine: {engine.dialect.name}+{engine.driver}, pool {type(engine.pool).__name__}")
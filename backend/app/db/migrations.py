@@ -33,6 +33,7 @@ def migrate_add_turn_tracking_columns(db_path: Optional[Path] = None):
     - action_preparation_turns (실행_준비 max: 6)
     - current_stage
     - last_updated
+    - state_version
     """
     if db_path is None:
         db_path = get_db_path()
@@ -90,6 +91,14 @@ def migrate_add_turn_tracking_columns(db_path: Optional[Path] = None):
                 ADD COLUMN last_updated DATETIME DEFAULT '{default_time}' NOT NULL
             """)
 
+        # Check and add state_version
+        if not column_exists(cursor, 'session_metrics', 'state_version'):
+            logger.info("Adding column: state_version")
+            cursor.execute("""
+                ALTER TABLE session_metrics
+                ADD COLUMN state_version INTEGER DEFAULT 0 NOT NULL
+            """)
+
         conn.commit()
         logger.info("Migration completed successfully")
 
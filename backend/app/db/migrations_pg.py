@@ -1,8 +1,10 @@
 """
 PostgreSQL-compatible database migrations
-Adds turn tracking columns to session_metrics table for CPS stage management
+Adds turn tracking columns to session_metrics table for CPS stage management,
+turn latency columns, and composite indexes for ordered per-session and per-user reads
 """
 import logging
+import time
 from sqlalchemy import text, inspect
 from sqlalchemy.orm import Session
 from typing import Set
@@ -40,6 +42,7 @@ def migrate_add_turn_tracking_columns_pg(session: Session):
     - action_preparation_turns (실행_준비 max: 6)
     - current_stage (current CPS stage)
     - last_updated (timestamp of last update)
+    - state_version (version of the session's cached hot state)
 
     Uses SQLAlchemy inspector for PostgreSQL compatibility
     """
@@ -59,7 +62,8 @@ def migrate_add_turn_tracking_columns_pg(session: Session):
             'idea_generation_turns': 'INTEGER DEFAULT 0 NOT NULL',
             'action_preparation_turns': 'INTEGER DEFAULT 0 NOT NULL',
             'current_stage': 'VARCHAR(50)',
-            'last_updated': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL'
+            'last_updated': 'TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL',
+            'state_version': 'INTEGER DEFAULT 0 NOT NULL'
         }
 
         # Add missing columns
@@ -93,6 +97,157 @@ def migrate_add_turn_tracking_columns_pg(session: Session):
         raise
 
 
+# (index name, table, columns); also declared on the models, so new tables get them from create_all()
+COMPOSITE_INDEXES = (
+    ("ix_conversations_session_id_created_at", "conversations", ("session_id", "created_at")),
+    ("ix_stage_transitions_session_id_created_at", "stage_transitions", ("session_id", "created_at")),
+    ("ix_sessions_user_id_created_at", "sessions", ("user_id", "created_at")),
+)
+
+
+# Advisory lock held while building indexes, so workers migrating at the same time build them one after another
+_INDEX_BUILD_LOCK_KEY = 4_151_900_213
+_INDEX_BUILD_LOCK_POLL_SECONDS = 1.0
+
+
+def migrate_add_composite_indexes_pg(session: Session):
+    """
+    Add composite indexes to existing tables
+
+    On PostgreSQL the indexes are built with CREATE INDEX CONCURRENTLY, which
+    does not block writes but cannot run inside a transaction, so they use
+    an autocommit connection with statement_timeout lifted for the build.
+    An invalid index left by an interrupted concurrent build is dropped and
+    rebuilt. Every worker runs init_db and a build still running in another
+    worker is invalid too, so builds hold an advisory lock. It is polled
+    rather than awaited: a waiting statement holds a snapshot the other
+    worker's concurrent build would wait on. Other databases use a plain
+    CREATE INDEX IF NOT EXISTS.
+    """
+    engine = session.get_bind()
+    tables = set(inspect(engine).get_table_names())
+    indexes = [(name, table, columns) for name, table, columns in COMPOSITE_INDEXES if table in tables]
+
+    if engine.dialect.name != "postgresql":
+        with engine.begin() as connection:
+            for name, table, columns in indexes:
+                connection.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+        return
+
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        # Connections carry DB_STATEMENT_TIMEOUT_MS, which a large index build would exceed
+        connection.execute(text("SET statement_timeout = 0"))
+        locked = waited = False
+        try:
+            while not connection.scalar(text("SELECT pg_try_advisory_lock(:key)"), {"key": _INDEX_BUILD_LOCK_KEY}):
+                if not waited:
+                    logger.info("Another worker is building indexes, waiting for it")
+                    waited = True
+                time.sleep(_INDEX_BUILD_LOCK_POLL_SECONDS)
+            locked = True
+
+            for name, table, columns in indexes:
+                valid = connection.scalar(
+                    text("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(:name)"), {"name": name}
+                )
+                if valid:
+                    logger.info(f"Index {name} already exists, skipping")
+                    continue
+                if valid is False:
+                    logger.warning(f"Index {name} is invalid (interrupted build), rebuilding")
+                    connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+
+                logger.info(f"Creating index: {name}")
+                started = time.perf_counter()
+                connection.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+                logger.info(f"✓ Created index {name} in {time.perf_counter() - started:.1f}s")
+        finally:
+            if locked:
+                connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": _INDEX_BUILD_LOCK_KEY})
+            # The connection returns to the pool; restore its configured timeout
+            connection.execute(text("RESET statement_timeout"))
+
+
+def migrate_add_latency_columns_pg(session: Session):
+    """
+    Add turn latency columns (PostgreSQL version)
+
+    Adds llm_latency_ms, db_latency_ms and total_latency_ms to conversations
+    and total_response_time_ms and timed_replies to session_metrics if they
+    don't exist, and widens session_metrics.avg_response_time_seconds from
+    INTEGER to DOUBLE PRECISION on PostgreSQL. A new timed_replies column is
+    backfilled from the agent messages that have a latency.
+    """
+    new_columns = {
+        'conversations': {
+            'llm_latency_ms': 'INTEGER',
+            'db_latency_ms': 'INTEGER',
+            'total_latency_ms': 'INTEGER',
+        },
+        'session_metrics': {
+            'total_response_time_ms': 'BIGINT DEFAULT 0 NOT NULL',
+            'timed_replies': 'INTEGER DEFAULT 0 NOT NULL',
+        },
+    }
+    added = set()
+
+    for table_name, columns_to_add in new_columns.items():
+        existing_columns = get_existing_columns(session, table_name)
+        if not existing_columns:
+            logger.info(f"{table_name} table does not exist yet, will be created by init_db()")
+            continue
+
+        for column_name, column_def in columns_to_add.items():
+            if column_name in existing_columns:
+                continue
+            try:
+                logger.info(f"Adding column: {table_name}.{column_name}")
+                session.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_def}"))
+                session.commit()
+                added.add(f"{table_name}.{column_name}")
+                logger.info(f"✓ Added column: {table_name}.{column_name}")
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Failed to add column {table_name}.{column_name}: {e}")
+                raise
+
+    if "session_metrics.timed_replies" in added:
+        try:
+            logger.info("Backfilling session_metrics.timed_replies")
+            session.execute(text("""
+                UPDATE session_metrics SET timed_replies = (
+                    SELECT COUNT(*) FROM conversations
+                    WHERE conversations.session_id = session_metrics.session_id
+                      AND conversations.role = 'agent' AND conversations.total_latency_ms IS NOT NULL
+                )
+            """))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Failed to backfill timed_replies: {e}")
+            raise
+
+    if session.get_bind().dialect.name != "postgresql":
+        # SQLite stores REAL values in an INTEGER-declared column as they are
+        return
+
+    data_type = session.execute(text("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'session_metrics' AND column_name = 'avg_response_time_seconds'
+    """)).scalar()
+    if data_type == "integer":
+        try:
+            logger.info("Changing session_metrics.avg_response_time_seconds to DOUBLE PRECISION")
+            session.execute(text(
+                "ALTER TABLE session_metrics ALTER COLUMN avg_response_time_seconds TYPE DOUBLE PRECISION"
+            ))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Failed to change avg_response_time_seconds type: {e}")
+            raise
+
+
 def run_migrations_pg(session: Session):
     """
     Run all PostgreSQL migrations
@@ -104,6 +259,8 @@ def run_migrations_pg(session: Session):
 
     try:
         migrate_add_turn_tracking_columns_pg(session)
+        migrate_add_latency_columns_pg(session)
+        migrate_add_composite_indexes_pg(session)
         logger.info("All migrations completed successfully")
     except Exception as e:
         logger.error(f"Migration suite failed: {e}", exc_info=True)
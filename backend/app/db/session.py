@@ -1,36 +1,18 @@
 """
 Database session management
 """
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, Session as SQLAlchemySession
-from sqlalchemy.pool import QueuePool
 from contextlib import contextmanager
-from typing import Generator
+from typing import Callable, Generator
 import logging
 
 from ..core.config import settings
+from .engine import create_db_engine
 
 logger = logging.getLogger(__name__)
 
-# Create database engine with optimized connection pooling
-# Determine connect_args based on database type
-connect_args = {}
-if settings.DATABASE_URL.startswith("postgresql"):
-    # PostgreSQL-specific connection arguments
-    connect_args = {
-        "connect_timeout": 10,  # Connection timeout in seconds
-    }
-
-engine = create_engine(
-    settings.DATABASE_URL,
-    poolclass=QueuePool,
-    pool_size=5,  # Base connection pool size (suitable for 30 users)
-    max_overflow=10,  # Additional connections when pool is full
-    pool_pre_ping=True,  # Verify connections before using
-    pool_recycle=3600,  # Recycle connections after 1 hour
-    echo=settings.DEBUG,  # Log SQL statements in debug mode
-    connect_args=connect_args
-)
+# Pool and connection settings follow the database backend (see engine.py)
+engine = create_db_engine(settings.DATABASE_URL)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -56,6 +38,16 @@ def get_db() -> Generator[SQLAlchemySession, None, None]:
         db.close()
 
 
+def get_session_factory() -> Callable[[], SQLAlchemySession]:
+    """
+    Dependency for endpoints that open sessions themselves
+
+    Streaming responses are generated after get_db's session is closed, so
+    their generators create (and close) their own session from this factory.
+    """
+    return SessionLocal
+
+
 @contextmanager
 def get_db_context() -> Generator[SQLAlchemySession, None, None]:
     """
@@ -15,8 +15,13 @@ from pathlib import Path
 import traceback
 
 from .core.config import settings
-from .api import chat, research
-from .db import init_db
+from .api import admin, chat, metrics, research
+from .db import async_engine, init_db
+from .services.gemini_service import gemini_service
+from .services.metrics import RequestMetricsMiddleware, mark_process_dead
+from .services.query_cache import analytics_cache, count_cache
+from .services.session_state_cache import session_state_cache
+from .services.write_behind import write_behind_writer
 
 # Configure logging
 logging.basicConfig(
@@ -49,9 +54,17 @@ async def lifespan(app: FastAPI):
         # Don't raise - allow app to start even if DB init fails
         # This is important for Railway healthchecks
 
+    if write_behind_writer is not None:
+        await write_behind_writer.start()
+
     yield
     # Shutdown
     logger.info("Shutting down CPS Scaffolding Agent...")
+    if write_behind_writer is not None:
+        # Durability: insert every queued row before the process exits
+        await write_behind_writer.stop()
+    await async_engine.dispose()
+    mark_process_dead()
 
 
 # Create FastAPI app
@@ -75,6 +88,10 @@ app.add_middleware(
 # Add GZip compression for production
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 
+# Per-route latency histograms for /metrics (outermost, so compression time is included)
+if settings.METRICS_ENABLED:
+    app.add_middleware(RequestMetricsMiddleware)
+
 
 # Global exception handlers
 @app.exception_handler(Exception)
@@ -122,6 +139,9 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
 # Include routers
 app.include_router(chat.router)
 app.include_router(research.router)
+app.include_router(admin.router)
+if settings.METRICS_ENABLED:
+    app.include_router(metrics.router)
 
 # Mount static files for production (frontend build)
 STATIC_DIR = Path(__file__).parent.parent / "static"
@@ -143,11 +163,20 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint for Railway monitoring"""
+    """Health check endpoint for Railway monitoring
+
+    Stays "healthy" while the LLM circuit breaker is open (chat keeps working
+    from the degraded path); the breaker state is reported under "llm".
+    """
     return {
         "status": "healthy",
         "version": VERSION,
-        "environment": settings.ENVIRONMENT
+        "environment": settings.ENVIRONMENT,
+        "llm": gemini_service.stats(),
+        "session_state_cache": session_state_cache.stats() if session_state_cache is not None else None,
+        "write_behind": write_behind_writer.stats() if write_behind_writer is not None else None,
+        "count_cache": count_cache.stats() if count_cache is not None else None,
+        "analytics_cache": analytics_cache.stats() if analytics_cache is not None else None
     }
 
 
@@ -1,7 +1,7 @@
 """
 Database models for CPS scaffolding research system
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey, JSON
+from sqlalchemy import Column, Integer, BigInteger, Float, String, Text, DateTime, Boolean, ForeignKey, Index, JSON
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -12,6 +12,10 @@ Base = declarative_base()
 class Session(Base):
     """User session for problem-solving task"""
     __tablename__ = "sessions"
+    __table_args__ = (
+        # A user's sessions, newest first
+        Index("ix_sessions_user_id_created_at", "user_id", "created_at"),
+    )
 
     id = Column(String(36), primary_key=True)
     user_id = Column(String(255), nullable=True, index=True)
@@ -33,6 +37,10 @@ class Session(Base):
 class Conversation(Base):
     """Individual conversation messages with CPS annotations"""
     __tablename__ = "conversations"
+    __table_args__ = (
+        # A session's messages in order (history, latest messages) without a sort
+        Index("ix_conversations_session_id_created_at", "session_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String(36), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -43,6 +51,13 @@ class Conversation(Base):
     response_depth = Column(String(20), nullable=True)  # 'shallow', 'medium', 'deep'
     should_transition = Column(Boolean, nullable=True)  # Whether agent suggested transition
     reasoning = Column(Text, nullable=True)  # Agent's reasoning for scaffolding decision
+    # Handler timings of the turn, on agent messages. The turn is written in one
+    # transaction: the learner message and transition inserts count toward db
+    # and total; the agent message insert, counter update and commit that
+    # record the values do not (with write-behind, only the latter are on the request)
+    llm_latency_ms = Column(Integer, nullable=True)  # Gemini call
+    db_latency_ms = Column(Integer, nullable=True)  # Database reads before the reply plus the learner message insert
+    total_latency_ms = Column(Integer, nullable=True)  # Request received to learner message inserted
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
 
     # Relationships
@@ -55,6 +70,10 @@ class Conversation(Base):
 class StageTransition(Base):
     """CPS stage transitions for analysis"""
     __tablename__ = "stage_transitions"
+    __table_args__ = (
+        # A session's transitions in order, and its latest stage
+        Index("ix_stage_transitions_session_id_created_at", "session_id", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
     session_id = Column(String(36), ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False, index=True)
@@ -103,10 +122,13 @@ class SessionMetric(Base):
     action_preparation_turns = Column(Integer, default=0, nullable=False)  # 실행_준비 (max: 6)
     current_stage = Column(String(50), nullable=True)  # Current CPS stage
     last_updated = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+    state_version = Column(Integer, default=0, nullable=False)  # Bumped on every state change; validates cached session state
 
-    # Time metrics
-    session_duration_seconds = Column(Integer, nullable=True)
-    avg_response_time_seconds = Column(Integer, nullable=True)
+    # Time metrics, updated with every agent reply
+    session_duration_seconds = Column(Integer, nullable=True)  # Session start to latest reply
+    avg_response_time_seconds = Column(Float, nullable=True)  # total_response_time_ms / timed_replies
+    total_response_time_ms = Column(BigInteger, default=0, nullable=False)  # Sum of total_latency_ms of timed replies
+    timed_replies = Column(Integer, default=0, nullable=False)  # Agent replies saved with a latency
 
     # Completion status
     completed = Column(Boolean, default=False, nullable=False)
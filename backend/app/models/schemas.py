@@ -1,8 +1,8 @@
 """
 Pydantic schemas for request/response validation
 """
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, field_validator, model_validator
+from typing import Annotated, Dict, List, Optional, Union
 from datetime import datetime
 
 
@@ -17,7 +17,11 @@ class ChatRequest(BaseModel):
     """Request for chat endpoint"""
     session_id: Optional[str] = Field(None, description="Session ID for conversation tracking")
     message: str = Field(..., description="User message", min_length=1, max_length=2000)
-    conversation_history: List[Message] = Field(default=[], description="Previous conversation history", max_length=50)
+    conversation_history: Optional[List[Message]] = Field(
+        None,
+        description="Deprecated and ignored: the server builds history from stored messages",
+        max_length=50
+    )
     current_stage: Optional[str] = Field(None, description="Current CPS stage if known")
 
 
@@ -31,6 +35,69 @@ class ScaffoldingResponse(BaseModel):
     reasoning: str = Field(..., description="Explanation of decision", max_length=1000)
 
 
+class ScaffoldingOutputBase(BaseModel):
+    """Fields shared by both shapes of raw model output"""
+    current_stage: str = Field(..., description="Inferred CPS stage")
+    detected_metacog_needs: List[str] = Field(..., description="Metacognitive elements to address")
+    response_depth: str = Field(..., description="Assessment: shallow|medium|deep", pattern="^(shallow|medium|deep)$")
+    should_transition: bool = Field(..., description="Whether to move to next stage")
+    reasoning: str = Field(..., description="Explanation of decision", max_length=1000)
+
+    @field_validator("detected_metacog_needs", mode="before")
+    @classmethod
+    def _coerce_metacog_needs(cls, value):
+        # The model sometimes returns a bare string or an empty list
+        if isinstance(value, str):
+            value = [value]
+        return value or ["점검"]
+
+    @field_validator("response_depth", mode="before")
+    @classmethod
+    def _lowercase_depth(cls, value):
+        return value.strip().lower() if isinstance(value, str) else value
+
+
+class QuestionModeOutput(ScaffoldingOutputBase):
+    """Model output for the scaffolding-question prompt"""
+    scaffolding_question: str = Field(..., min_length=1, max_length=500)
+
+    def to_scaffolding(self) -> Dict:
+        """Convert to the ScaffoldingResponse field dict"""
+        return self.model_dump()
+
+
+class AnswerModeOutput(ScaffoldingOutputBase):
+    """Model output for the answer prompt (learner asked a question)"""
+    answer_message: str = Field(..., min_length=1)
+    follow_up_question: Optional[str] = None
+
+    @model_validator(mode="after")
+    def _check_combined_length(self):
+        if len(self._combined_text()) > 500:
+            raise ValueError("answer_message and follow_up_question exceed 500 characters")
+        return self
+
+    def _combined_text(self) -> str:
+        if self.follow_up_question:
+            return f"{self.answer_message} {self.follow_up_question}"
+        return self.answer_message
+
+    def to_scaffolding(self) -> Dict:
+        """Convert to the ScaffoldingResponse field dict, joining answer and follow-up"""
+        return {
+            "current_stage": self.current_stage,
+            "detected_metacog_needs": self.detected_metacog_needs,
+            "response_depth": self.response_depth,
+            "scaffolding_question": self._combined_text(),
+            "should_transition": self.should_transition,
+            "reasoning": self.reasoning,
+        }
+
+
+# Raw model output in either shape; an answer_message selects answer mode
+ScaffoldingOutput = Annotated[Union[AnswerModeOutput, QuestionModeOutput], Field(union_mode="left_to_right")]
+
+
 class TurnCounts(BaseModel):
     """Turn counts for each CPS stage"""
     current: int = Field(..., description="Current turn count")
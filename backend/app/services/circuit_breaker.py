@@ -0,0 +1,180 @@
+"""
+Circuit breaker for the LLM backend
+Stops sending requests to a failing Gemini backend so chat turns degrade immediately
+"""
+from collections import deque
+from typing import Callable, Dict, Optional
+import logging
+import threading
+import time
+
+from ..core.config import Settings, settings
+from .llm_backends import LLMBackendError
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(LLMBackendError):
+    """Raised when a call is rejected because the circuit is open"""
+
+
+class CircuitBreaker:
+    """
+    Count-based sliding-window circuit breaker
+
+    Closed: calls pass; outcomes fill a window of the last window_size calls.
+    The circuit opens once at least minimum_calls are recorded and either
+    the failure rate or the slow-call rate reaches its threshold.
+    Open: calls are rejected until open_seconds have passed.
+    Half-open: up to half_open_probes probe calls are let through; the circuit
+    closes when all of them succeed and re-opens on the first failure.
+    """
+
+    def __init__(
+        self,
+        window_size: int = 20,
+        minimum_calls: int = 10,
+        failure_rate_threshold: float = 0.5,
+        slow_call_seconds: float = 5.0,
+        slow_call_rate_threshold: float = 0.8,
+        open_seconds: float = 30.0,
+        half_open_probes: int = 2,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.window_size = max(1, window_size)
+        self.minimum_calls = max(1, min(minimum_calls, self.window_size))
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+        self._clock = clock
+        self._lock = threading.Lock()
+
+        # Each entry is (failed, slow)
+        self._window: deque = deque(maxlen=self.window_size)
+        self.state = STATE_CLOSED
+        self._opened_at: Optional[float] = None
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        self.rejected = 0
+        self.times_opened = 0
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        logger.warning(f"LLM circuit breaker {self.state} -> {state}")
+        self.state = state
+        if state == STATE_OPEN:
+            self._opened_at = self._clock()
+            self.times_opened += 1
+        if state != STATE_CLOSED:
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+        if state == STATE_CLOSED:
+            self._window.clear()
+
+    def allow_request(self) -> bool:
+        """
+        Decide whether a call may go to the backend
+
+        Returns:
+            True if the call may proceed; the caller must then report its
+            outcome with record_success or record_failure
+        """
+        with self._lock:
+            if self.state == STATE_OPEN and self._clock() - self._opened_at >= self.open_seconds:
+                self._transition(STATE_HALF_OPEN)
+
+            if self.state == STATE_CLOSED:
+                return True
+
+            if self.state == STATE_HALF_OPEN and self._probes_in_flight < self.half_open_probes - self._probe_successes:
+                self._probes_in_flight += 1
+                return True
+
+            self.rejected += 1
+            return False
+
+    def record_success(self, latency_seconds: float) -> None:
+        """Report a successful call and its latency"""
+        with self._lock:
+            if self.state == STATE_HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                if latency_seconds >= self.slow_call_seconds:
+                    self._transition(STATE_OPEN)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._transition(STATE_CLOSED)
+                return
+
+            self._window.append((False, latency_seconds >= self.slow_call_seconds))
+            self._evaluate()
+
+    def record_failure(self) -> None:
+        """Report a failed call"""
+        with self._lock:
+            if self.state == STATE_HALF_OPEN:
+                self._transition(STATE_OPEN)
+                return
+
+            self._window.append((True, False))
+            self._evaluate()
+
+    def record_ignored(self) -> None:
+        """Release a half-open probe whose outcome says nothing about backend health"""
+        with self._lock:
+            if self.state == STATE_HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def _evaluate(self) -> None:
+        if self.state != STATE_CLOSED or len(self._window) < self.minimum_calls:
+            return
+
+        total = len(self._window)
+        failure_rate = sum(1 for failed, _ in self._window if failed) / total
+        slow_rate = sum(1 for _, slow in self._window if slow) / total
+
+        if failure_rate >= self.failure_rate_threshold or slow_rate >= self.slow_call_rate_threshold:
+            logger.error(
+                f"Opening LLM circuit breaker: failure_rate={failure_rate:.2f}, slow_call_rate={slow_rate:.2f}"
+            )
+            self._transition(STATE_OPEN)
+
+    def stats(self) -> Dict:
+        """Breaker state and counters for /health"""
+        with self._lock:
+            total = len(self._window)
+            retry_in = None
+            if self.state == STATE_OPEN:
+                retry_in = round(max(0.0, self.open_seconds - (self._clock() - self._opened_at)), 1)
+            return {
+                "state": self.state,
+                "window_calls": total,
+                "failure_rate": round(sum(1 for failed, _ in self._window if failed) / total, 3) if total else 0.0,
+                "slow_call_rate": round(sum(1 for _, slow in self._window if slow) / total, 3) if total else 0.0,
+                "rejected": self.rejected,
+                "times_opened": self.times_opened,
+                "retry_in_seconds": retry_in,
+            }
+
+
+def create_circuit_breaker(config: Settings = settings) -> Optional[CircuitBreaker]:
+    """Create the circuit breaker configured by CIRCUIT_BREAKER_* settings, or None if disabled"""
+    if not config.CIRCUIT_BREAKER_ENABLED:
+        return None
+    return CircuitBreaker(
+        window_size=config.CIRCUIT_BREAKER_WINDOW_SIZE,
+        minimum_calls=config.CIRCUIT_BREAKER_MIN_CALLS,
+        failure_rate_threshold=config.CIRCUIT_BREAKER_FAILURE_RATE,
+        slow_call_seconds=config.CIRCUIT_BREAKER_SLOW_CALL_SECONDS,
+        slow_call_rate_threshold=config.CIRCUIT_BREAKER_SLOW_CALL_RATE,
+        open_seconds=config.CIRCUIT_BREAKER_OPEN_SECONDS,
+        half_open_probes=config.CIRCUIT_BREAKER_HALF_OPEN_PROBES
+    )
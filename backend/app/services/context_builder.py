@@ -0,0 +1,256 @@
+"""
+Token-budgeted prompt context for long sessions
+Recent turns are kept verbatim within a token budget; older learner messages are folded into a rolling summary
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import logging
+import math
+import re
+import threading
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session as SQLAlchemySession
+
+from ..core.config import Settings, settings
+from .. import crud
+
+logger = logging.getLogger(__name__)
+
+# Stage assumed until an agent reply has recorded one
+DEFAULT_STAGE = "도전_이해"
+
+# Longest excerpt kept per learner message in the summary
+SUMMARY_POINT_CHARS = 80
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。])\s|\n")
+
+# Rows fetched per query while folding messages into a summary
+_FOLD_BATCH_SIZE = 200
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the Gemini token count of a text without calling the API
+
+    ASCII text averages about 4 characters per token; Hangul and other
+    non-ASCII characters about 1.5.
+    """
+    ascii_chars = sum(1 for ch in text if ch < "\x80")
+    return math.ceil(ascii_chars / 4 + (len(text) - ascii_chars) / 1.5)
+
+
+def fit_to_budget(history: List[Dict], token_budget: int) -> List[Dict]:
+    """
+    Keep the most recent messages whose combined size fits the budget
+
+    Args:
+        history: Messages oldest first, each with "role" and "content"
+        token_budget: Maximum estimated tokens for the kept messages
+
+    Returns:
+        Trailing slice of history; the newest message is always kept
+    """
+    used = 0
+    start = len(history)
+    for index in range(len(history) - 1, -1, -1):
+        used += estimate_tokens(history[index]["content"]) + 4  # role label and newline
+        if used > token_budget and index < len(history) - 1:
+            break
+        start = index
+    return history[start:]
+
+
+def summarize_message(text: str) -> str:
+    """First sentence of a learner message, shortened to SUMMARY_POINT_CHARS"""
+    point = _SENTENCE_END.split(text.strip(), maxsplit=1)[0].strip()
+    if len(point) > SUMMARY_POINT_CHARS:
+        point = point[:SUMMARY_POINT_CHARS - 1].rstrip() + "…"
+    return point
+
+
+class SessionSummary:
+    """Learner points of a session grouped by stage, covering messages up to last_id"""
+
+    __slots__ = ("points", "pending", "last_id", "stage")
+
+    def __init__(self):
+        self.points: "OrderedDict[str, List[str]]" = OrderedDict()
+        self.pending: List[str] = []  # Learner points whose turn has no agent reply folded yet
+        self.last_id = 0
+        self.stage: Optional[str] = None  # Stage of the latest folded agent message
+
+    def fold(self, conversation_id: int, role: str, message: str, cps_stage: Optional[str]) -> None:
+        """
+        Add one conversation row
+
+        A learner message is filed under the stage of the agent reply that
+        follows it, which is the stage its turn was handled in.
+        """
+        if role == "agent":
+            self.stage = cps_stage or self.stage
+            if self.pending:
+                self.points.setdefault(self.stage or DEFAULT_STAGE, []).extend(self.pending)
+                self.pending = []
+        elif message.strip():
+            self.pending.append(summarize_message(message))
+        self.last_id = max(self.last_id, conversation_id)
+
+    def render(self, token_budget: int) -> Optional[str]:
+        """
+        Summary text within the token budget
+
+        The budget is shared evenly between stages. Within a stage the
+        earliest points are kept, since they usually state the problem.
+        """
+        points_by_stage = OrderedDict((stage, list(points)) for stage, points in self.points.items())
+        if self.pending:
+            points_by_stage.setdefault(self.stage or DEFAULT_STAGE, []).extend(self.pending)
+        if not points_by_stage:
+            return None
+
+        per_stage = max(1, token_budget // len(points_by_stage))
+        lines = []
+        for stage, points in points_by_stage.items():
+            kept, used = [], 0
+            for point in points:
+                used += estimate_tokens(point) + 1
+                if used > per_stage and kept:
+                    kept.append("…")
+                    break
+                kept.append(point)
+            lines.append(f"- {stage}: " + " / ".join(kept))
+        return "\n".join(lines)
+
+
+class ContextBuilder:
+    """
+    Split a session's history into verbatim recent turns and a rolling summary
+
+    Messages that no longer fit the token budget are folded into a cached
+    per-session summary. Folding is incremental (only rows newer than the
+    summary are read) and never undone, so once a message has been
+    summarized it stays out of the verbatim part, keeping prompt size flat
+    however long the session runs.
+    """
+
+    def __init__(self, token_budget: int = 1200, summary_token_budget: int = 300, max_sessions: int = 1000):
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.max_sessions = max(1, max_sessions)
+        self._summaries: "OrderedDict[str, SessionSummary]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.rows_folded = 0
+
+    def _summary(self, session_id: str) -> SessionSummary:
+        with self._lock:
+            summary = self._summaries.get(session_id)
+            if summary is None:
+                summary = self._summaries[session_id] = SessionSummary()
+            self._summaries.move_to_end(session_id)
+            while len(self._summaries) > self.max_sessions:
+                self._summaries.popitem(last=False)
+            return summary
+
+    def _fold_until(self, db: SQLAlchemySession, session_id: str, summary: SessionSummary, until_id: int) -> None:
+        """Fold all of the session's rows with id <= until_id into the summary"""
+        while summary.last_id < until_id:
+            rows = crud.get_conversations_after(
+                db, session_id, summary.last_id, limit=_FOLD_BATCH_SIZE, until_id=until_id
+            )
+            if self._fold(summary, rows, until_id):
+                break
+
+    async def _fold_until_async(self, db: AsyncSession, session_id: str, summary: SessionSummary, until_id: int) -> None:
+        """Async version of _fold_until"""
+        while summary.last_id < until_id:
+            rows = await crud.get_conversations_after_async(
+                db, session_id, summary.last_id, limit=_FOLD_BATCH_SIZE, until_id=until_id
+            )
+            if self._fold(summary, rows, until_id):
+                break
+
+    def _fold(self, summary: SessionSummary, rows: List, until_id: int) -> bool:
+        """Fold one batch of rows; returns True once every row up to until_id is folded"""
+        for row in rows:
+            summary.fold(row.id, row.role, row.message, row.cps_stage)
+        self.rows_folded += len(rows)
+        if len(rows) < _FOLD_BATCH_SIZE:
+            summary.last_id = until_id
+            return True
+        return False
+
+    def _split(self, summary: SessionSummary, history: List[Dict]) -> Tuple[List[Dict], int]:
+        """Messages kept verbatim, and the id up to which older messages belong in the summary"""
+        recent = fit_to_budget([m for m in history if m["id"] > summary.last_id], self.token_budget)
+
+        # Everything before the oldest verbatim message belongs in the summary
+        if recent:
+            until_id = recent[0]["id"] - 1
+        elif history:
+            until_id = history[-1]["id"]
+        else:
+            until_id = 0
+        return recent, until_id
+
+    def build(
+        self,
+        db: SQLAlchemySession,
+        session_id: str,
+        history: List[Dict]
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Build the prompt context for a session
+
+        Args:
+            db: Database session
+            session_id: Session ID
+            history: Recent messages oldest first, each with "id", "role" and
+                "content" (as returned by the conversation history buffer)
+
+        Returns:
+            Tuple of (messages to include verbatim, summary of older learner
+            messages or None)
+        """
+        summary = self._summary(session_id)
+        recent, until_id = self._split(summary, history)
+        self._fold_until(db, session_id, summary, until_id)
+        return recent, summary.render(self.summary_token_budget)
+
+    async def build_async(
+        self,
+        db: AsyncSession,
+        session_id: str,
+        history: List[Dict]
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Async version of build"""
+        summary = self._summary(session_id)
+        recent, until_id = self._split(summary, history)
+        await self._fold_until_async(db, session_id, summary, until_id)
+        return recent, summary.render(self.summary_token_budget)
+
+    def clear(self) -> None:
+        """Drop all cached summaries"""
+        with self._lock:
+            self._summaries.clear()
+
+    def stats(self) -> Dict:
+        """Summary cache counters for monitoring"""
+        return {
+            "sessions": len(self._summaries),
+            "token_budget": self.token_budget,
+            "summary_token_budget": self.summary_token_budget,
+            "rows_folded": self.rows_folded,
+        }
+
+
+def create_context_builder(config: Settings = settings) -> ContextBuilder:
+    """Create the context builder configured by CONTEXT_* settings"""
+    return ContextBuilder(
+        token_budget=config.CONTEXT_TOKEN_BUDGET,
+        summary_token_budget=config.CONTEXT_SUMMARY_TOKEN_BUDGET,
+        max_sessions=config.HISTORY_BUFFER_MAX_SESSIONS
+    )
+
+
+context_builder = create_context_builder()
@@ -0,0 +1,190 @@
+"""
+Server-side conversation history for prompt context
+Keeps the last messages of each active session in memory so clients need not upload the transcript
+"""
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+import logging
+import threading
+
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session as SQLAlchemySession
+
+from ..core.config import Settings, settings
+from .. import crud
+
+logger = logging.getLogger(__name__)
+
+
+class _SessionHistory:
+    """Ring buffer of one session's most recent messages"""
+
+    __slots__ = ("messages", "last_id", "message_count")
+
+    def __init__(self, max_messages: int):
+        self.messages: deque = deque(maxlen=max_messages)
+        self.last_id = 0
+        self.message_count = 0
+
+    def add(self, conversation_id: int, role: str, content: str) -> None:
+        if conversation_id <= self.last_id:
+            return
+        self.messages.append({"id": conversation_id, "role": role, "content": content})
+        self.last_id = conversation_id
+        self.message_count += 1
+
+
+class ConversationHistoryBuffer:
+    """
+    Per-session ring buffers of the last max_messages messages
+
+    A session's buffer is warmed from its Conversation rows on first access.
+    Later reads only fetch rows with an id above the last one seen, which
+    is the previous turn's two messages (or messages written by another
+    worker), never the whole transcript. On PostgreSQL, ids from a sequence
+    can commit out of order across workers, so a row below the last id seen
+    may appear later; each read also counts the session's rows and re-warms
+    the buffer when the count shows a row the buffer skipped. Buffers of the
+    least recently used sessions are dropped beyond max_sessions.
+    """
+
+    def __init__(self, max_messages: int = 20, max_sessions: int = 1000):
+        self.max_messages = max(1, max_messages)
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, _SessionHistory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.warms = 0
+        self.catch_ups = 0
+        self.gaps = 0
+        self.evictions = 0
+
+    def _entry(self, session_id: str) -> Optional[_SessionHistory]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                self._sessions.move_to_end(session_id)
+            return entry
+
+    def _warm(self, db: SQLAlchemySession, session_id: str) -> _SessionHistory:
+        """Load the session's latest messages from the database"""
+        rows = crud.get_latest_conversations(db, session_id, limit=self.max_messages)
+        return self._store(session_id, rows, crud.count_session_conversations(db, session_id))
+
+    async def _warm_async(self, db: AsyncSession, session_id: str) -> _SessionHistory:
+        """Async version of _warm"""
+        rows = await crud.get_latest_conversations_async(db, session_id, limit=self.max_messages)
+        return self._store(session_id, rows, await crud.count_session_conversations_async(db, session_id))
+
+    def _store(self, session_id: str, rows: List, message_count: int) -> _SessionHistory:
+        """Replace the session's buffer with the given rows"""
+        entry = _SessionHistory(self.max_messages)
+        # In id order, as catch-ups append; a row that committed late may be newer by created_at
+        for row in sorted(rows, key=lambda row: row.id):
+            entry.add(row.id, row.role, row.message)
+        entry.message_count = message_count
+        self.warms += 1
+
+        with self._lock:
+            self._sessions[session_id] = entry
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def _catch_up(self, entry: _SessionHistory, newer: List, message_count: int) -> bool:
+        """
+        Append rows newer than the buffer
+
+        Args:
+            entry: The session's buffer
+            newer: Rows with an id above entry.last_id, oldest first
+            message_count: Number of the session's rows, counted after newer was read
+
+        Returns:
+            False if the count shows rows the buffer would miss, which then
+            needs a re-warm
+        """
+        if entry.message_count + len(newer) != message_count:
+            self.gaps += 1
+            return False
+        if newer:
+            self.catch_ups += 1
+            for row in newer:
+                entry.add(row.id, row.role, row.message)
+        return True
+
+    def _load(self, db: SQLAlchemySession, session_id: str) -> _SessionHistory:
+        """The session's buffer, warmed or caught up with the database"""
+        entry = self._entry(session_id)
+        if entry is None:
+            return self._warm(db, session_id)
+
+        newer = crud.get_conversations_after(db, session_id, entry.last_id, limit=self.max_messages + 1)
+        if len(newer) > self.max_messages:
+            return self._warm(db, session_id)
+        if not self._catch_up(entry, newer, crud.count_session_conversations(db, session_id)):
+            return self._warm(db, session_id)
+        return entry
+
+    async def _load_async(self, db: AsyncSession, session_id: str) -> _SessionHistory:
+        """Async version of _load"""
+        entry = self._entry(session_id)
+        if entry is None:
+            return await self._warm_async(db, session_id)
+
+        newer = await crud.get_conversations_after_async(db, session_id, entry.last_id, limit=self.max_messages + 1)
+        if len(newer) > self.max_messages:
+            return await self._warm_async(db, session_id)
+        if not self._catch_up(entry, newer, await crud.count_session_conversations_async(db, session_id)):
+            return await self._warm_async(db, session_id)
+        return entry
+
+    def get(self, db: SQLAlchemySession, session_id: str) -> Tuple[List[Dict], int]:
+        """
+        Get a session's recent history
+
+        Args:
+            db: Database session
+            session_id: Session ID
+
+        Returns:
+            Tuple of (up to max_messages messages oldest first, as
+            [{"id": ..., "role": "user"|"agent", "content": "..."}], total
+            number of messages stored for the session)
+        """
+        entry = self._load(db, session_id)
+        return list(entry.messages), entry.message_count
+
+    async def get_async(self, db: AsyncSession, session_id: str) -> Tuple[List[Dict], int]:
+        """Async version of get"""
+        entry = await self._load_async(db, session_id)
+        return list(entry.messages), entry.message_count
+
+    def clear(self) -> None:
+        """Drop all buffered sessions"""
+        with self._lock:
+            self._sessions.clear()
+
+    def stats(self) -> Dict:
+        """Buffer counters for monitoring"""
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "max_messages": self.max_messages,
+            "warms": self.warms,
+            "catch_ups": self.catch_ups,
+            "gaps": self.gaps,
+            "evictions": self.evictions,
+        }
+
+
+def create_history_buffer(config: Settings = settings) -> ConversationHistoryBuffer:
+    """Create the history buffer configured by HISTORY_BUFFER_* settings"""
+    return ConversationHistoryBuffer(
+        max_messages=config.HISTORY_BUFFER_MESSAGES,
+        max_sessions=config.HISTORY_BUFFER_MAX_SESSIONS
+    )
+
+
+conversation_history = create_history_buffer()
@@ -2,39 +2,99 @@
 Google Gemini API integration service
 Handles LLM interactions for creative problem solving scaffolding
 """
-import google.generativeai as genai
-from typing import Dict, List, Optional
-import json
+from contextlib import nullcontext
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import hashlib
 import logging
+import time
+
+from pydantic import TypeAdapter, ValidationError
 
 from ..core.config import settings
-from ..resources.question_bank import QUESTION_BANK, format_questions_for_prompt
+from ..models.schemas import AnswerModeOutput, ScaffoldingOutput
+from ..resources.question_bank import QUESTION_BANK, format_questions_for_prompt, get_all_questions
+from .circuit_breaker import CircuitBreaker, CircuitOpenError, create_circuit_breaker
+from .context_builder import fit_to_budget
+from .intent_detector import detect_intent
+from .llm_backends import LLMBackend, LLMRateLimitError, LLMTransientError, create_backend
+from .llm_dispatcher import LLMDispatcher, LLMQueueFullError, LLMQueueTimeoutError, create_dispatcher
+from .llm_retry import DeadlineRetrier, LLMDeadlineExceededError, create_retrier
+from .metrics import observe_llm_call
+from .response_cache import ResponseCache, create_response_cache
+from .stream_parser import JSONStringFieldStreamer
 
 logger = logging.getLogger(__name__)
 
-# Constants
-MAX_CONTEXT_MESSAGES = 5  # Number of previous messages to include in context
+# Sentinel for "use the configured default" in constructor arguments
+_DEFAULT = object()
+
+# Built once: parses and validates model output JSON in a single pass
+SCAFFOLDING_OUTPUT_ADAPTER = TypeAdapter(ScaffoldingOutput)
+
+
+def _json_object_span(text: str) -> str:
+    """
+    Return the JSON object within model output
+
+    With JSON mode the output is a bare object and is returned unchanged;
+    otherwise surrounding prose or markdown code fences are cut off.
+    """
+    if text.lstrip().startswith("{"):
+        return text
+    start, end = text.find("{"), text.rfind("}")
+    return text[start:end + 1] if 0 <= start < end else text
+
+
+class ScaffoldingParseError(ValueError):
+    """Raised when model output cannot be turned into a scaffolding response"""
+
+
+def _call_outcome(error: Exception) -> str:
+    """Metrics outcome of a generation that ended in the fallback path"""
+    if isinstance(error, ScaffoldingParseError):
+        return "parse_error"
+    if isinstance(error, (LLMDeadlineExceededError, LLMQueueTimeoutError)):
+        return "timeout"
+    return "fallback"
 
 
 class GeminiService:
     """Service for interacting with Google Gemini API"""
 
-    def __init__(self):
-        """Initialize Gemini API with configuration
+    def __init__(
+        self,
+        backend: Optional[LLMBackend] = None,
+        response_cache: Optional[ResponseCache] = _DEFAULT,
+        dispatcher: Optional[LLMDispatcher] = _DEFAULT,
+        retrier: Optional[DeadlineRetrier] = _DEFAULT,
+        circuit_breaker: Optional[CircuitBreaker] = _DEFAULT
+    ):
+        """Initialize the service with an LLM backend
+
+        Args:
+            backend: Backend to generate text with; defaults to the one selected
+                by the LLM_BACKEND setting
+            response_cache: Cache for repeated learner inputs; defaults to the one
+                selected by RESPONSE_CACHE_* settings, pass None to disable
+            dispatcher: Concurrency/rate gate for async LLM calls; defaults to the
+                one configured by LLM_* settings, pass None to call directly
+            retrier: Deadline/retry/hedging policy for async LLM calls; defaults to
+                the one configured by LLM_* settings, pass None for a single attempt
+            circuit_breaker: Breaker that short-circuits async calls while the
+                backend is failing; defaults to CIRCUIT_BREAKER_* settings, pass None to disable
 
         Raises:
-            ValueError: If GEMINI_API_KEY is not configured or initialization fails
+            ValueError: If the configured backend cannot be initialized
+                (e.g. GEMINI_API_KEY is not configured)
         """
-        if not settings.GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY environment variable is not set")
-
-        try:
-            genai.configure(api_key=settings.GEMINI_API_KEY)
-            self.model = genai.GenerativeModel(settings.GEMINI_MODEL)
-            logger.info(f"Gemini API initialized with model: {settings.GEMINI_MODEL}")
-        except Exception as e:
-            logger.error(f"Failed to initialize Gemini API: {e}", exc_info=True)
-            raise ValueError(f"Failed to configure Gemini API: {e}") from e
+        self.backend = backend if backend is not None else create_backend(settings)
+        self.response_cache = create_response_cache(settings) if response_cache is _DEFAULT else response_cache
+        self.dispatcher = create_dispatcher(settings) if dispatcher is _DEFAULT else dispatcher
+        self.retrier = (
+            create_retrier(settings, retryable_errors=(LLMTransientError, ConnectionError, ScaffoldingParseError))
+            if retrier is _DEFAULT else retrier
+        )
+        self.circuit_breaker = create_circuit_breaker(settings) if circuit_breaker is _DEFAULT else circuit_breaker
 
         # System prompt for CPS scaffolding (질문 모드)
         self.system_prompt = """당신은 예비교사들의 창의적 문제해결(CPS)을 돕는 사고 촉진 에이전트입니다.
@@ -234,36 +294,12 @@ JSON 형태로 다음 정보를 제공:
 }
 """
 
-    def _is_learner_question(self, message: str) -> bool:
-        """
-        Determine if the learner's message is a question requiring an answer
-
-        Args:
-            message: Learner's message
-
-        Returns:
-            True if the message is a question, False otherwise
-        """
-        # Check for question mark
-        if '?' in message or '?' in message:
-            return True
-
-        # Check for common question patterns in Korean
-        question_patterns = [
-            '뭐예요', '뭔가요', '무엇인가요', '어떻게', '왜',
-            '이유가', '설명해', '알려줘', '알려주세요',
-            '괜찮나요', '맞나요', '좋나요', '어떤가요',
-            '도와줘', '도와주세요', '의견', '생각'
-        ]
-
-        message_lower = message.lower()
-        return any(pattern in message_lower for pattern in question_patterns)
-
     def generate_scaffolding(
         self,
         user_message: str,
         conversation_history: List[Dict[str, str]],
-        current_stage: Optional[str] = None
+        current_stage: Optional[str] = None,
+        context_summary: Optional[str] = None
     ) -> Dict:
         """
         Generate scaffolding question based on user message and conversation history
@@ -272,6 +308,7 @@ JSON 형태로 다음 정보를 제공:
             user_message: Current user message
             conversation_history: List of previous messages [{"role": "user"|"agent", "content": "..."}]
             current_stage: Current CPS stage if known
+            context_summary: Summary of older messages not in conversation_history
 
         Returns:
             Dictionary with scaffolding response including:
@@ -282,41 +319,315 @@ JSON 형태로 다음 정보를 제공:
             - should_transition: Whether to move to next CPS stage
             - reasoning: Explanation of decision
         """
+        started = time.perf_counter()
+        is_question = None
         try:
             # Validate input
             if not user_message or not user_message.strip():
                 logger.warning("Empty user message received")
                 return self._create_fallback_response("(빈 메시지)")
 
-            # Check if learner is asking a question (답변 모드 필요)
-            is_question = self._is_learner_question(user_message)
-            logger.info(f"Message classification: is_question={is_question}")
-            logger.info(f"Message type: {'QUESTION (답변 모드)' if is_question else 'STATEMENT (질문 모드)'}")
-            logger.info(f"Using prompt: {'ANSWER_PROMPT' if is_question else 'SYSTEM_PROMPT'}")
+            prompt, is_question = self._build_prompt(user_message, conversation_history, current_stage, context_summary)
+
+            cache_key = self._cache_key(user_message, current_stage, is_question, conversation_history)
+            cached = self._cache_lookup(cache_key)
+            if cached is not None:
+                return cached
+
+            logger.info(f"Sending request to {self.backend.name} backend for message: {user_message[:50]}...")
+            result_text = self.backend.generate(prompt)
+
+            result = self._parse_result_text(result_text, is_question, user_message)
+            self._cache_store(cache_key, result)
+            observe_llm_call("ok", is_question, time.perf_counter() - started)
+            return result
+
+        except Exception as e:
+            observe_llm_call(_call_outcome(e), is_question, time.perf_counter() - started)
+            return self._handle_generation_error(e, user_message, conversation_history)
+
+    async def generate_scaffolding_async(
+        self,
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        current_stage: Optional[str] = None,
+        context_summary: Optional[str] = None
+    ) -> Dict:
+        """
+        Async variant of generate_scaffolding for use inside request handlers
+
+        Uses the backend's non-blocking API so the event loop keeps serving
+        other requests while the model is generating.
+
+        Args:
+            user_message: Current user message
+            conversation_history: List of previous messages [{"role": "user"|"agent", "content": "..."}]
+            current_stage: Current CPS stage if known
+            context_summary: Summary of older messages not in conversation_history
+
+        Returns:
+            Dictionary with the same shape as generate_scaffolding
+        """
+        started = time.perf_counter()
+        entered = time.monotonic()
+        is_question = None
+        try:
+            if not user_message or not user_message.strip():
+                logger.warning("Empty user message received")
+                return self._create_fallback_response("(빈 메시지)")
+
+            prompt, is_question = self._build_prompt(user_message, conversation_history, current_stage, context_summary)
 
-            # Build conversation context
-            context = self._build_context(conversation_history, current_stage)
+            cache_key = self._cache_key(user_message, current_stage, is_question, conversation_history)
+            cached = await self._cache_lookup_async(cache_key)
+            if cached is not None:
+                return cached
+
+            logger.info(f"Sending async request to {self.backend.name} backend for message: {user_message[:50]}...")
+            result = await self._call_llm_async(prompt, is_question, user_message, entered)
+
+            await self._cache_store_async(cache_key, result)
+            observe_llm_call("ok", is_question, time.perf_counter() - started)
+            return result
+
+        except Exception as e:
+            observe_llm_call(_call_outcome(e), is_question, time.perf_counter() - started)
+            return self._handle_generation_error(e, user_message, conversation_history, current_stage)
+
+    async def generate_scaffolding_stream(
+        self,
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        current_stage: Optional[str] = None,
+        context_summary: Optional[str] = None
+    ) -> AsyncIterator[Dict]:
+        """
+        Stream scaffolding generation, yielding learner-facing text as it arrives
+
+        The question (or answer) text is extracted from the partial JSON as
+        tokens arrive, so it can be shown before generation finishes.
+
+        Args:
+            user_message: Current user message
+            conversation_history: List of previous messages [{"role": "user"|"agent", "content": "..."}]
+            current_stage: Current CPS stage if known
+            context_summary: Summary of older messages not in conversation_history
+
+        Yields:
+            {"type": "delta", "text": "..."} for each piece of learner-facing text,
+            then exactly one {"type": "result", "data": {...}} with the same shape
+            as generate_scaffolding
+        """
+        if not user_message or not user_message.strip():
+            logger.warning("Empty user message received")
+            yield {"type": "result", "data": self._create_fallback_response("(빈 메시지)")}
+            return
+
+        chunks: List[str] = []
+        started = time.perf_counter()
+        is_question = None
+        try:
+            prompt, is_question = self._build_prompt(user_message, conversation_history, current_stage, context_summary)
+
+            cache_key = self._cache_key(user_message, current_stage, is_question, conversation_history)
+            cached = await self._cache_lookup_async(cache_key)
+            if cached is not None:
+                yield {"type": "delta", "text": cached["scaffolding_question"]}
+                yield {"type": "result", "data": cached}
+                return
 
-            # Select appropriate prompt based on message type
             if is_question:
-                # 답변 모드: 학습자의 질문에 답변 제공
-                system_prompt_to_use = self.answer_prompt
-                instruction = """위 질문을 분석하여 JSON 형식으로 응답해주세요.
+                streamer = JSONStringFieldStreamer(["answer_message", "follow_up_question"])
+            else:
+                streamer = JSONStringFieldStreamer(["scaffolding_question"])
+
+            logger.info(f"Sending streaming request to {self.backend.name} backend for message: {user_message[:50]}...")
+
+            answer_started = False
+            async for text in self._stream_llm(prompt):
+                chunks.append(text)
+                for field, delta in streamer.feed(text):
+                    # Mirror how answer mode joins answer and follow-up question
+                    if field == "follow_up_question" and answer_started:
+                        delta = " " + delta
+                        answer_started = False
+                    elif field == "answer_message":
+                        answer_started = True
+                    yield {"type": "delta", "text": delta}
+
+            result = self._parse_result_text("".join(chunks), is_question, user_message)
+            await self._cache_store_async(cache_key, result)
+            observe_llm_call("ok", is_question, time.perf_counter() - started)
+
+        except Exception as e:
+            observe_llm_call(_call_outcome(e), is_question, time.perf_counter() - started)
+            result = self._handle_generation_error(e, user_message, conversation_history, current_stage)
+
+        yield {"type": "result", "data": result}
+
+    async def _call_llm_async(self, prompt: str, is_question: bool, user_message: str, entered: Optional[float] = None) -> Dict:
+        """
+        Generate and parse a response through the retry policy and dispatcher
+
+        The deadline budget counts from entered (time.monotonic() when the
+        request arrived), so time spent queueing for the dispatcher is part
+        of it. Every attempt, retries and hedges included, takes its own
+        dispatcher slot and rate-limit token. Malformed output is retried
+        like a transient error.
+        """
+        breaker = self.circuit_breaker
+        if breaker is not None and not breaker.allow_request():
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+        async def attempt() -> Tuple[Dict, float]:
+            # Timed inside the dispatcher slot so queueing is not counted as backend latency
+            attempt_started = time.monotonic()
+            result_text = await self.backend.generate_async(prompt)
+            return self._parse_result_text(result_text, is_question, user_message), time.monotonic() - attempt_started
+
+        dispatched = (lambda: self.dispatcher.run(attempt)) if self.dispatcher is not None else attempt
+        if self.retrier is not None:
+            # The hedge delay is a backend p90, so it learns from the seconds timed inside the slot
+            call = lambda: self.retrier.call(dispatched, started_at=entered, latency_of=lambda timed: timed[1])
+        else:
+            call = dispatched
+
+        if breaker is None:
+            result, _ = await call()
+            return result
+
+        recorded = False
+        try:
+            result, seconds = await call()
+            recorded = True
+            breaker.record_success(seconds)
+            return result
+        except (LLMRateLimitError, LLMQueueFullError, LLMQueueTimeoutError):
+            # Quota pressure and queueing are handled by the dispatcher, not a sign of an outage
+            raise
+        except Exception:
+            recorded = True
+            breaker.record_failure()
+            raise
+        finally:
+            if not recorded:
+                breaker.record_ignored()
+
+    async def _stream_llm(self, prompt: str) -> AsyncIterator[str]:
+        """Stream raw model output through the circuit breaker and dispatcher"""
+        breaker = self.circuit_breaker
+        if breaker is not None and not breaker.allow_request():
+            raise CircuitOpenError("LLM circuit breaker is open")
+
+        recorded = False
+        try:
+            async with self.dispatcher.slot() if self.dispatcher is not None else nullcontext():
+                started = time.monotonic()
+                try:
+                    async for text in self.backend.stream_async(prompt):
+                        yield text
+                except LLMRateLimitError:
+                    raise
+                except Exception:
+                    if breaker is not None:
+                        recorded = True
+                        breaker.record_failure()
+                    raise
+                if breaker is not None:
+                    recorded = True
+                    breaker.record_success(time.monotonic() - started)
+        finally:
+            if breaker is not None and not recorded:
+                breaker.record_ignored()
+
+    def _cache_key(
+        self,
+        user_message: str,
+        current_stage: Optional[str],
+        is_question: bool,
+        conversation_history: List[Dict[str, str]]
+    ) -> Optional[str]:
+        """Cache key for a request, or None when caching is disabled"""
+        if self.response_cache is None:
+            return None
+        return self.response_cache.key_for(user_message, current_stage, is_question, conversation_history)
+
+    def _cache_lookup(self, cache_key: Optional[str]) -> Optional[Dict]:
+        """Return a cached scaffolding response if available"""
+        if cache_key is None:
+            return None
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Response cache hit, skipping LLM call")
+        return cached
+
+    def _cache_store(self, cache_key: Optional[str], result: Dict) -> None:
+        """Cache a successfully parsed scaffolding response"""
+        if cache_key is not None:
+            self.response_cache.set(cache_key, result)
+
+    async def _cache_lookup_async(self, cache_key: Optional[str]) -> Optional[Dict]:
+        """Async version of _cache_lookup"""
+        if cache_key is None:
+            return None
+        cached = await self.response_cache.get_async(cache_key)
+        if cached is not None:
+            logger.info("Response cache hit, skipping LLM call")
+        return cached
+
+    async def _cache_store_async(self, cache_key: Optional[str], result: Dict) -> None:
+        """Async version of _cache_store"""
+        if cache_key is not None:
+            await self.response_cache.set_async(cache_key, result)
+
+    def _build_prompt(
+        self,
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        current_stage: Optional[str],
+        context_summary: Optional[str] = None
+    ) -> Tuple[str, bool]:
+        """
+        Build the full Gemini prompt for a learner message
+
+        Args:
+            user_message: Current user message
+            conversation_history: List of previous messages
+            current_stage: Current CPS stage if known
+            context_summary: Summary of older messages not in conversation_history
+
+        Returns:
+            Tuple of (prompt, is_question)
+        """
+        # Check if learner is asking a question (답변 모드 필요)
+        is_question = detect_intent(user_message).is_question
+        logger.info(f"Message classification: is_question={is_question}")
+        logger.info(f"Message type: {'QUESTION (답변 모드)' if is_question else 'STATEMENT (질문 모드)'}")
+        logger.info(f"Using prompt: {'ANSWER_PROMPT' if is_question else 'SYSTEM_PROMPT'}")
+
+        # Build conversation context
+        context = self._build_context(conversation_history, current_stage, context_summary)
+
+        # Select appropriate prompt based on message type
+        if is_question:
+            # 답변 모드: 학습자의 질문에 답변 제공
+            system_prompt_to_use = self.answer_prompt
+            instruction = """위 질문을 분석하여 JSON 형식으로 응답해주세요.
 응답에는 반드시 current_stage, detected_metacog_needs, response_depth, answer_message, follow_up_question (선택), should_transition, reasoning이 포함되어야 합니다.
 
 학습자의 질문에 대해 scaffolding 원칙을 유지하면서 도움이 되는 답변을 제공하세요."""
-                message_label = "학습자의 질문"
-            else:
-                # 질문 모드: 기존 scaffolding 질문 생성
-                system_prompt_to_use = self.system_prompt
-                instruction = """위 응답을 분석하여 JSON 형식으로 응답해주세요.
+            message_label = "학습자의 질문"
+        else:
+            # 질문 모드: 기존 scaffolding 질문 생성
+            system_prompt_to_use = self.system_prompt
+            instruction = """위 응답을 분석하여 JSON 형식으로 응답해주세요.
 응답에는 반드시 current_stage, detected_metacog_needs, response_depth, scaffolding_question, should_transition, reasoning이 포함되어야 합니다.
 
 ⚠️ 학습자가 "모르겠어", "잘 모르겠어요" 같은 불확실성을 표현하면, 더 구체적인 질문으로 사고를 촉진하세요."""
-                message_label = "학습자의 현재 응답"
+            message_label = "학습자의 현재 응답"
 
-            # Construct prompt
-            prompt = f"""{system_prompt_to_use}
+        # Construct prompt
+        prompt = f"""{system_prompt_to_use}
 
 이전 대화:
 {context}
@@ -325,93 +636,90 @@ JSON 형태로 다음 정보를 제공:
 
 {instruction}"""
 
-            # Generate response with timeout and error handling
-            logger.info(f"Sending request to Gemini API for message: {user_message[:50]}...")
-            response = self.model.generate_content(prompt)
-
-            if not response or not response.text:
-                logger.error("Gemini API returned empty response")
-                return self._create_fallback_response(user_message)
+        return prompt, is_question
 
-            result_text = response.text
-            logger.debug(f"Raw Gemini response (first 200 chars): {result_text[:200]}")
+    def _parse_result_text(self, result_text: str, is_question: bool, user_message: str) -> Dict:
+        """
+        Parse and validate raw model output text into a scaffolding dict
 
-            # Parse JSON response
-            # Remove markdown code blocks if present
-            if "```json" in result_text:
-                result_text = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                result_text = result_text.split("```")[1].split("```")[0].strip()
+        JSON decoding and validation happen in one pass through the
+        precompiled SCAFFOLDING_OUTPUT_ADAPTER, which accepts both the
+        question-mode and answer-mode shapes.
 
-            result = json.loads(result_text)
+        Args:
+            result_text: Raw model output (normally a bare JSON object)
+            is_question: Whether the answer-mode prompt was used
+            user_message: Original learner message (for logging)
 
-            # Validate required fields based on mode
-            if is_question:
-                required_fields = ["current_stage", "detected_metacog_needs", "response_depth",
-                                 "answer_message", "should_transition", "reasoning"]
-                # Ensure we have answer_message and convert to scaffolding_question for consistency
-                if "answer_message" in result:
-                    logger.info(f"✅ Answer mode: answer_message provided: {result['answer_message'][:100]}...")
-                    # Combine answer with follow-up question if present
-                    answer_text = result["answer_message"]
-                    if "follow_up_question" in result and result["follow_up_question"]:
-                        logger.info(f"✅ Follow-up question: {result['follow_up_question'][:100]}...")
-                        answer_text += " " + result["follow_up_question"]
-                    result["scaffolding_question"] = answer_text
-                else:
-                    logger.warning("⚠️ Answer mode but no answer_message in response!")
-            else:
-                required_fields = ["current_stage", "detected_metacog_needs", "response_depth",
-                                 "scaffolding_question", "should_transition", "reasoning"]
-
-            missing_fields = [field for field in required_fields if field not in result]
-            if missing_fields:
-                logger.error(f"Missing required fields in Gemini response: {missing_fields}")
-                logger.error(f"Received result: {result}")
-                return self._create_fallback_response(user_message)
-
-            # Post-process: Ensure detected_metacog_needs is always a list
-            if "detected_metacog_needs" in result:
-                if isinstance(result["detected_metacog_needs"], str):
-                    # Convert string to list
-                    result["detected_metacog_needs"] = [result["detected_metacog_needs"]]
-                    logger.warning(f"Converted detected_metacog_needs from string to list: {result['detected_metacog_needs']}")
-
-                # Validate it's not empty
-                if not result["detected_metacog_needs"]:
-                    logger.warning("Empty detected_metacog_needs, setting default to '점검'")
-                    result["detected_metacog_needs"] = ["점검"]
-
-            logger.info(f"Successfully generated scaffolding for stage: {result.get('current_stage')}, depth: {result.get('response_depth')}")
-            return result
+        Returns:
+            Validated scaffolding dictionary
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse Gemini response as JSON: {e}", exc_info=True)
-            logger.error(f"Raw response: {response.text if 'response' in locals() else 'N/A'}")
-            # Fallback response
-            return self._create_fallback_response(user_message)
+        Raises:
+            ScaffoldingParseError: If the output is empty or does not match either shape
+        """
+        if not result_text:
+            raise ScaffoldingParseError(f"{self.backend.name} backend returned empty response")
 
-        except AttributeError as e:
-            logger.error(f"Gemini API response format error: {e}", exc_info=True)
-            return self._create_fallback_response(user_message)
+        logger.debug(f"Raw Gemini response (first 200 chars): {result_text[:200]}")
 
-        except Exception as e:
-            logger.error(f"Unexpected error generating scaffolding: {e}", exc_info=True)
+        try:
+            parsed = SCAFFOLDING_OUTPUT_ADAPTER.validate_json(_json_object_span(result_text))
+        except ValidationError as e:
+            logger.error(f"Raw response: {result_text}")
+            raise ScaffoldingParseError(
+                f"Gemini response does not match the scaffolding schema: {e.error_count()} errors, "
+                f"first: {e.errors()[0]['msg']}"
+            ) from e
+
+        if is_question and not isinstance(parsed, AnswerModeOutput):
+            logger.warning("⚠️ Answer mode but no answer_message in response!")
+
+        result = parsed.to_scaffolding()
+        logger.info(f"Successfully generated scaffolding for stage: {result['current_stage']}, depth: {result['response_depth']}")
+        return result
+
+    def _handle_generation_error(
+        self,
+        error: Exception,
+        user_message: str,
+        conversation_history: List[Dict[str, str]],
+        current_stage: Optional[str] = None
+    ) -> Dict:
+        """Log a generation failure and return the fallback response"""
+        if isinstance(error, CircuitOpenError):
+            logger.info("LLM circuit breaker open, answering from question bank")
+            return self._create_degraded_response(user_message, current_stage)
+
+        if isinstance(error, ScaffoldingParseError):
+            logger.error(str(error))
+        elif isinstance(error, (LLMQueueFullError, LLMQueueTimeoutError)):
+            logger.warning(f"LLM call not started: {error}")
+        elif isinstance(error, LLMDeadlineExceededError):
+            logger.warning(str(error))
+        elif isinstance(error, AttributeError):
+            logger.error(f"Gemini API response format error: {error}", exc_info=True)
+        else:
+            logger.error(f"Unexpected error generating scaffolding: {error}", exc_info=True)
             logger.error(f"User message: {user_message}")
             logger.error(f"Conversation history length: {len(conversation_history)}")
-            return self._create_fallback_response(user_message)
+        return self._create_fallback_response(user_message)
 
     def _build_context(
         self,
         conversation_history: List[Dict[str, str]],
-        current_stage: Optional[str]
+        current_stage: Optional[str],
+        context_summary: Optional[str] = None
     ) -> str:
-        """Build conversation context string"""
-        if not conversation_history:
+        """Build conversation context string, keeping recent messages within CONTEXT_TOKEN_BUDGET"""
+        if not conversation_history and not context_summary:
             return "없음 (첫 대화)"
 
         context_parts = []
-        for msg in conversation_history[-MAX_CONTEXT_MESSAGES:]:
+        if context_summary:
+            context_parts.append(f"[앞선 대화 요약 - 학습자가 말한 내용]\n{context_summary}\n")
+            context_parts.append("[최근 대화]")
+
+        for msg in fit_to_budget(conversation_history, settings.CONTEXT_TOKEN_BUDGET):
             role = "학습자" if msg["role"] == "user" else "에이전트"
             context_parts.append(f"{role}: {msg['content']}")
 
@@ -442,6 +750,40 @@ JSON 형태로 다음 정보를 제공:
             "reasoning": "시스템 오류로 인한 안전한 기본 응답 제공"
         }
 
+    def _create_degraded_response(self, user_message: str, current_stage: Optional[str]) -> Dict:
+        """Answer from the local question bank without calling the LLM
+
+        Used while the circuit breaker is open. Picks a stage-appropriate
+        metacognitive question, rotating by message so consecutive turns vary.
+        """
+        stage = current_stage or "도전_이해"
+        bank_stage = next((key for key in QUESTION_BANK if stage.startswith(key)), "도전_이해")
+
+        digest = int(hashlib.sha256(user_message.encode("utf-8")).hexdigest(), 16)
+        element = ["점검", "조절", "지식"][digest % 3]
+        questions = get_all_questions(bank_stage, element)
+        if not questions:
+            return self._create_fallback_response(user_message)
+
+        return {
+            "current_stage": stage,
+            "detected_metacog_needs": [element],
+            "response_depth": "medium",
+            "scaffolding_question": questions[(digest // 3) % len(questions)],
+            "should_transition": False,
+            "reasoning": "LLM 서비스 일시 장애로 질문 뱅크 기반 응답 제공"
+        }
+
+    def stats(self) -> Dict:
+        """LLM pipeline state and counters for /health"""
+        return {
+            "backend": self.backend.name,
+            "circuit_breaker": self.circuit_breaker.stats() if self.circuit_breaker is not None else None,
+            "dispatcher": self.dispatcher.stats() if self.dispatcher is not None else None,
+            "retries": self.retrier.stats() if self.retrier is not None else None,
+            "response_cache": self.response_cache.stats() if self.response_cache is not None else None,
+        }
+
 
 # Global service instance
 gemini_service = GeminiService()
@@ -0,0 +1,111 @@
+"""
+Learner message intent detection
+Finds question intent and explicit stage-transition requests in one pass over a shared pattern table
+"""
+from functools import lru_cache
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+# Answer mode is used when any of these appear (or the message contains "?")
+QUESTION_PATTERNS = [
+    '뭐예요', '뭔가요', '무엇인가요', '어떻게', '왜',
+    '이유가', '설명해', '알려줘', '알려주세요',
+    '괜찮나요', '맞나요', '좋나요', '어떤가요',
+    '도와줘', '도와주세요', '의견', '생각'
+]
+
+# Stage named in a transition request, in priority order (None = generic "next stage")
+TRANSITION_KEYWORDS: Dict[str, Optional[str]] = {
+    "아이디어": "아이디어_생성",
+    "아이디어 생성": "아이디어_생성",
+    "다음 단계": None,
+    "실행 준비": "실행_준비",
+    "실행": "실행_준비",
+}
+
+# Verbs that turn a stage keyword into a request to move on
+TRANSITION_INDICATORS = ["넘어가", "이동", "가자", "진행"]
+
+_QUESTION = 1
+_INDICATOR = 2
+
+
+class Intent(NamedTuple):
+    """Intent detected in a learner message"""
+    is_question: bool
+    wants_transition: bool
+    target_stage: Optional[str]  # None with wants_transition means "next stage"
+
+
+class IntentDetector:
+    """
+    Check every question, transition-keyword and indicator pattern in one pass
+
+    All patterns are merged once into a table mapping each literal to its
+    intent flags and keyword priority, so a message is lowercased once and
+    each literal is searched for once. CPython's substring search is faster
+    here than a combined regex alternation (see benchmarks/intent_detection.py).
+    """
+
+    def __init__(
+        self,
+        question_patterns: List[str] = QUESTION_PATTERNS,
+        transition_keywords: Dict[str, Optional[str]] = TRANSITION_KEYWORDS,
+        transition_indicators: List[str] = TRANSITION_INDICATORS
+    ):
+        # Keyword priority follows the dict order, as in the original loop
+        self._keyword_stages = list(transition_keywords.values())
+        priority = {keyword: rank for rank, keyword in enumerate(transition_keywords)}
+        no_keyword = len(self._keyword_stages)
+
+        flags: Dict[str, int] = {}
+        for literal in list(question_patterns) + ["?"]:
+            flags[literal] = flags.get(literal, 0) | _QUESTION
+        for literal in transition_indicators:
+            flags[literal] = flags.get(literal, 0) | _INDICATOR
+        for literal in transition_keywords:
+            flags.setdefault(literal, 0)
+
+        self._table: Tuple[Tuple[str, int, int], ...] = tuple(
+            (literal, literal_flags, priority.get(literal, no_keyword))
+            for literal, literal_flags in flags.items()
+        )
+
+    def detect(self, message: str) -> Intent:
+        """
+        Detect the learner's intent
+
+        Args:
+            message: Learner message
+
+        Returns:
+            Intent with question flag, transition flag and requested stage
+        """
+        text = message.lower()
+        no_keyword = len(self._keyword_stages)
+        flags, rank = 0, no_keyword
+
+        for literal, literal_flags, literal_rank in self._table:
+            if literal in text:
+                flags |= literal_flags
+                if literal_rank < rank:
+                    rank = literal_rank
+
+        wants_transition = rank < no_keyword and bool(flags & _INDICATOR)
+        return Intent(
+            is_question=bool(flags & _QUESTION),
+            wants_transition=wants_transition,
+            target_stage=self._keyword_stages[rank] if wants_transition else None
+        )
+
+
+intent_detector = IntentDetector()
+
+
+@lru_cache(maxsize=256)
+def detect_intent(message: str) -> Intent:
+    """
+    Detect intent with the default patterns
+
+    Cached so the chat endpoint and GeminiService share one scan per message.
+    """
+    return intent_detector.detect(message)
@@ -0,0 +1,328 @@
+"""
+LLM backend implementations for scaffolding generation
+GeminiService builds prompts and parses responses; backends only turn a prompt into raw text
+"""
+from typing import AsyncIterator, Dict, List, Optional, Protocol
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import re
+import time
+
+from ..core.config import Settings, settings
+
+logger = logging.getLogger(__name__)
+
+
+class LLMBackend(Protocol):
+    """Interface for a text generation backend used by GeminiService"""
+
+    name: str
+
+    def generate(self, prompt: str) -> str:
+        """Generate the full response text for a prompt (blocking)"""
+        ...
+
+    async def generate_async(self, prompt: str) -> str:
+        """Generate the full response text for a prompt without blocking the event loop"""
+        ...
+
+    def stream_async(self, prompt: str) -> AsyncIterator[str]:
+        """Yield response text chunks as they are generated"""
+        ...
+
+
+class LLMBackendError(Exception):
+    """Raised when a backend fails to produce a response"""
+
+
+class LLMTransientError(LLMBackendError):
+    """Raised for failures that are worth retrying (timeouts, 5xx, dropped connections)"""
+
+
+class LLMRateLimitError(LLMBackendError):
+    """Raised when the provider rejects a call for exceeding its quota (HTTP 429)"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+_RETRY_AFTER_PATTERNS = [
+    re.compile(r"retry in ([\d.]+)\s*s", re.IGNORECASE),
+    re.compile(r"retry_delay\s*\{\s*seconds:\s*(\d+)", re.IGNORECASE),
+]
+
+
+def _retry_after_hint(error: Exception) -> Optional[float]:
+    """Extract a retry-after delay in seconds from a Google API error, if present"""
+    for detail in getattr(error, "details", None) or []:
+        delay = getattr(detail, "retry_delay", None)
+        if delay is not None:
+            return delay.seconds + delay.nanos / 1e9
+
+    for pattern in _RETRY_AFTER_PATTERNS:
+        match = pattern.search(str(error))
+        if match:
+            return float(match.group(1))
+
+    return None
+
+
+# Response schema for Gemini's JSON mode (OpenAPI subset, no anyOf), so it
+# covers both the question-mode and answer-mode shapes; exact validation
+# happens in GeminiService
+SCAFFOLDING_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "current_stage": {"type": "string"},
+        "detected_metacog_needs": {"type": "array", "items": {"type": "string", "enum": ["점검", "조절", "지식"]}},
+        "response_depth": {"type": "string", "enum": ["shallow", "medium", "deep"]},
+        "scaffolding_question": {"type": "string"},
+        "answer_message": {"type": "string"},
+        "follow_up_question": {"type": "string"},
+        "should_transition": {"type": "boolean"},
+        "reasoning": {"type": "string"},
+    },
+    "required": ["current_stage", "detected_metacog_needs", "response_depth", "should_transition", "reasoning"],
+}
+
+
+class GeminiBackend:
+    """Google Gemini backend using the google-generativeai SDK"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: str, model_name: str, json_mode: bool = True):
+        """
+        Configure the Gemini SDK
+
+        Args:
+            api_key: Gemini API key
+            model_name: Gemini model name
+            json_mode: Ask for schema-constrained JSON output
+
+        Raises:
+            ValueError: If the API key is missing or SDK initialization fails
+        """
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY environment variable is not set")
+
+        # Imported lazily so the local backend works without the SDK installed
+        import google.generativeai as genai
+
+        try:
+            genai.configure(api_key=api_key)
+            self.model = genai.GenerativeModel(model_name)
+            self.generation_config = genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=SCAFFOLDING_RESPONSE_SCHEMA
+            ) if json_mode else None
+            logger.info(f"Gemini API initialized with model: {model_name}")
+        except Exception as e:
+            logger.error(f"Failed to initialize Gemini API: {e}", exc_info=True)
+            raise ValueError(f"Failed to configure Gemini API: {e}") from e
+
+        from google.api_core import exceptions as google_exceptions
+        self._rate_limit_errors = (google_exceptions.ResourceExhausted, google_exceptions.TooManyRequests)
+        self._transient_errors = (
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.InternalServerError,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.GatewayTimeout,
+        )
+
+    def generate(self, prompt: str) -> str:
+        try:
+            response = self.model.generate_content(prompt, generation_config=self.generation_config)
+        except self._rate_limit_errors as e:
+            raise LLMRateLimitError(str(e), _retry_after_hint(e)) from e
+        except self._transient_errors as e:
+            raise LLMTransientError(str(e)) from e
+        return response.text if response else ""
+
+    async def generate_async(self, prompt: str) -> str:
+        try:
+            response = await self.model.generate_content_async(prompt, generation_config=self.generation_config)
+        except self._rate_limit_errors as e:
+            raise LLMRateLimitError(str(e), _retry_after_hint(e)) from e
+        except self._transient_errors as e:
+            raise LLMTransientError(str(e)) from e
+        return response.text if response else ""
+
+    async def stream_async(self, prompt: str) -> AsyncIterator[str]:
+        try:
+            response = await self.model.generate_content_async(
+                prompt, generation_config=self.generation_config, stream=True
+            )
+            async for chunk in response:
+                if chunk.text:
+                    yield chunk.text
+        except self._rate_limit_errors as e:
+            raise LLMRateLimitError(str(e), _retry_after_hint(e)) from e
+        except self._transient_errors as e:
+            raise LLMTransientError(str(e)) from e
+
+
+# Canned outputs used by LocalBackend when no responses file is configured
+DEFAULT_LOCAL_RESPONSES: Dict[str, List[Dict]] = {
+    "question": [
+        {
+            "current_stage": "도전_이해",
+            "detected_metacog_needs": ["점검"],
+            "response_depth": "medium",
+            "scaffolding_question": "해당 문제의 난이도는 어느 정도라고 판단되나요? 그 이유는 무엇인가요?",
+            "should_transition": False,
+            "reasoning": "로컬 백엔드 응답: 문제 난이도 점검"
+        },
+        {
+            "current_stage": "도전_이해",
+            "detected_metacog_needs": ["지식"],
+            "response_depth": "shallow",
+            "scaffolding_question": "이전에 비슷한 문제를 해결해 본 경험이 있다면 어떤 방법이 효과적이었나요?",
+            "should_transition": False,
+            "reasoning": "로컬 백엔드 응답: 사전 경험 활성화"
+        },
+        {
+            "current_stage": "아이디어_생성",
+            "detected_metacog_needs": ["조절"],
+            "response_depth": "deep",
+            "scaffolding_question": "지금 떠올린 아이디어를 어떻게 더 발전시킬 수 있을까요?",
+            "should_transition": False,
+            "reasoning": "로컬 백엔드 응답: 아이디어 발전 촉진"
+        },
+    ],
+    "answer": [
+        {
+            "current_stage": "도전_이해",
+            "detected_metacog_needs": ["지식"],
+            "response_depth": "medium",
+            "answer_message": "창의적 문제해결은 도전 이해, 아이디어 생성, 실행 준비 단계로 진행됩니다.",
+            "follow_up_question": "지금 고민하는 문제는 어느 단계에 가깝다고 생각하시나요?",
+            "should_transition": False,
+            "reasoning": "로컬 백엔드 응답: 개념 설명"
+        },
+    ],
+}
+
+# Marker that only appears in the answer-mode prompt
+_ANSWER_MODE_MARKER = "answer_message"
+
+
+class LocalBackend:
+    """
+    Deterministic offline backend for load testing and benchmarking
+
+    Returns canned JSON responses chosen by a hash of the prompt, with
+    configurable latency and error rate. Needs no network or API key.
+    """
+
+    name = "local"
+
+    def __init__(
+        self,
+        latency_ms: int = 0,
+        latency_jitter_ms: int = 0,
+        error_rate: float = 0.0,
+        responses: Optional[Dict[str, List[Dict]]] = None,
+        seed: int = 0,
+        stream_chunk_size: int = 16
+    ):
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.error_rate = error_rate
+        self.responses = responses or DEFAULT_LOCAL_RESPONSES
+        self.stream_chunk_size = max(1, stream_chunk_size)
+        self._random = random.Random(seed)
+
+        for mode in ("question", "answer"):
+            if not self.responses.get(mode):
+                raise ValueError(f"Local LLM responses must include at least one '{mode}' entry")
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "LocalBackend":
+        """
+        Create a backend with canned responses loaded from a JSON file
+
+        The file must contain {"question": [...], "answer": [...]} lists of
+        response objects in the same shape Gemini is asked to produce.
+        """
+        with open(path, encoding="utf-8") as f:
+            responses = json.load(f)
+        return cls(responses=responses, **kwargs)
+
+    def _pick_response(self, prompt: str) -> str:
+        """Choose a canned response deterministically from the prompt"""
+        mode = "answer" if _ANSWER_MODE_MARKER in prompt.split("이전 대화:")[-1] else "question"
+        candidates = self.responses[mode]
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        index = int.from_bytes(digest[:4], "big") % len(candidates)
+        return json.dumps(candidates[index], ensure_ascii=False)
+
+    def _next_delay(self) -> float:
+        """Latency for the next call in seconds"""
+        jitter = self._random.uniform(-self.latency_jitter_ms, self.latency_jitter_ms) if self.latency_jitter_ms else 0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def _maybe_fail(self) -> None:
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise LLMTransientError("Simulated local backend error")
+
+    def generate(self, prompt: str) -> str:
+        time.sleep(self._next_delay())
+        self._maybe_fail()
+        return self._pick_response(prompt)
+
+    async def generate_async(self, prompt: str) -> str:
+        await asyncio.sleep(self._next_delay())
+        self._maybe_fail()
+        return self._pick_response(prompt)
+
+    async def stream_async(self, prompt: str) -> AsyncIterator[str]:
+        text = self._pick_response(prompt)
+        chunks = [text[i:i + self.stream_chunk_size] for i in range(0, len(text), self.stream_chunk_size)]
+        delay = self._next_delay() / max(1, len(chunks))
+        self._maybe_fail()
+        for chunk in chunks:
+            await asyncio.sleep(delay)
+            yield chunk
+
+
+def create_backend(config: Settings = settings) -> LLMBackend:
+    """
+    Create the LLM backend selected by LLM_BACKEND
+
+    Args:
+        config: Application settings
+
+    Returns:
+        Configured backend instance
+
+    Raises:
+        ValueError: If LLM_BACKEND is unknown or the backend cannot be configured
+    """
+    backend_name = config.LLM_BACKEND.lower()
+
+    if backend_name == "gemini":
+        return GeminiBackend(config.GEMINI_API_KEY, config.GEMINI_MODEL, json_mode=config.GEMINI_JSON_MODE)
+
+    if backend_name == "local":
+        options = dict(
+            latency_ms=config.LOCAL_LLM_LATENCY_MS,
+            latency_jitter_ms=config.LOCAL_LLM_LATENCY_JITTER_MS,
+            error_rate=config.LOCAL_LLM_ERROR_RATE,
+            seed=config.LOCAL_LLM_SEED,
+        )
+        if config.LOCAL_LLM_RESPONSES_PATH:
+            backend = LocalBackend.from_file(config.LOCAL_LLM_RESPONSES_PATH, **options)
+        else:
+            backend = LocalBackend(**options)
+        logger.info(
+            f"Local LLM backend initialized (latency={config.LOCAL_LLM_LATENCY_MS}ms, "
+            f"error_rate={config.LOCAL_LLM_ERROR_RATE})"
+        )
+        return backend
+
+    raise ValueError(f"Unknown LLM_BACKEND: {config.LLM_BACKEND}")
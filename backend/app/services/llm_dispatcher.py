@@ -0,0 +1,251 @@
+"""
+Concurrency and rate control for LLM calls
+Queues bursts of chat requests instead of letting them all hit the provider at once
+"""
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+import asyncio
+import logging
+import time
+
+from ..core.config import Settings, settings
+from .llm_backends import LLMBackendError, LLMRateLimitError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Backoff used when a 429 carries no retry-after hint
+DEFAULT_RATE_LIMIT_BACKOFF_SECONDS = 1.0
+MAX_RATE_LIMIT_BACKOFF_SECONDS = 30.0
+
+
+class LLMQueueFullError(LLMBackendError):
+    """Raised when too many calls are already waiting for a slot"""
+
+
+class LLMQueueTimeoutError(LLMBackendError):
+    """Raised when a call could not start within the maximum wait time"""
+
+
+class TokenBucket:
+    """Requests-per-minute limiter with a configurable burst size"""
+
+    def __init__(self, requests_per_minute: int, burst: int, clock: Callable[[], float] = time.monotonic):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self._clock = clock
+        self._updated_at = clock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def try_take(self) -> float:
+        """
+        Take a token if one is available
+
+        Returns:
+            0.0 if a token was taken, otherwise seconds until the next token
+        """
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class LLMDispatcher:
+    """
+    Gate for outgoing LLM calls
+
+    Limits the number of calls in flight, spaces them with a token bucket,
+    and pauses all calls when the provider returns 429 with a retry-after
+    hint. Calls that cannot start within max_wait_seconds fail with
+    LLMQueueTimeoutError; callers beyond max_queue_size are rejected with
+    LLMQueueFullError so a burst cannot pile up unbounded work.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 16,
+        requests_per_minute: int = 0,
+        burst: Optional[int] = None,
+        max_wait_seconds: float = 20.0,
+        max_queue_size: int = 100,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_wait_seconds = max_wait_seconds
+        self.max_queue_size = max_queue_size
+        self._clock = clock
+        self._bucket = (
+            TokenBucket(requests_per_minute, burst or self.max_in_flight, clock)
+            if requests_per_minute > 0 else None
+        )
+        self._blocked_until = 0.0
+        self._consecutive_rate_limits = 0
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+        self.in_flight = 0
+        self.waiting = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.rate_limited = 0
+        self.max_queue_depth_seen = 0
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        """Semaphore bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._semaphore
+
+    async def _acquire_slot(self, deadline: float) -> None:
+        """Wait for an in-flight slot, respecting the queue limits"""
+        semaphore = self._get_semaphore()
+
+        if not semaphore.locked():
+            # Free slot: acquire() returns without suspending
+            await semaphore.acquire()
+            self.in_flight += 1
+            return
+
+        if self.waiting >= self.max_queue_size:
+            self.rejected += 1
+            raise LLMQueueFullError(f"LLM queue is full ({self.waiting} waiting)")
+
+        self.waiting += 1
+        self.max_queue_depth_seen = max(self.max_queue_depth_seen, self.waiting)
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=max(0.0, deadline - self._clock()))
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise LLMQueueTimeoutError(f"Waited more than {self.max_wait_seconds}s for an LLM slot")
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+
+    def _release_slot(self) -> None:
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def _wait_for_permit(self, deadline: float) -> None:
+        """Wait out any 429 pause and take a token from the bucket"""
+        while True:
+            now = self._clock()
+            delay = max(0.0, self._blocked_until - now)
+            if delay == 0.0 and self._bucket is not None:
+                delay = self._bucket.try_take()
+            if delay == 0.0:
+                return
+
+            if now + delay > deadline:
+                self.timed_out += 1
+                raise LLMQueueTimeoutError(f"Rate limit would delay the call beyond {self.max_wait_seconds}s")
+            await asyncio.sleep(delay)
+
+    def _record_rate_limit(self, error: LLMRateLimitError) -> float:
+        """Pause outgoing calls after a 429 and return the pause length"""
+        self.rate_limited += 1
+        self._consecutive_rate_limits += 1
+
+        if error.retry_after is not None:
+            pause = error.retry_after
+        else:
+            pause = min(
+                MAX_RATE_LIMIT_BACKOFF_SECONDS,
+                DEFAULT_RATE_LIMIT_BACKOFF_SECONDS * 2 ** (self._consecutive_rate_limits - 1)
+            )
+
+        self._blocked_until = max(self._blocked_until, self._clock() + pause)
+        logger.warning(f"LLM provider rate limited the request, pausing calls for {pause:.1f}s")
+        return pause
+
+    async def run(self, call: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run an LLM call once a slot and a rate-limit permit are available
+
+        Calls rejected with 429 are retried after the provider's retry-after
+        delay as long as that still fits within max_wait_seconds.
+
+        Args:
+            call: Zero-argument coroutine factory performing the request
+
+        Returns:
+            The call's result
+        """
+        deadline = self._clock() + self.max_wait_seconds
+        await self._acquire_slot(deadline)
+        try:
+            while True:
+                await self._wait_for_permit(deadline)
+                try:
+                    result = await call()
+                except LLMRateLimitError as e:
+                    pause = self._record_rate_limit(e)
+                    if self._clock() + pause > deadline:
+                        raise
+                    continue
+
+                self._consecutive_rate_limits = 0
+                self.completed += 1
+                return result
+        finally:
+            self._release_slot()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """
+        Hold a slot and permit for work that cannot simply be retried (streaming)
+
+        Usage:
+            async with dispatcher.slot():
+                async for chunk in backend.stream_async(prompt):
+                    ...
+        """
+        deadline = self._clock() + self.max_wait_seconds
+        await self._acquire_slot(deadline)
+        try:
+            await self._wait_for_permit(deadline)
+            try:
+                yield
+            except LLMRateLimitError as e:
+                self._record_rate_limit(e)
+                raise
+            self._consecutive_rate_limits = 0
+            self.completed += 1
+        finally:
+            self._release_slot()
+
+    def stats(self) -> Dict:
+        """Queue and rate-limit counters for monitoring"""
+        return {
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_in_flight": self.max_in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+            "rate_limited": self.rate_limited,
+            "max_queue_depth_seen": self.max_queue_depth_seen,
+            "paused_for_seconds": round(max(0.0, self._blocked_until - self._clock()), 3),
+        }
+
+
+def create_dispatcher(config: Settings = settings) -> LLMDispatcher:
+    """Create the LLM dispatcher configured by LLM_* settings"""
+    return LLMDispatcher(
+        max_in_flight=config.LLM_MAX_IN_FLIGHT,
+        requests_per_minute=config.LLM_REQUESTS_PER_MINUTE,
+        burst=config.LLM_BURST or None,
+        max_wait_seconds=config.LLM_QUEUE_MAX_WAIT_SECONDS,
+        max_queue_size=config.LLM_MAX_QUEUE_SIZE
+    )
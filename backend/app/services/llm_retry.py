@@ -0,0 +1,246 @@
+"""
+Deadline-budgeted retries and hedged requests for LLM calls
+Keeps a single slow or failed Gemini call from costing the learner the whole turn
+"""
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional, Set, Tuple, Type, TypeVar
+import asyncio
+import logging
+import random
+import time
+
+from ..core.config import Settings, settings
+from .llm_backends import LLMBackendError, LLMTransientError
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class LLMDeadlineExceededError(LLMBackendError):
+    """Raised when no attempt succeeded within the request's deadline budget"""
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, window: int = 200):
+        self._samples: deque = deque(maxlen=window)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Latency at the given percentile (0-1), or None without samples"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+        return ordered[index]
+
+
+class DeadlineRetrier:
+    """
+    Run an LLM call within a deadline, retrying transient failures
+
+    Each attempt gets the remaining budget as its timeout. Retries use
+    full-jitter exponential backoff and are skipped when the backoff would
+    not leave time for another attempt. With hedging enabled, a second
+    attempt is started when the first has not answered by the observed
+    p90 latency (or a fixed delay) and whichever succeeds first wins.
+    """
+
+    def __init__(
+        self,
+        deadline_seconds: float = 6.0,
+        max_attempts: int = 3,
+        base_delay_seconds: float = 0.2,
+        max_delay_seconds: float = 1.0,
+        hedging_enabled: bool = False,
+        hedge_delay_seconds: float = 0.0,
+        hedge_percentile: float = 0.9,
+        hedge_min_samples: int = 20,
+        retryable_errors: Tuple[Type[BaseException], ...] = (LLMTransientError, ConnectionError),
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.deadline_seconds = deadline_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.hedging_enabled = hedging_enabled
+        self.hedge_delay_seconds = hedge_delay_seconds
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.retryable_errors = retryable_errors
+        self.latencies = LatencyTracker()
+        self._clock = clock
+        self._random = random.Random()
+
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.successes = 0
+        self.failures = 0
+        self.deadline_exceeded = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+
+    def _hedge_delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None if hedging should not happen"""
+        if not self.hedging_enabled:
+            return None
+        if self.hedge_delay_seconds > 0:
+            return self.hedge_delay_seconds
+        if len(self.latencies) < self.hedge_min_samples:
+            return None
+        return self.latencies.percentile(self.hedge_percentile)
+
+    def _backoff(self, retry_number: int) -> float:
+        """Full-jitter exponential backoff for the given retry (1-based)"""
+        ceiling = min(self.max_delay_seconds, self.base_delay_seconds * 2 ** (retry_number - 1))
+        return self._random.uniform(0, ceiling)
+
+    async def _timed(self, call: Callable[[], Awaitable[T]], latency_of: Optional[Callable[[T], float]]) -> T:
+        """Run one attempt and record its latency on success"""
+        self.attempts += 1
+        started = self._clock()
+        result = await call()
+        self.latencies.record(latency_of(result) if latency_of is not None else self._clock() - started)
+        return result
+
+    async def _attempt(
+        self,
+        call: Callable[[], Awaitable[T]],
+        timeout: float,
+        latency_of: Optional[Callable[[T], float]] = None
+    ) -> T:
+        """Run one attempt, hedging it with a duplicate if it is slow"""
+        hedge_delay = self._hedge_delay()
+        if hedge_delay is None or hedge_delay >= timeout:
+            return await asyncio.wait_for(self._timed(call, latency_of), timeout=timeout)
+
+        deadline = self._clock() + timeout
+        primary = asyncio.ensure_future(self._timed(call, latency_of))
+        tasks: Set[asyncio.Future] = {primary}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+            if not done:
+                self.hedges_fired += 1
+                logger.info(f"LLM call slower than {hedge_delay:.2f}s, sending hedged request")
+                tasks.add(asyncio.ensure_future(self._timed(call, latency_of)))
+
+            last_error: Optional[BaseException] = None
+            pending = tasks
+            while pending:
+                remaining = deadline - self._clock()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.hedges_won += 1
+                        return task.result()
+                    last_error = task.exception()
+
+            if last_error is not None and not pending:
+                raise last_error
+            raise asyncio.TimeoutError()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def call(
+        self,
+        call: Callable[[], Awaitable[T]],
+        started_at: Optional[float] = None,
+        latency_of: Optional[Callable[[T], float]] = None
+    ) -> T:
+        """
+        Run call() until it succeeds, fails permanently or the deadline passes
+
+        Args:
+            call: Zero-argument coroutine factory performing one attempt
+            started_at: Clock reading the deadline counts from, e.g. when
+                the request arrived; defaults to now
+            latency_of: Reads the backend seconds from a result, for calls
+                that also spend time queueing; by default the whole
+                attempt is timed
+
+        Returns:
+            The first successful result
+
+        Raises:
+            LLMDeadlineExceededError: If the budget ran out
+            Exception: The last non-retryable or final error from call()
+        """
+        self.calls += 1
+        deadline = (self._clock() if started_at is None else started_at) + self.deadline_seconds
+
+        for attempt in range(1, self.max_attempts + 1):
+            remaining = deadline - self._clock()
+            if remaining <= 0:
+                break
+
+            try:
+                result = await self._attempt(call, remaining, latency_of)
+                self.successes += 1
+                return result
+            except asyncio.TimeoutError:
+                break
+            except self.retryable_errors as e:
+                if attempt == self.max_attempts:
+                    self.failures += 1
+                    raise
+
+                delay = self._backoff(attempt)
+                if self._clock() + delay >= deadline:
+                    self.failures += 1
+                    raise
+                logger.warning(f"Transient LLM error (attempt {attempt}/{self.max_attempts}): {e}; retrying in {delay:.2f}s")
+                self.retries += 1
+                await asyncio.sleep(delay)
+            except Exception:
+                self.failures += 1
+                raise
+
+        self.deadline_exceeded += 1
+        raise LLMDeadlineExceededError(f"No LLM response within {self.deadline_seconds}s")
+
+    def stats(self) -> Dict:
+        """Retry and hedging counters for monitoring"""
+        p90 = self.latencies.percentile(0.9)
+        return {
+            "calls": self.calls,
+            "attempts": self.attempts,
+            "retries": self.retries,
+            "successes": self.successes,
+            "failures": self.failures,
+            "deadline_exceeded": self.deadline_exceeded,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "latency_p90_seconds": round(p90, 3) if p90 is not None else None,
+        }
+
+
+def create_retrier(config: Settings = settings, retryable_errors: Optional[Tuple[Type[BaseException], ...]] = None) -> DeadlineRetrier:
+    """Create the retrier configured by LLM_* settings"""
+    options = {}
+    if retryable_errors is not None:
+        options["retryable_errors"] = retryable_errors
+    return DeadlineRetrier(
+        deadline_seconds=config.LLM_DEADLINE_SECONDS,
+        max_attempts=config.LLM_MAX_ATTEMPTS,
+        base_delay_seconds=config.LLM_RETRY_BASE_DELAY_SECONDS,
+        max_delay_seconds=config.LLM_RETRY_MAX_DELAY_SECONDS,
+        hedging_enabled=config.LLM_HEDGING_ENABLED,
+        hedge_delay_seconds=config.LLM_HEDGE_DELAY_SECONDS,
+        hedge_percentile=config.LLM_HEDGE_PERCENTILE,
+        **options
+    )
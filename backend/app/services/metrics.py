@@ -0,0 +1,148 @@
+"""
+Prometheus metrics
+With PROMETHEUS_MULTIPROC_DIR set, every worker writes its samples to that directory and /metrics on any worker reports the sum
+"""
+from typing import Optional, Tuple
+import logging
+import os
+import time
+
+from ..core.config import settings
+
+# prometheus_client chooses between in-memory and file-backed values when it is first imported
+if settings.PROMETHEUS_MULTIPROC_DIR:
+    os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", settings.PROMETHEUS_MULTIPROC_DIR)
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from prometheus_client import multiprocess
+
+logger = logging.getLogger(__name__)
+
+# Chat turns wait for the LLM, so latency buckets reach well past the default 10s
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0, 60.0)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HTTP_REQUEST_DURATION = Histogram(
+    "cps_http_request_duration_seconds",
+    "HTTP request latency until the response is fully sent, by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_REQUESTS = Counter(
+    "cps_llm_requests_total",
+    "Scaffolding generations by outcome (ok, parse_error, timeout, fallback) and mode (question, answer)",
+    ["outcome", "mode"]
+)
+LLM_REQUEST_DURATION = Histogram(
+    "cps_llm_request_duration_seconds",
+    "Scaffolding generation latency, including dispatcher queueing and retries",
+    ["outcome"],
+    buckets=LATENCY_BUCKETS
+)
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "cps_db_pool_checkout_wait_seconds",
+    "Time to check a connection out of the pool, including opening a new one",
+    ["engine"],
+    buckets=POOL_WAIT_BUCKETS
+)
+DB_POOL_CHECKOUT_TIMEOUTS = Counter(
+    "cps_db_pool_checkout_timeouts_total",
+    "Checkouts that gave up after DB_POOL_TIMEOUT_SECONDS",
+    ["engine"]
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "cps_db_pool_checked_out_connections",
+    "Connections currently checked out of the pool",
+    ["engine"],
+    multiprocess_mode="livesum"
+)
+STAGE_TRANSITIONS = Counter(
+    "cps_stage_transitions_total",
+    "Recorded CPS stage transitions",
+    ["from_stage", "to_stage"]
+)
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    HTTP_REQUEST_DURATION.labels(method, route, str(status)).observe(seconds)
+
+
+def observe_llm_call(outcome: str, is_question: Optional[bool], seconds: float) -> None:
+    """
+    Record a scaffolding generation
+
+    Args:
+        outcome: "ok", "parse_error", "timeout" or "fallback"
+        is_question: Whether the learner asked a question (answer mode); None if not determined
+        seconds: Time from request to result
+    """
+    mode = "unknown" if is_question is None else ("answer" if is_question else "question")
+    LLM_REQUESTS.labels(outcome, mode).inc()
+    LLM_REQUEST_DURATION.labels(outcome).observe(seconds)
+
+
+def observe_pool_checkout(engine: str, seconds: float, timed_out: bool = False) -> None:
+    DB_POOL_CHECKOUT_WAIT.labels(engine).observe(seconds)
+    if timed_out:
+        DB_POOL_CHECKOUT_TIMEOUTS.labels(engine).inc()
+
+
+def track_checked_out(engine: str, delta: int) -> None:
+    DB_POOL_CHECKED_OUT.labels(engine).inc(delta)
+
+
+def count_stage_transition(from_stage: Optional[str], to_stage: str) -> None:
+    STAGE_TRANSITIONS.labels(from_stage or "none", to_stage).inc()
+
+
+def render_metrics() -> Tuple[bytes, str]:
+    """
+    Metrics in the Prometheus text format
+
+    Returns:
+        Tuple of (body, content type)
+    """
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: Optional[int] = None) -> None:
+    """Drop an exiting worker's live gauges from multiprocess metrics"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        multiprocess.mark_process_dead(pid or os.getpid())
+
+
+class RequestMetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request by its route template
+
+    The timer stops when the last body chunk is sent, so streamed responses
+    are measured in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router adds the matched route to the scope
+            route = scope.get("route")
+            observe_request(scope["method"], getattr(route, "path", "unmatched"), status, time.perf_counter() - started)
@@ -0,0 +1,118 @@
+"""
+Cache for results of expensive read queries (total counts for research listings, analytics summaries)
+"""
+from typing import Any, Dict, Optional
+import copy
+import json
+import logging
+
+from ..core.config import Settings, settings
+from .response_cache import CacheBackend, InMemoryCacheBackend, RedisCacheBackend
+
+logger = logging.getLogger(__name__)
+
+
+def query_cache_key(query: str, **filters: Any) -> str:
+    """Cache key of a named query and its filter values"""
+    return json.dumps([query, sorted(filters.items())], ensure_ascii=False, default=str)
+
+
+class QueryCache:
+    """Query results stored in a cache backend, with hit/miss counters"""
+
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Look up a cached result; None on miss or backend error"""
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Query cache lookup failed: {e}")
+            value = None
+
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Dict) -> None:
+        """Store a computed result"""
+        try:
+            self.backend.set(key, copy.deepcopy(value))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Query cache store failed: {e}")
+
+    def clear(self) -> None:
+        """Remove all entries and reset counters"""
+        self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+def create_count_cache(config: Settings = settings) -> Optional[QueryCache]:
+    """
+    Create the cache of research listing totals selected by COUNT_CACHE_* settings
+
+    Returns:
+        QueryCache, or None if caching is disabled
+    """
+    if not config.COUNT_CACHE_ENABLED:
+        return None
+
+    backend_name = config.COUNT_CACHE_BACKEND.lower()
+    if backend_name == "redis":
+        backend = RedisCacheBackend(config.REDIS_URL, ttl_seconds=config.COUNT_CACHE_TTL_SECONDS, prefix="cps:count-cache:")
+    elif backend_name == "memory":
+        backend = InMemoryCacheBackend(max_entries=config.COUNT_CACHE_MAX_ENTRIES, ttl_seconds=config.COUNT_CACHE_TTL_SECONDS)
+    else:
+        raise ValueError(f"Unknown COUNT_CACHE_BACKEND: {config.COUNT_CACHE_BACKEND}")
+
+    logger.info(f"Count cache enabled ({backend_name}, ttl={config.COUNT_CACHE_TTL_SECONDS}s)")
+    return QueryCache(backend)
+
+
+count_cache = create_count_cache()
+
+
+def create_analytics_cache(config: Settings = settings) -> Optional[QueryCache]:
+    """
+    Create the in-process cache of research analytics summaries
+
+    Keys include the conversations high-water mark, so entries go stale as
+    soon as new data arrives; ANALYTICS_CACHE_TTL_SECONDS bounds how long
+    metric-only changes can go unseen.
+
+    Returns:
+        QueryCache, or None if caching is disabled
+    """
+    if not config.ANALYTICS_CACHE_ENABLED:
+        return None
+
+    backend = InMemoryCacheBackend(
+        max_entries=config.ANALYTICS_CACHE_MAX_ENTRIES, ttl_seconds=config.ANALYTICS_CACHE_TTL_SECONDS
+    )
+    logger.info(f"Analytics cache enabled (ttl={config.ANALYTICS_CACHE_TTL_SECONDS}s)")
+    return QueryCache(backend)
+
+
+analytics_cache = create_analytics_cache()
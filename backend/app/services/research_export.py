@@ -0,0 +1,285 @@
+"""
+Streaming research exports
+Rows are formatted chunk by chunk as they come off the database cursor, so memory use does not grow with the export
+"""
+from sqlalchemy import JSON, Boolean, DateTime, Float, Integer
+from sqlalchemy.orm import Session as SQLAlchemySession
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from datetime import datetime
+import csv
+import importlib.util
+import io
+import json
+import logging
+
+from .. import crud
+from ..models.database import Session
+
+logger = logging.getLogger(__name__)
+
+
+def csv_value(value: Any) -> Any:
+    """Format a column value for CSV: lists comma-joined, timestamps in ISO 8601"""
+    if isinstance(value, list):
+        return ",".join(str(item) for item in value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def stream_csv(
+    session_factory: Callable[[], SQLAlchemySession],
+    query,
+    columns: Sequence[Tuple[str, Any]],
+    chunk_size: int = 1000
+) -> Iterator[str]:
+    """
+    Generate a CSV export, one piece of text per chunk of rows
+
+    The generator opens its own database session, since it runs after the
+    request's dependencies have been closed.
+
+    Args:
+        session_factory: Creates the database session for the export
+        query: Select of the export columns
+        columns: (name, column) pairs of the query, for the header
+        chunk_size: Rows per database fetch and per yielded piece
+
+    Yields:
+        CSV text, starting with the header line
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow([name for name, _ in columns])
+    yield buffer.getvalue()
+
+    rows = 0
+    with session_factory() as db:
+        try:
+            for chunk in crud.iter_export_chunks(db, query, chunk_size):
+                buffer.seek(0)
+                buffer.truncate(0)
+                writer.writerows([csv_value(value) for value in row] for row in chunk)
+                rows += len(chunk)
+                yield buffer.getvalue()
+        except Exception as e:
+            logger.error(f"CSV export failed after {rows} rows: {e}", exc_info=True)
+            raise
+
+    logger.info(f"CSV export finished: {rows} rows")
+
+
+def parquet_available() -> bool:
+    """Whether pyarrow is installed, which Parquet exports need"""
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands its bytes out in pieces instead of keeping them"""
+
+    def __init__(self):
+        super().__init__()
+        self._pieces: List[bytes] = []
+        self._position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._pieces.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._pieces)
+        self._pieces.clear()
+        return data
+
+
+def arrow_schema(columns: Sequence[Tuple[str, Any]]):
+    """
+    Arrow schema of export columns, typed from their SQLAlchemy column types
+
+    JSON columns (metacog_elements, stages_completed) hold lists of strings
+    and become list columns.
+    """
+    import pyarrow as pa
+
+    fields = []
+    for name, column in columns:
+        column_type = column.type
+        if isinstance(column_type, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column_type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column_type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column_type, DateTime):
+            arrow_type = pa.timestamp("us")
+        elif isinstance(column_type, JSON):
+            arrow_type = pa.list_(pa.string())
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+
+def stream_parquet(
+    session_factory: Callable[[], SQLAlchemySession],
+    query,
+    columns: Sequence[Tuple[str, Any]],
+    chunk_size: int = 1000,
+    row_group_rows: int = 50000
+) -> Iterator[bytes]:
+    """
+    Generate a Parquet export from chunked reads
+
+    Each chunk of rows becomes an Arrow record batch; batches are written as
+    one row group per row_group_rows rows, and the encoded bytes are yielded
+    as soon as a row group is complete. Memory use is bounded by one row
+    group.
+
+    Args:
+        session_factory: Creates the database session for the export
+        query: Select of the export columns
+        columns: (name, column) pairs of the query
+        chunk_size: Rows per database fetch and record batch
+        row_group_rows: Rows per Parquet row group
+
+    Yields:
+        Parquet file bytes
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = arrow_schema(columns)
+    sink = _ChunkSink()
+    batches = []
+    pending = 0
+    rows = 0
+
+    with session_factory() as db, pq.ParquetWriter(sink, schema) as writer:
+        try:
+            for chunk in crud.iter_export_chunks(db, query, chunk_size):
+                batches.append(pa.RecordBatch.from_arrays(
+                    [pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)],
+                    schema=schema
+                ))
+                pending += len(chunk)
+                rows += len(chunk)
+                if pending >= row_group_rows:
+                    writer.write_table(pa.Table.from_batches(batches, schema=schema))
+                    batches, pending = [], 0
+                    yield sink.drain()
+            if batches:
+                writer.write_table(pa.Table.from_batches(batches, schema=schema))
+        except Exception as e:
+            logger.error(f"Parquet export failed after {rows} rows: {e}", exc_info=True)
+            raise
+
+    # Closing the writer appends the footer
+    yield sink.drain()
+    logger.info(f"Parquet export finished: {rows} rows")
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def session_bundle(session: Session) -> Dict[str, Any]:
+    """
+    A session with its conversations, stage transitions and metrics nested
+
+    Children are ordered by id, which is their creation order.
+    """
+    metrics = session.metrics[0] if session.metrics else None
+    return {
+        "session_id": session.id,
+        "user_id": session.user_id,
+        "assignment_text": session.assignment_text,
+        "created_at": _isoformat(session.created_at),
+        "updated_at": _isoformat(session.updated_at),
+        "completed_at": _isoformat(session.completed_at),
+        "is_active": session.is_active,
+        "conversations": [
+            {
+                "id": c.id,
+                "role": c.role,
+                "message": c.message,
+                "cps_stage": c.cps_stage,
+                "metacog_elements": c.metacog_elements,
+                "response_depth": c.response_depth,
+                "should_transition": c.should_transition,
+                "reasoning": c.reasoning,
+                "llm_latency_ms": c.llm_latency_ms,
+                "db_latency_ms": c.db_latency_ms,
+                "total_latency_ms": c.total_latency_ms,
+                "created_at": _isoformat(c.created_at)
+            }
+            for c in sorted(session.conversations, key=lambda c: c.id)
+        ],
+        "transitions": [
+            {
+                "id": t.id,
+                "from_stage": t.from_stage,
+                "to_stage": t.to_stage,
+                "transition_reason": t.transition_reason,
+                "message_count": t.message_count,
+                "created_at": _isoformat(t.created_at)
+            }
+            for t in sorted(session.stage_transitions, key=lambda t: t.id)
+        ],
+        "metrics": _metric_fields(metrics) if metrics else None,
+    }
+
+
+def _metric_fields(metrics) -> Dict[str, Any]:
+    """Columns of the metrics export, without the keys already on the bundle"""
+    fields = {}
+    for name, _ in crud.METRIC_EXPORT_COLUMNS:
+        if name in ("session_id", "user_id"):
+            continue
+        value = getattr(metrics, name)
+        fields[name] = _isoformat(value) if isinstance(value, datetime) else value
+    return fields
+
+
+def stream_session_bundles(
+    session_factory: Callable[[], SQLAlchemySession],
+    query,
+    chunk_size: int = 100
+) -> Iterator[str]:
+    """
+    Generate an NDJSON export, one line per session bundle
+
+    Sessions are read chunk_size at a time; the children of each chunk are
+    loaded by the query's selectinload options in one query per
+    relationship. The session's identity map holds objects weakly, so a
+    chunk's objects are released once its lines are built.
+
+    Args:
+        session_factory: Creates the database session for the export
+        query: Session query from crud.session_bundle_query
+        chunk_size: Sessions per database fetch and per yielded piece
+
+    Yields:
+        NDJSON text, one piece per chunk
+    """
+    sessions = 0
+    with session_factory() as db:
+        try:
+            for chunk in crud.iter_export_chunks(db, query, chunk_size):
+                lines = "".join(
+                    json.dumps(session_bundle(session), ensure_ascii=False) + "\n" for (session,) in chunk
+                )
+                sessions += len(chunk)
+                yield lines
+        except Exception as e:
+            logger.error(f"Session export failed after {sessions} sessions: {e}", exc_info=True)
+            raise
+
+    logger.info(f"Session export finished: {sessions} sessions")
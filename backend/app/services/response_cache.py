@@ -0,0 +1,283 @@
+"""
+Response cache for scaffolding generation
+Avoids a full LLM round trip for repeated learner inputs (e.g. "모르겠어요", "네")
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Protocol
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+
+from ..core.config import Settings, settings
+
+logger = logging.getLogger(__name__)
+
+# Punctuation and symbols that do not change the meaning of short learner replies
+_IGNORED_CHARS = re.compile(r"[\s.,!?~…·\-_'\"“”‘’()\[\]]+")
+
+
+def normalize_message(message: str) -> str:
+    """
+    Normalize a learner message for cache lookups
+
+    Applies Unicode NFKC, lowercases and drops whitespace and punctuation, so
+    "모르겠어요.", "모르겠어요 ~" and "모르겠어요" share one cache entry.
+    """
+    normalized = unicodedata.normalize("NFKC", message).lower()
+    return _IGNORED_CHARS.sub("", normalized)
+
+
+def build_cache_key(
+    user_message: str,
+    current_stage: Optional[str],
+    is_question: bool,
+    conversation_history: List[Dict[str, str]],
+    context_turns: int
+) -> str:
+    """
+    Build the cache key for a scaffolding request
+
+    Args:
+        user_message: Current learner message
+        current_stage: Current CPS stage
+        is_question: Whether the answer-mode prompt is used
+        conversation_history: Previous messages
+        context_turns: Number of trailing history messages that are part of the key
+
+    Returns:
+        Hex digest identifying the request
+    """
+    recent = conversation_history[-context_turns:] if context_turns > 0 else []
+    context_hash = hashlib.sha256(
+        json.dumps(
+            [[m.get("role"), m.get("content")] for m in recent],
+            ensure_ascii=False
+        ).encode("utf-8")
+    ).hexdigest()
+
+    raw_key = json.dumps(
+        [normalize_message(user_message), current_stage or "", "answer" if is_question else "question", context_hash],
+        ensure_ascii=False
+    )
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+class CacheBackend(Protocol):
+    """Storage used by ResponseCache"""
+
+    blocking: bool  # Whether calls do network I/O; async lookups then run them in a worker thread
+
+    def get(self, key: str) -> Optional[Dict]:
+        ...
+
+    def set(self, key: str, value: Dict) -> None:
+        ...
+
+    def clear(self) -> None:
+        ...
+
+
+class InMemoryCacheBackend:
+    """Process-local LRU cache with per-entry TTL"""
+
+    blocking = False
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: int = 600):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisCacheBackend:
+    """
+    Redis-backed cache shared by all uvicorn workers
+
+    Entries expire through Redis TTLs; size-based eviction relies on the
+    server's maxmemory policy (allkeys-lru recommended).
+    """
+
+    blocking = True
+
+    def __init__(self, url: str, ttl_seconds: int = 600, prefix: str = "cps:response-cache:"):
+        import redis
+
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def get(self, key: str) -> Optional[Dict]:
+        raw = self._client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key: str, value: Dict) -> None:
+        self._client.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=self.ttl_seconds)
+
+    def clear(self) -> None:
+        for key in self._client.scan_iter(match=self.prefix + "*"):
+            self._client.delete(key)
+
+
+class ResponseCache:
+    """Cache of parsed scaffolding responses with hit/miss counters"""
+
+    def __init__(self, backend: CacheBackend, context_turns: int = 2):
+        self.backend = backend
+        self.context_turns = context_turns
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def key_for(
+        self,
+        user_message: str,
+        current_stage: Optional[str],
+        is_question: bool,
+        conversation_history: List[Dict[str, str]]
+    ) -> str:
+        """Build the cache key for a request"""
+        return build_cache_key(user_message, current_stage, is_question, conversation_history, self.context_turns)
+
+    def get(self, key: str) -> Optional[Dict]:
+        """
+        Look up a cached response
+
+        Returns:
+            A copy of the cached scaffolding dict, or None on miss or backend error
+        """
+        try:
+            value = self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache lookup failed: {e}")
+            value = None
+        return self._lookup_result(value)
+
+    async def get_async(self, key: str) -> Optional[Dict]:
+        """Async version of get; a blocking backend is called in a worker thread"""
+        try:
+            value = await self._run(self.backend.get, key)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache lookup failed: {e}")
+            value = None
+        return self._lookup_result(value)
+
+    def _lookup_result(self, value: Optional[Dict]) -> Optional[Dict]:
+        if value is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Dict) -> None:
+        """Store a successfully generated response"""
+        try:
+            self.backend.set(key, copy.deepcopy(value))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache store failed: {e}")
+
+    async def set_async(self, key: str, value: Dict) -> None:
+        """Async version of set; a blocking backend is called in a worker thread"""
+        try:
+            await self._run(self.backend.set, key, copy.deepcopy(value))
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Response cache store failed: {e}")
+
+    async def _run(self, call: Callable[..., Any], *args: Any) -> Any:
+        """Call a backend method, off the event loop if it does network I/O"""
+        if getattr(self.backend, "blocking", True):
+            return await asyncio.to_thread(call, *args)
+        return call(*args)
+
+    def clear(self) -> None:
+        """Remove all entries and reset counters"""
+        self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+    def stats(self) -> Dict:
+        """Hit/miss counters for monitoring"""
+        lookups = self.hits + self.misses
+        stats = {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+        if isinstance(self.backend, InMemoryCacheBackend):
+            stats.update(
+                size=len(self.backend),
+                max_entries=self.backend.max_entries,
+                evictions=self.backend.evictions,
+                expirations=self.backend.expirations,
+            )
+        return stats
+
+
+def create_response_cache(config: Settings = settings) -> Optional[ResponseCache]:
+    """
+    Create the response cache selected by RESPONSE_CACHE_* settings
+
+    Returns:
+        ResponseCache, or None if caching is disabled
+    """
+    if not config.RESPONSE_CACHE_ENABLED:
+        return None
+
+    backend_name = config.RESPONSE_CACHE_BACKEND.lower()
+    if backend_name == "redis":
+        backend = RedisCacheBackend(config.REDIS_URL, ttl_seconds=config.RESPONSE_CACHE_TTL_SECONDS)
+    elif backend_name == "memory":
+        backend = InMemoryCacheBackend(
+            max_entries=config.RESPONSE_CACHE_MAX_ENTRIES,
+            ttl_seconds=config.RESPONSE_CACHE_TTL_SECONDS
+        )
+    else:
+        raise ValueError(f"Unknown RESPONSE_CACHE_BACKEND: {config.RESPONSE_CACHE_BACKEND}")
+
+    logger.info(f"Response cache enabled ({backend_name}, ttl={config.RESPONSE_CACHE_TTL_SECONDS}s)")
+    return ResponseCache(backend, context_turns=config.RESPONSE_CACHE_CONTEXT_TURNS)
@@ -0,0 +1,334 @@
+"""
+Hot-state cache for chat sessions
+Keeps each session's current stage, per-stage turn counts and metric counters so a chat turn need not re-query them
+"""
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Protocol
+import asyncio
+import json
+import logging
+import threading
+
+from ..core.config import Settings, settings
+
+logger = logging.getLogger(__name__)
+
+# SessionMetric columns holding turn counts, by CPS stage
+TURN_COLUMNS = {
+    "도전_이해": "challenge_understanding_turns",
+    "아이디어_생성": "idea_generation_turns",
+    "실행_준비": "action_preparation_turns",
+}
+
+# SessionMetric counter columns mirrored in the cache
+COUNTER_COLUMNS = (
+    "total_messages",
+    "user_messages",
+    "agent_messages",
+    "shallow_responses",
+    "medium_responses",
+    "deep_responses",
+    "monitoring_count",
+    "control_count",
+    "knowledge_count",
+    "total_stage_transitions",
+)
+
+
+class SessionState:
+    """Snapshot of a session's hot state at one state_version"""
+
+    __slots__ = ("session_id", "version", "stage", "turns", "counters")
+
+    def __init__(
+        self,
+        session_id: str,
+        version: int,
+        stage: str,
+        turns: Optional[Dict[str, int]] = None,
+        counters: Optional[Dict[str, int]] = None
+    ):
+        self.session_id = session_id
+        self.version = version
+        self.stage = stage  # Stage of the latest transition
+        self.turns = {name: 0 for name in TURN_COLUMNS}
+        self.turns.update(turns or {})
+        self.counters = {name: 0 for name in COUNTER_COLUMNS}
+        self.counters.update(counters or {})
+
+    def to_dict(self) -> Dict:
+        return {
+            "session_id": self.session_id,
+            "version": self.version,
+            "stage": self.stage,
+            "turns": dict(self.turns),
+            "counters": dict(self.counters),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "SessionState":
+        return cls(data["session_id"], data["version"], data["stage"], data["turns"], data["counters"])
+
+
+class StateBackend(Protocol):
+    """Storage used by SessionStateCache"""
+
+    blocking: bool  # Whether calls do network I/O; async callers then run them in a worker thread
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        ...
+
+    def set(self, session_id: str, value: Dict) -> None:
+        ...
+
+    def delete(self, session_id: str) -> None:
+        ...
+
+    def clear(self) -> None:
+        ...
+
+
+class InMemoryStateBackend:
+    """Process-local LRU of session states"""
+
+    blocking = False
+
+    def __init__(self, max_sessions: int = 1000):
+        self.max_sessions = max(1, max_sessions)
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock:
+            value = self._entries.get(session_id)
+            if value is not None:
+                self._entries.move_to_end(session_id)
+            return value
+
+    def set(self, session_id: str, value: Dict) -> None:
+        with self._lock:
+            self._entries[session_id] = value
+            self._entries.move_to_end(session_id)
+            while len(self._entries) > self.max_sessions:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, session_id: str) -> None:
+        with self._lock:
+            self._entries.pop(session_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisStateBackend:
+    """Redis-backed session states shared by all uvicorn workers"""
+
+    blocking = True
+
+    def __init__(self, url: str, ttl_seconds: int = 3600, prefix: str = "cps:session-state:"):
+        import redis
+
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        raw = self._client.get(self.prefix + session_id)
+        return json.loads(raw) if raw else None
+
+    def set(self, session_id: str, value: Dict) -> None:
+        self._client.set(self.prefix + session_id, json.dumps(value, ensure_ascii=False), ex=self.ttl_seconds)
+
+    def delete(self, session_id: str) -> None:
+        self._client.delete(self.prefix + session_id)
+
+    def clear(self) -> None:
+        for key in self._client.scan_iter(match=self.prefix + "*"):
+            self._client.delete(key)
+
+
+class SessionStateCache:
+    """
+    Versioned cache of session states
+
+    Every write to a session's state bumps session_metrics.state_version in
+    the same transaction. A cached state is only served when its version
+    equals the version read from the database, so a change committed by
+    another worker is never hidden; writers pass the version their change
+    produced, and the change is applied to the cached state only when that
+    state is exactly one version behind (otherwise it is dropped).
+    """
+
+    def __init__(self, backend: StateBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.write_throughs = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def _read(self, session_id: str) -> Optional[SessionState]:
+        try:
+            value = self.backend.get(session_id)
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Session state cache lookup failed: {e}")
+            return None
+        return SessionState.from_dict(value) if value is not None else None
+
+    def get(self, session_id: str, version: int) -> Optional[SessionState]:
+        """
+        Look up a session's state
+
+        Args:
+            session_id: Session ID
+            version: Current state_version read from the database
+
+        Returns:
+            The cached state if it is at this version, otherwise None
+        """
+        state = self._read(session_id)
+        if state is None:
+            self.misses += 1
+            return None
+        if state.version != version:
+            self.stale += 1
+            return None
+        self.hits += 1
+        return state
+
+    def put(self, state: SessionState) -> None:
+        """Store a state loaded from or just written to the database"""
+        try:
+            self.backend.set(state.session_id, state.to_dict())
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Session state cache store failed: {e}")
+
+    def update(
+        self,
+        session_id: str,
+        version: Optional[int],
+        stage: Optional[str] = None,
+        turns: Optional[Dict[str, int]] = None,
+        counters: Optional[Dict[str, int]] = None
+    ) -> None:
+        """
+        Write a committed change through to the cached state
+
+        Args:
+            session_id: Session ID
+            version: state_version produced by the change, or None if unknown
+            stage: New current stage, if changed
+            turns: New turn counts by stage, for the stages that changed
+            counters: New counter values, for the counters that changed
+        """
+        state = self._read(session_id) if version is not None else None
+        if state is None or state.version != version - 1:
+            self.invalidate(session_id)
+            return
+
+        state.version = version
+        if stage is not None:
+            state.stage = stage
+        state.turns.update(turns or {})
+        state.counters.update(counters or {})
+        self.put(state)
+        self.write_throughs += 1
+
+    def invalidate(self, session_id: str) -> None:
+        """Drop a session's cached state"""
+        try:
+            self.backend.delete(session_id)
+            self.invalidations += 1
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"Session state cache invalidation failed: {e}")
+
+    async def get_async(self, session_id: str, version: int) -> Optional[SessionState]:
+        """Async version of get"""
+        return await self._run(self.get, session_id, version)
+
+    async def put_async(self, state: SessionState) -> None:
+        """Async version of put"""
+        await self._run(self.put, state)
+
+    async def update_async(
+        self,
+        session_id: str,
+        version: Optional[int],
+        stage: Optional[str] = None,
+        turns: Optional[Dict[str, int]] = None,
+        counters: Optional[Dict[str, int]] = None
+    ) -> None:
+        """Async version of update"""
+        await self._run(lambda: self.update(session_id, version, stage=stage, turns=turns, counters=counters))
+
+    async def _run(self, call: Callable[..., Any], *args: Any) -> Any:
+        """Run a cache operation, off the event loop if the backend does network I/O"""
+        if getattr(self.backend, "blocking", True):
+            return await asyncio.to_thread(call, *args)
+        return call(*args)
+
+    def clear(self) -> None:
+        """Remove all entries and reset counters"""
+        self.backend.clear()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.write_throughs = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def stats(self) -> Dict:
+        """Cache counters for monitoring"""
+        lookups = self.hits + self.misses + self.stale
+        stats = {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "write_throughs": self.write_throughs,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+        if isinstance(self.backend, InMemoryStateBackend):
+            stats.update(
+                size=len(self.backend),
+                max_sessions=self.backend.max_sessions,
+                evictions=self.backend.evictions,
+            )
+        return stats
+
+
+def create_session_state_cache(config: Settings = settings) -> Optional[SessionStateCache]:
+    """
+    Create the session state cache selected by SESSION_STATE_CACHE_* settings
+
+    Returns:
+        SessionStateCache, or None if caching is disabled
+    """
+    if not config.SESSION_STATE_CACHE_ENABLED:
+        return None
+
+    backend_name = config.SESSION_STATE_CACHE_BACKEND.lower()
+    if backend_name == "redis":
+        backend = RedisStateBackend(config.REDIS_URL, ttl_seconds=config.SESSION_STATE_CACHE_TTL_SECONDS)
+    elif backend_name == "memory":
+        backend = InMemoryStateBackend(max_sessions=config.SESSION_STATE_CACHE_MAX_SESSIONS)
+    else:
+        raise ValueError(f"Unknown SESSION_STATE_CACHE_BACKEND: {config.SESSION_STATE_CACHE_BACKEND}")
+
+    logger.info(f"Session state cache enabled ({backend_name})")
+    return SessionStateCache(backend)
+
+
+session_state_cache = create_session_state_cache()
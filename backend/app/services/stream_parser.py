@@ -0,0 +1,152 @@
+"""
+Incremental JSON field extraction for streamed LLM responses
+Lets the chat stream forward question text before the full JSON body has arrived
+"""
+from typing import Iterable, List, Optional, Tuple
+
+_SIMPLE_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+
+
+class JSONStringFieldStreamer:
+    """
+    Extract the values of selected string fields from a JSON document fed in chunks
+
+    Only top-level string values are tracked, which is all the scaffolding
+    response shape needs. Text outside the JSON object (e.g. markdown code
+    fences) is ignored.
+
+    Usage:
+        streamer = JSONStringFieldStreamer(["scaffolding_question"])
+        for chunk in chunks:
+            for field, text in streamer.feed(chunk):
+                ...
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self.fields = set(fields)
+        self._buffer = ""
+        self._pos = 0
+        self._in_string = False
+        self._string_chars: List[str] = []
+        self._last_string: Optional[str] = None
+        self._current_key: Optional[str] = None
+        self._value_field: Optional[str] = None
+        self._pending_high_surrogate: Optional[str] = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """
+        Consume the next chunk of raw model output
+
+        Args:
+            chunk: Newly received text
+
+        Returns:
+            List of (field, text) pairs decoded from this chunk, in order
+        """
+        self._buffer += chunk
+        deltas: List[Tuple[str, str]] = []
+        buffer = self._buffer
+        length = len(buffer)
+
+        while self._pos < length:
+            char = buffer[self._pos]
+
+            if not self._in_string:
+                if char == '"':
+                    self._in_string = True
+                    self._string_chars = []
+                    # A string right after "key": is that key's value
+                    self._value_field = self._current_key if self._current_key in self.fields else None
+                    self._current_key = None
+                elif char == ':':
+                    self._current_key = self._last_string
+                    self._last_string = None
+                elif not char.isspace():
+                    self._current_key = None
+                    self._last_string = None
+                self._pos += 1
+                continue
+
+            if char == '\\':
+                decoded, consumed = self._decode_escape(buffer, self._pos)
+                if consumed == 0:
+                    # Incomplete escape sequence, wait for more data
+                    break
+                self._pos += consumed
+                self._append(decoded, deltas)
+                continue
+
+            if char == '"':
+                self._in_string = False
+                self._last_string = "".join(self._string_chars) if self._value_field is None else None
+                self._value_field = None
+                self._pos += 1
+                continue
+
+            self._append(char, deltas)
+            self._pos += 1
+
+        # Drop consumed input so the buffer stays small on long responses
+        self._buffer = self._buffer[self._pos:]
+        self._pos = 0
+
+        return self._merge(deltas)
+
+    def _append(self, text: str, deltas: List[Tuple[str, str]]) -> None:
+        """Record decoded string content"""
+        if not text:
+            return
+        if self._value_field is not None:
+            deltas.append((self._value_field, text))
+        else:
+            self._string_chars.append(text)
+
+    def _decode_escape(self, buffer: str, pos: int) -> Tuple[str, int]:
+        """
+        Decode an escape sequence starting at buffer[pos] (a backslash)
+
+        Returns:
+            Tuple of (decoded text, characters consumed); consumed is 0 if incomplete
+        """
+        if pos + 1 >= len(buffer):
+            return "", 0
+
+        kind = buffer[pos + 1]
+        if kind != 'u':
+            return _SIMPLE_ESCAPES.get(kind, kind), 2
+
+        if pos + 6 > len(buffer):
+            return "", 0
+
+        char = chr(int(buffer[pos + 2:pos + 6], 16))
+
+        # Combine UTF-16 surrogate pairs (e.g. emoji) into one character
+        if '\ud800' <= char <= '\udbff':
+            self._pending_high_surrogate = char
+            return "", 6
+        if '\udc00' <= char <= '\udfff' and self._pending_high_surrogate:
+            high = self._pending_high_surrogate
+            self._pending_high_surrogate = None
+            return (high + char).encode('utf-16', 'surrogatepass').decode('utf-16'), 6
+
+        return char, 6
+
+    @staticmethod
+    def _merge(deltas: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+        """Join consecutive deltas for the same field"""
+        merged: List[Tuple[str, str]] = []
+        for field, text in deltas:
+            if merged and merged[-1][0] == field:
+                merged[-1] = (field, merged[-1][1] + text)
+            else:
+                merged.append((field, text))
+        return merged
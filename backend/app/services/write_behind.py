@@ -0,0 +1,272 @@
+"""
+Write-behind persistence of conversation and transition rows
+Chat turns hand their rows to a bounded queue that a background task bulk-inserts, so the response does not wait for the INSERTs
+"""
+from typing import Callable, Dict, List, Optional
+import asyncio
+import logging
+import time
+
+from sqlalchemy.orm import Session as SQLAlchemySession
+
+from ..core.config import Settings, settings
+from .. import crud
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class WriteBehindWriter:
+    """
+    Bounded queue of turn rows drained by a background task
+
+    The task collects turns until batch_rows rows are queued or
+    flush_interval_ms has passed since the first one, then inserts them
+    with one executemany per table in a single transaction. A failed batch
+    is retried max_attempts times; after that each turn is written in its
+    own transaction, and each row of a turn that still fails in its own,
+    so one bad row cannot take other turns with it. Only rows that fail
+    on their own are dropped; they are logged with their values and
+    counted in rows_dropped. Their SessionMetric counters were already
+    committed by persist_turn and stay as they are.
+
+    When the queue is full, or the task is not running, rows are written
+    synchronously by the caller instead. stop() drains the queue, and is
+    called on application shutdown. wait_for_session() gives up after
+    wait_timeout_ms, so a stuck batch delays a turn rather than hanging it.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable[[], SQLAlchemySession]] = None,
+        queue_size: int = 1000,
+        flush_interval_ms: int = 50,
+        batch_rows: int = 200,
+        max_attempts: int = 3,
+        wait_timeout_ms: int = 2000
+    ):
+        self._session_factory = session_factory
+        self.queue_size = max(1, queue_size)
+        self.flush_interval = max(0, flush_interval_ms) / 1000
+        self.batch_rows = max(1, batch_rows)
+        self.max_attempts = max(1, max_attempts)
+        self.wait_timeout = max(0, wait_timeout_ms) / 1000
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._drained: Optional[asyncio.Condition] = None
+        self._pending: Dict[str, int] = {}  # Queued turns per session
+
+        self.turns_queued = 0
+        self.batches = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.turns_split = 0  # Turns written row by row after their batch failed
+        self.sync_writes = 0
+        self.wait_timeouts = 0
+        self.max_depth = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _new_session(self) -> SQLAlchemySession:
+        if self._session_factory is None:
+            from ..db import SessionLocal
+            return SessionLocal()
+        return self._session_factory()
+
+    async def start(self) -> None:
+        """Start the background task on the running event loop"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._drained = asyncio.Condition()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Write-behind enabled (queue={self.queue_size}, interval={self.flush_interval * 1000:.0f}ms, "
+            f"batch={self.batch_rows} rows)"
+        )
+
+    async def stop(self) -> None:
+        """Flush every queued turn and stop the background task"""
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        logger.info(f"Write-behind stopped after {self.rows_written} rows in {self.batches} batches")
+
+    def enqueue(self, rows: crud.TurnRows) -> None:
+        """
+        Queue a turn's rows for insertion
+
+        Must be called on the event loop thread. Falls back to a synchronous
+        insert when the writer is not running or the queue is full.
+        """
+        if self._put(rows):
+            return
+        self.sync_writes += 1
+        self._write([rows])
+
+    async def enqueue_async(self, rows: crud.TurnRows) -> None:
+        """Like enqueue, but the fallback insert runs in a worker thread instead of on the event loop"""
+        if self._put(rows):
+            return
+        self.sync_writes += 1
+        await asyncio.to_thread(self._write, [rows])
+
+    def _put(self, rows: crud.TurnRows) -> bool:
+        """Queue a turn if the task is running and the queue has room"""
+        if not self.running:
+            return False
+        try:
+            self._queue.put_nowait(rows)
+        except asyncio.QueueFull:
+            logger.warning("Write-behind queue full, writing turn synchronously")
+            return False
+        self._pending[rows.session_id] = self._pending.get(rows.session_id, 0) + 1
+        self.turns_queued += 1
+        self.max_depth = max(self.max_depth, self._queue.qsize())
+        return True
+
+    async def wait_for_session(self, session_id: str) -> None:
+        """
+        Wait until all queued rows of a session are committed
+
+        Returns after wait_timeout_ms even if some are still queued; the
+        caller then reads without them.
+        """
+        if not self._pending.get(session_id) or self._drained is None:
+            return
+
+        async def drained() -> None:
+            async with self._drained:
+                await self._drained.wait_for(lambda: not self._pending.get(session_id))
+
+        try:
+            await asyncio.wait_for(drained(), timeout=self.wait_timeout)
+        except asyncio.TimeoutError:
+            self.wait_timeouts += 1
+            logger.warning(
+                f"Write-behind rows of session {session_id} not committed after {self.wait_timeout * 1000:.0f}ms, "
+                f"reading without them ({self._pending.get(session_id, 0)} turns queued)"
+            )
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+
+            batch = [item]
+            rows = _row_count(item)
+            deadline = loop.time() + self.flush_interval
+            while rows < self.batch_rows:
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                rows += _row_count(item)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: List[crud.TurnRows]) -> None:
+        rows = sum(_row_count(item) for item in batch)
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await asyncio.to_thread(self._write, batch)
+                break
+            except Exception as e:
+                if attempt == self.max_attempts:
+                    logger.error(f"Write-behind batch of {rows} rows failed after {attempt} attempts, writing turns one by one: {e}")
+                    await asyncio.to_thread(self._write_each, batch)
+                else:
+                    logger.warning(f"Write-behind batch failed (attempt {attempt}): {e}")
+                    await asyncio.sleep(0.1 * attempt)
+
+        for item in batch:
+            remaining = self._pending.get(item.session_id, 0) - 1
+            if remaining > 0:
+                self._pending[item.session_id] = remaining
+            else:
+                self._pending.pop(item.session_id, None)
+        async with self._drained:
+            self._drained.notify_all()
+
+    def _write(self, batch: List[crud.TurnRows]) -> None:
+        started = time.perf_counter()
+        db = self._new_session()
+        try:
+            written = crud.insert_turn_rows(db, batch)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self.batches += 1
+        self.rows_written += written
+        logger.debug(f"Write-behind inserted {written} rows in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    def _write_each(self, batch: List[crud.TurnRows]) -> None:
+        """Write each turn on its own, then each row of a turn that still fails"""
+        for item in batch:
+            try:
+                self._write([item])
+                continue
+            except Exception as e:
+                self.turns_split += 1
+                logger.warning(f"Write-behind turn of session {item.session_id} failed, writing rows one by one: {e}")
+
+            rows = [crud.TurnRows(item.session_id, [values], None) for values in item.conversations]
+            if item.transition:
+                rows.append(crud.TurnRows(item.session_id, [], item.transition))
+            for row in rows:
+                try:
+                    self._write([row])
+                except Exception as e:
+                    self.rows_dropped += 1
+                    logger.error(f"Write-behind dropped a row of session {item.session_id}: {row}: {e}", exc_info=True)
+
+    def stats(self) -> Dict:
+        """Queue depth and throughput counters for monitoring"""
+        return {
+            "running": self.running,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "queue_size": self.queue_size,
+            "max_depth": self.max_depth,
+            "turns_queued": self.turns_queued,
+            "batches": self.batches,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "turns_split": self.turns_split,
+            "sync_writes": self.sync_writes,
+            "wait_timeouts": self.wait_timeouts,
+        }
+
+
+def _row_count(rows: crud.TurnRows) -> int:
+    return len(rows.conversations) + (1 if rows.transition else 0)
+
+
+def create_write_behind_writer(config: Settings = settings) -> Optional[WriteBehindWriter]:
+    """Create the writer configured by WRITE_BEHIND_* settings, or None if disabled"""
+    if not config.WRITE_BEHIND_ENABLED:
+        return None
+    return WriteBehindWriter(
+        queue_size=config.WRITE_BEHIND_QUEUE_SIZE,
+        flush_interval_ms=config.WRITE_BEHIND_FLUSH_INTERVAL_MS,
+        batch_rows=config.WRITE_BEHIND_BATCH_ROWS,
+        wait_timeout_ms=config.WRITE_BEHIND_WAIT_TIMEOUT_MS
+    )
+
+
+write_behind_writer = create_write_behind_writer()
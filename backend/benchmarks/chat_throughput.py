@@ -0,0 +1,91 @@
+"""
+Chat endpoint throughput benchmark using the offline local LLM backend
+
+Runs the full FastAPI stack in-process against a throwaway SQLite database,
+so it needs no network access or Gemini API key.
+
+Usage (from backend/):
+    python -m benchmarks.chat_throughput --sessions 30 --turns 5 --latency-ms 2000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=30, help="Concurrent learner sessions")
+    parser.add_argument("--turns", type=int, default=5, help="Messages sent per session")
+    parser.add_argument("--latency-ms", type=int, default=2000, help="Simulated LLM latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Simulated LLM error rate")
+    parser.add_argument("--endpoint", default="/api/chat/message", help="Chat endpoint to exercise")
+    return parser.parse_args()
+
+
+async def run(args):
+    import logging
+    import httpx
+    from app.main import app
+    from app.db import init_db
+
+    logging.getLogger().setLevel(logging.WARNING)
+    init_db()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+        session_ids = []
+        for i in range(args.sessions):
+            response = await client.post("/api/chat/session", json={
+                "user_id": f"bench_{i}",
+                "assignment_text": "학생들의 수업 참여도를 높이는 방법을 고민하고 있습니다."
+            })
+            session_ids.append(response.json()["session_id"])
+
+        latencies = []
+        errors = 0
+
+        async def learner(session_id):
+            nonlocal errors
+            for turn in range(args.turns):
+                started = time.perf_counter()
+                response = await client.post(args.endpoint, json={
+                    "session_id": session_id,
+                    "message": f"학생들이 수업 시간에 자주 딴짓을 합니다 ({turn})",
+                    "conversation_history": []
+                })
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*[learner(session_id) for session_id in session_ids])
+        elapsed = time.perf_counter() - started
+
+    total = len(latencies)
+    latencies.sort()
+    print(f"requests:   {total} ({errors} errors)")
+    print(f"wall time:  {elapsed:.2f}s")
+    print(f"throughput: {total / elapsed:.1f} req/s")
+    print(f"latency:    p50={statistics.median(latencies) * 1000:.0f}ms "
+          f"p95={latencies[int(total * 0.95) - 1] * 1000:.0f}ms max={latencies[-1] * 1000:.0f}ms")
+
+
+def main():
+    args = parse_args()
+    db_dir = tempfile.mkdtemp(prefix="chat_bench_")
+
+    # Settings are read at import time, so configure the environment first
+    os.environ["LLM_BACKEND"] = "local"
+    os.environ["LOCAL_LLM_LATENCY_MS"] = str(args.latency_ms)
+    os.environ["LOCAL_LLM_ERROR_RATE"] = str(args.error_rate)
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_dir}/bench.db"
+    os.environ["DEBUG"] = "false"
+
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Micro-benchmark for learner intent detection
+
+Compares IntentDetector with the previous per-turn scans (question
+patterns in GeminiService plus the transition keyword/indicator checks in
+send_message) and with a combined-regex alternative, over the golden test
+corpus.
+
+Usage (from backend/):
+    python -m benchmarks.intent_detection --repeat 2000
+"""
+import argparse
+import json
+import re
+import time
+from pathlib import Path
+
+CORPUS_PATH = Path(__file__).resolve().parent.parent / "tests" / "fixtures" / "intent_corpus.json"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000, help="Passes over the corpus")
+    return parser.parse_args()
+
+
+def legacy_detect(message):
+    """The two scans each chat turn ran before IntentDetector"""
+    is_question = '?' in message
+    if not is_question:
+        question_patterns = [
+            '뭐예요', '뭔가요', '무엇인가요', '어떻게', '왜',
+            '이유가', '설명해', '알려줘', '알려주세요',
+            '괜찮나요', '맞나요', '좋나요', '어떤가요',
+            '도와줘', '도와주세요', '의견', '생각'
+        ]
+        message_lower = message.lower()
+        is_question = any(pattern in message_lower for pattern in question_patterns)
+
+    user_message_lower = message.lower()
+    transition_keywords = {
+        "아이디어": "아이디어_생성",
+        "아이디어 생성": "아이디어_생성",
+        "다음 단계": None,
+        "실행 준비": "실행_준비",
+        "실행": "실행_준비",
+    }
+    transition_indicators = [
+        "넘어가" in user_message_lower,
+        "이동" in user_message_lower,
+        "가자" in user_message_lower,
+        "진행" in user_message_lower,
+        "싶습니다" in user_message_lower and "이동" in user_message_lower,
+        "싶어요" in user_message_lower and "이동" in user_message_lower,
+    ]
+    for keyword, stage in transition_keywords.items():
+        if keyword in user_message_lower and any(transition_indicators):
+            return is_question, True, stage
+    return is_question, False, None
+
+
+def build_regex_detect():
+    """Combined longest-first regex alternative (findall plus overlap checks)"""
+    from app.services.intent_detector import QUESTION_PATTERNS, TRANSITION_INDICATORS, TRANSITION_KEYWORDS
+
+    literals = sorted(set(QUESTION_PATTERNS) | {"?"} | set(TRANSITION_INDICATORS) | set(TRANSITION_KEYWORDS), key=len, reverse=True)
+    regex = re.compile("|".join(re.escape(literal) for literal in literals))
+    # A longest-first match hides shorter literals that are its prefixes
+    implied = {literal: {other for other in literals if literal.startswith(other)} for literal in literals}
+    # Literals that can start inside another match are missed by findall
+    shadowed = [
+        other for other in literals
+        if any(other != literal and (literal[i:].startswith(other) or other.startswith(literal[i:]))
+               for literal in literals for i in range(1, len(literal)))
+    ]
+
+    def regex_detect(message):
+        text = message.lower()
+        found = set()
+        for match in set(regex.findall(text)):
+            found |= implied[match]
+        found.update(literal for literal in shadowed if literal in text)
+        is_question = not found.isdisjoint(QUESTION_PATTERNS + ["?"])
+        keywords = [keyword for keyword in TRANSITION_KEYWORDS if keyword in found]
+        if keywords and not found.isdisjoint(TRANSITION_INDICATORS):
+            return is_question, True, TRANSITION_KEYWORDS[keywords[0]]
+        return is_question, False, None
+
+    return regex_detect
+
+
+def timed(detect, messages, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for message in messages:
+            detect(message)
+    return (time.perf_counter() - started) / (repeat * len(messages))
+
+
+def main():
+    args = parse_args()
+    from app.services.intent_detector import intent_detector
+
+    corpus = [case["message"] for case in json.loads(CORPUS_PATH.read_text(encoding="utf-8"))]
+    # Learners' later turns are often several sentences long
+    groups = {"corpus": corpus, "corpus x8": [message * 8 for message in corpus]}
+
+    regex_detect = build_regex_detect()
+    candidates = {"IntentDetector": intent_detector.detect, "combined regex": regex_detect}
+
+    for name, detect in candidates.items():
+        mismatches = [m for messages in groups.values() for m in messages if tuple(detect(m)) != legacy_detect(m)]
+        print(f"{name} mismatches vs legacy: {len(mismatches)}")
+
+    for name, messages in groups.items():
+        legacy = timed(legacy_detect, messages, args.repeat)
+        average_length = sum(map(len, messages)) / len(messages)
+        print(f"{name} ({len(messages)} messages, avg {average_length:.0f} chars)")
+        print(f"  {'legacy scans':<16} {legacy * 1e6:.2f} us/message")
+        for candidate, detect in candidates.items():
+            elapsed = timed(detect, messages, args.repeat)
+            print(f"  {candidate:<16} {elapsed * 1e6:.2f} us/message ({legacy / elapsed:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
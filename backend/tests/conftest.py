@@ -2,30 +2,49 @@
 Pytest configuration and fixtures
 """
 import pytest
+import asyncio
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, Session as SQLAlchemySession
+from sqlalchemy.pool import NullPool, StaticPool
 from fastapi.testclient import TestClient
 import uuid
 
 from app.models.database import Base
 from app.main import app
-from app.db import get_db
+from app.db import get_async_db, get_async_session_factory, get_db, get_session_factory
 
 
-# Test database URL (in-memory SQLite)
-TEST_DATABASE_URL = "sqlite:///:memory:"
+@pytest.fixture(scope="function")
+def db_path(tmp_path):
+    """SQLite file shared by the sync and async test engines"""
+    return tmp_path / "test.db"
 
 
 @pytest.fixture(scope="function")
-def db_engine():
+def db_engine(db_path):
     """Create a test database engine"""
     engine = create_engine(
-        TEST_DATABASE_URL,
-        connect_args={"check_same_thread": False}
+        f"sqlite:///{db_path}",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
     )
     Base.metadata.create_all(bind=engine)
     yield engine
     Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture(scope="function")
+def async_session_factory(db_engine, db_path):
+    """Async sessions on the test database
+
+    NullPool opens a connection per session, as the test client runs each
+    request on its own event loop.
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    yield async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    asyncio.run(engine.dispose())
 
 
 @pytest.fixture(scope="function")
@@ -44,11 +63,12 @@ def db_session(db_engine):
 
 
 @pytest.fixture(scope="function")
-def client(db_session, db_engine):
+def client(db_session, db_engine, async_session_factory):
     """Create a test client with database override"""
     from contextlib import asynccontextmanager
     from fastapi import FastAPI
-    from app.api import chat, research
+    from app.api import admin, chat, metrics, research
+    from app.services.metrics import RequestMetricsMiddleware
 
     def override_get_db():
         try:
@@ -56,6 +76,12 @@ def client(db_session, db_engine):
         finally:
             pass
 
+    export_session_factory = sessionmaker(autocommit=False, autoflush=False, bind=db_engine)
+
+    async def override_get_async_db():
+        async with async_session_factory() as db:
+            yield db
+
     # Override lifespan to prevent DB initialization conflicts
     @asynccontextmanager
     async def test_lifespan(app_instance):
@@ -72,9 +98,15 @@ def client(db_session, db_engine):
     # Include routers
     test_app.include_router(chat.router)
     test_app.include_router(research.router)
+    test_app.include_router(admin.router)
+    test_app.include_router(metrics.router)
+    test_app.add_middleware(RequestMetricsMiddleware)
 
     # Override database dependency
     test_app.dependency_overrides[get_db] = override_get_db
+    test_app.dependency_overrides[get_async_db] = override_get_async_db
+    test_app.dependency_overrides[get_session_factory] = lambda: export_session_factory
+    test_app.dependency_overrides[get_async_session_factory] = lambda: async_session_factory
 
     # Create test client
     client = TestClient(test_app)
@@ -85,6 +117,58 @@ def client(db_session, db_engine):
     test_app.dependency_overrides.clear()
 
 
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Keep cached LLM responses from leaking between tests"""
+    from app.services.gemini_service import gemini_service
+    if gemini_service.response_cache is not None:
+        gemini_service.response_cache.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def clear_conversation_history():
+    """Each test uses a fresh database, so buffered histories must not carry over"""
+    from app.services.conversation_history import conversation_history
+    conversation_history.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def clear_session_state_cache():
+    """Reset cached session states and their counters between tests"""
+    from app.services.session_state_cache import session_state_cache
+    if session_state_cache is not None:
+        session_state_cache.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def clear_count_cache():
+    """Cached totals are keyed by filters, not by database"""
+    from app.services.query_cache import count_cache
+    if count_cache is not None:
+        count_cache.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def clear_analytics_cache():
+    """Cached summaries are keyed by filters and max conversation id, not by database"""
+    from app.services.query_cache import analytics_cache
+    if analytics_cache is not None:
+        analytics_cache.clear()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def clear_context_builder():
+    """Cached summaries are keyed by session and must not carry over between databases"""
+    from app.services.context_builder import context_builder
+    context_builder.clear()
+    yield
+
+
 @pytest.fixture
 def sample_session_data():
     """Sample session data for testing"""
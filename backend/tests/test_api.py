@@ -2,7 +2,7 @@
 Tests for API endpoints
 """
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 import json
 
 from app import crud
@@ -28,7 +28,7 @@ class TestChatAPI:
         assert "session_id" in data
         assert "created_at" in data
 
-    @patch('app.services.gemini_service.gemini_service.generate_scaffolding')
+    @patch('app.services.gemini_service.gemini_service.generate_scaffolding_async', new_callable=AsyncMock)
     def test_send_message_success(self, mock_gemini, client, db_session, sample_session_data):
         """Test sending a message successfully"""
         # Create session first
@@ -61,6 +61,14 @@ class TestChatAPI:
         assert "scaffolding_data" in data
         assert data["scaffolding_data"]["current_stage"] == "도전_이해_자료탐색"
 
+        # Turn timings are kept on the reply and in the session metrics
+        agent, = [c for c in crud.get_session_conversations(db_session, db_session_obj.id) if c.role == "agent"]
+        assert agent.total_latency_ms >= agent.llm_latency_ms >= 0
+        assert agent.total_latency_ms >= agent.db_latency_ms >= 0
+        metrics = client.get(f"/api/research/sessions/{db_session_obj.id}/metrics").json()
+        assert metrics["avg_response_time_seconds"] == pytest.approx(agent.total_latency_ms / 1000)
+        assert metrics["session_duration_seconds"] is not None
+
     def test_send_message_no_session(self, client):
         """Test sending a message without session_id"""
         request_data = {
@@ -82,7 +90,7 @@ class TestChatAPI:
         assert response.status_code == 404
         assert "not found" in response.json()["detail"]
 
-    @patch('app.services.gemini_service.gemini_service.generate_scaffolding')
+    @patch('app.services.gemini_service.gemini_service.generate_scaffolding_async', new_callable=AsyncMock)
     def test_stage_transition_recorded(self, mock_gemini, client, db_session, sample_session_data):
         """Test that stage transitions are recorded"""
         # Create session
@@ -115,6 +123,173 @@ class TestChatAPI:
         assert transitions[0].from_stage == "도전_이해_자료탐색"
         assert transitions[0].to_stage == "도전_이해_문제구조화"
 
+    @patch('app.services.gemini_service.gemini_service.generate_scaffolding_async', new_callable=AsyncMock)
+    def test_send_message_uses_server_side_history(self, mock_gemini, client, db_session, sample_session_data):
+        """Test history comes from stored messages when the client sends none"""
+        session_data = SessionCreate(**sample_session_data)
+        db_session_obj = crud.create_session(db_session, session_data)
+
+        mock_gemini.return_value = {
+            "current_stage": "도전_이해",
+            "detected_metacog_needs": ["점검"],
+            "response_depth": "medium",
+            "scaffolding_question": "어떤 상황에서 그런가요?",
+            "should_transition": False,
+            "reasoning": "상황 구체화"
+        }
+
+        for message in ["학생들이 집중을 안 해요", "특히 오후 수업이 그래요"]:
+            response = client.post("/api/chat/message", json={
+                "session_id": db_session_obj.id,
+                "message": message
+            })
+            assert response.status_code == 200
+
+        assert mock_gemini.call_args_list[0].kwargs["conversation_history"] == []
+        second_history = mock_gemini.call_args_list[1].kwargs["conversation_history"]
+        assert [(m["role"], m["content"]) for m in second_history] == [
+            ("user", "학생들이 집중을 안 해요"),
+            ("agent", "어떤 상황에서 그런가요?")
+        ]
+        assert mock_gemini.call_args_list[1].kwargs["context_summary"] is None
+
+    def test_send_message_stream(self, client, db_session, sample_session_data):
+        """Test SSE streaming endpoint emits deltas and a closing done event"""
+        session_data = SessionCreate(**sample_session_data)
+        db_session_obj = crud.create_session(db_session, session_data)
+
+        scaffolding = {
+            "current_stage": "도전_이해",
+            "detected_metacog_needs": ["점검"],
+            "response_depth": "medium",
+            "scaffolding_question": "어떤 부분이 가장 어렵게 느껴지나요?",
+            "should_transition": False,
+            "reasoning": "난이도 점검 필요"
+        }
+
+        async def fake_stream(**kwargs):
+            yield {"type": "delta", "text": "어떤 부분이 "}
+            yield {"type": "delta", "text": "가장 어렵게 느껴지나요?"}
+            yield {"type": "result", "data": scaffolding}
+
+        request_data = {
+            "session_id": db_session_obj.id,
+            "message": "학생들이 수업에 집중을 잘 안 해요",
+            "conversation_history": [],
+            "current_stage": "도전_이해"
+        }
+        with patch('app.services.gemini_service.gemini_service.generate_scaffolding_stream', side_effect=fake_stream):
+            response = client.post("/api/chat/message/stream", json=request_data)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+
+        events = []
+        for frame in response.text.strip().split("\n\n"):
+            lines = frame.split("\n")
+            events.append((lines[0][len("event: "):], json.loads(lines[1][len("data: "):])))
+
+        assert [name for name, _ in events] == ["delta", "delta", "done"]
+        assert "".join(data["text"] for name, data in events if name == "delta") == scaffolding["scaffolding_question"]
+
+        done = events[-1][1]
+        assert done["agent_message"] == scaffolding["scaffolding_question"]
+        assert done["scaffolding_data"]["response_depth"] == "medium"
+        assert crud.get_conversation(db_session, done["conversation_id"]).role == "agent"
+
+    def test_send_message_stream_is_not_buffered_by_gzip(self, client, db_session, sample_session_data):
+        """Test a client accepting gzip gets each delta before the stream ends"""
+        import asyncio
+        import time
+        from fastapi.middleware.gzip import GZipMiddleware
+
+        # As configured in app.main
+        app = GZipMiddleware(client.app, minimum_size=1000)
+
+        session_id = crud.create_session(db_session, SessionCreate(**sample_session_data)).id
+
+        async def fake_stream(**kwargs):
+            yield {"type": "delta", "text": "어떤 부분이 " * 200}
+            await asyncio.sleep(0.3)
+            yield {"type": "result", "data": {"current_stage": "도전_이해", "scaffolding_question": "어떤 부분이"}}
+
+        body = json.dumps({"session_id": session_id, "message": "학생들이 떠들어요"}).encode()
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+            "path": "/api/chat/message/stream", "raw_path": b"/api/chat/message/stream", "query_string": b"",
+            "root_path": "", "client": ("testclient", 50000), "server": ("testserver", 80),
+            "headers": [(b"content-type", b"application/json"), (b"accept-encoding", b"gzip, deflate")],
+        }
+        sent = []
+        requests = [{"type": "http.request", "body": body, "more_body": False}]
+
+        async def receive():
+            if requests:
+                return requests.pop()
+            await asyncio.sleep(10)  # The client stays connected; cancelled once the response ends
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            sent.append((time.monotonic(), message))
+
+        with patch('app.services.gemini_service.gemini_service.generate_scaffolding_stream', side_effect=fake_stream):
+            asyncio.run(app(scope, receive, send))
+
+        start = dict(sent[0][1]["headers"])
+        assert start[b"content-encoding"] == b"identity"
+        chunks = [(at, message.get("body", b"")) for at, message in sent[1:]]
+        delta_at = next(at for at, chunk in chunks if chunk.startswith(b"event: delta"))
+        done_at = next(at for at, chunk in chunks if chunk.startswith(b"event: done"))
+        assert done_at - delta_at >= 0.25
+
+    def test_send_message_stream_closes_session_after_failed_write(self, client, db_session, sample_session_data):
+        """Test a turn that fails to save is rolled back and its session closed after the error event"""
+        from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+        from app.db import get_async_session_factory
+
+        class RecordingSession(AsyncSession):
+            rolled_back = closed = False
+
+            async def rollback(self):
+                self.rolled_back = True
+                await super().rollback()
+
+            async def close(self):
+                self.closed = True
+                await super().close()
+
+        opened = []
+        factory = async_sessionmaker(class_=RecordingSession, **client.app.dependency_overrides[get_async_session_factory]().kw)
+
+        def tracking_factory():
+            opened.append(factory())
+            return opened[-1]
+
+        client.app.dependency_overrides[get_async_session_factory] = lambda: tracking_factory
+        session_id = crud.create_session(db_session, SessionCreate(**sample_session_data)).id
+
+        async def fake_stream(**kwargs):
+            yield {"type": "delta", "text": "질문"}
+            yield {"type": "result", "data": {"current_stage": "도전_이해", "scaffolding_question": "질문"}}
+
+        with patch('app.services.gemini_service.gemini_service.generate_scaffolding_stream', side_effect=fake_stream), \
+                patch('app.crud.persist_turn_async', side_effect=RuntimeError("database is gone")):
+            response = client.post("/api/chat/message/stream", json={"session_id": session_id, "message": "학생들이 떠들어요"})
+
+        assert [frame.split("\n")[0] for frame in response.text.strip().split("\n\n")] == ["event: delta", "event: error"]
+        assert len(opened) == 1
+        assert opened[0].rolled_back and opened[0].closed
+
+    def test_send_message_stream_invalid_session(self, client):
+        """Test streaming endpoint rejects unknown sessions before streaming"""
+        request_data = {
+            "session_id": "invalid-session-id",
+            "message": "test message",
+            "conversation_history": []
+        }
+        response = client.post("/api/chat/message/stream", json=request_data)
+        assert response.status_code == 404
+
 
 class TestResearchAPI:
     """Test research API endpoints"""
@@ -258,3 +433,265 @@ class TestResearchAPI:
         csv_content = response.text
         assert db_session1.id in csv_content
         assert db_session2.id not in csv_content
+
+
+    def test_exports_do_not_query_per_row(self, client, db_engine, db_session, sample_session_data, sample_conversation_data):
+        """Test each export reads all rows with a single joined SELECT"""
+        from sqlalchemy import event
+
+        for _ in range(3):
+            db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+            crud.create_conversation(db_session, session_id=db_session_obj.id, **sample_conversation_data)
+
+        statements = []
+        event.listen(db_engine, "before_cursor_execute", lambda conn, cursor, statement, *rest: statements.append(statement))
+
+        conversations = client.get("/api/research/export/conversations/csv")
+        metrics = client.get("/api/research/export/metrics/csv")
+
+        assert len(conversations.text.strip().splitlines()) == 4
+        assert len(metrics.text.strip().splitlines()) == 4
+        assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 2
+
+    def test_export_parquet(self, client, db_session, sample_session_data, sample_conversation_data):
+        """Test Parquet exports of conversations and session metrics"""
+        pa = pytest.importorskip("pyarrow")
+        import io
+        import pyarrow.parquet as pq
+
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+        crud.create_conversation(db_session, session_id=db_session_obj.id, **sample_conversation_data)
+
+        conversations = client.get("/api/research/export/conversations/parquet")
+        metrics = client.get("/api/research/export/metrics/parquet", params={"user_id": sample_session_data["user_id"]})
+
+        assert conversations.status_code == 200
+        assert conversations.headers["content-type"] == "application/vnd.apache.parquet"
+        assert "conversations.parquet" in conversations.headers["content-disposition"]
+        table = pq.read_table(io.BytesIO(conversations.content))
+        assert table.num_rows == 1
+        assert table.column("session_id").to_pylist() == [db_session_obj.id]
+
+        assert metrics.status_code == 200
+        table = pq.read_table(io.BytesIO(metrics.content))
+        assert table.column("user_id").to_pylist() == [sample_session_data["user_id"]]
+        assert pa.types.is_list(table.schema.field("stages_completed").type)
+
+    def test_export_sessions_ndjson_filters(self, client, db_session):
+        """Test the NDJSON export filters by user and creation date"""
+        import json
+        from datetime import datetime
+        from app.models.database import Conversation, Session
+
+        for index, (user_id, created_at) in enumerate([
+            ("u1", datetime(2026, 1, 1)), ("u1", datetime(2026, 2, 1)), ("u2", datetime(2026, 2, 1))
+        ]):
+            db_session.add(Session(id=f"s{index}", user_id=user_id, assignment_text="과제", created_at=created_at))
+            db_session.add(Conversation(session_id=f"s{index}", role="user", message="안녕하세요"))
+        db_session.commit()
+
+        response = client.get("/api/research/export/sessions.ndjson", params={
+            "user_id": "u1", "start_date": "2026-01-15T00:00:00", "end_date": "2026-03-01T00:00:00+00:00"
+        })
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        bundles = [json.loads(line) for line in response.text.splitlines()]
+        assert [b["session_id"] for b in bundles] == ["s1"]
+        assert bundles[0]["conversations"][0]["message"] == "안녕하세요"
+        assert bundles[0]["transitions"] == []
+        assert bundles[0]["metrics"] is None
+
+        all_sessions = client.get("/api/research/export/sessions.ndjson")
+        assert [json.loads(line)["session_id"] for line in all_sessions.text.splitlines()] == ["s0", "s1", "s2"]
+
+        invalid = client.get("/api/research/export/sessions.ndjson", params={
+            "start_date": "2026-03-01T00:00:00", "end_date": "2026-01-01T00:00:00"
+        })
+        assert invalid.status_code == 400
+
+
+class TestResearchPagination:
+    """Test keyset pagination and cached totals of research listings"""
+
+    def test_sessions_pages_cover_ties_on_created_at(self, client, db_session):
+        """Test paging newest first visits every session once, including equal timestamps"""
+        from datetime import datetime, timedelta
+        from app.models.database import Session
+
+        base = datetime(2026, 1, 1)
+        for index in range(7):
+            # Three sessions share each timestamp, so the id breaks ties
+            db_session.add(Session(id=f"s{index}", assignment_text="과제", created_at=base + timedelta(minutes=index // 3)))
+        db_session.commit()
+
+        seen, cursor = [], None
+        while True:
+            params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+            data = client.get("/api/research/sessions", params=params).json()
+            assert data["total"] == 7
+            seen.extend(s["session_id"] for s in data["sessions"])
+            cursor = data["next_cursor"]
+            if cursor is None:
+                break
+
+        assert seen == ["s6", "s5", "s4", "s3", "s2", "s1", "s0"]
+
+    def test_conversation_pages(self, client, db_session, sample_session_data, sample_conversation_data):
+        """Test conversations beyond one page are reachable through next_cursor"""
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+        for _ in range(5):
+            crud.create_conversation(db_session, session_id=db_session_obj.id, **sample_conversation_data)
+
+        url = f"/api/research/sessions/{db_session_obj.id}/conversations"
+        first = client.get(url, params={"limit": 3}).json()
+        second = client.get(url, params={"limit": 3, "cursor": first["next_cursor"]}).json()
+
+        assert (first["total"], first["count"], second["count"]) == (5, 3, 2)
+        assert second["next_cursor"] is None
+        ids = [c["id"] for c in first["conversations"] + second["conversations"]]
+        assert ids == sorted(ids) and len(set(ids)) == 5
+
+    def test_transition_pages(self, client, db_session, sample_session_data, sample_stage_transition_data):
+        """Test transitions are paged on id"""
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+        for _ in range(3):
+            crud.create_stage_transition(db_session, session_id=db_session_obj.id, **sample_stage_transition_data)
+
+        url = f"/api/research/sessions/{db_session_obj.id}/transitions"
+        first = client.get(url, params={"limit": 2}).json()
+        second = client.get(url, params={"limit": 2, "cursor": first["next_cursor"]}).json()
+
+        assert [len(first["transitions"]), len(second["transitions"])] == [2, 1]
+        assert second["total"] == 3
+
+    def test_invalid_cursor_is_rejected(self, client, db_session, sample_session_data):
+        """Test malformed or foreign cursors return 400"""
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+
+        assert client.get("/api/research/sessions", params={"cursor": "not-a-cursor"}).status_code == 400
+        wrong_key = crud.encode_cursor({"id": 5})
+        assert client.get("/api/research/sessions", params={"cursor": wrong_key}).status_code == 400
+        url = f"/api/research/sessions/{db_session_obj.id}/conversations"
+        assert client.get(url, params={"cursor": crud.encode_cursor({"id": "x"})}).status_code == 400
+
+    def test_total_is_cached_and_optional(self, client, db_session, sample_session_data):
+        """Test the total is computed once per TTL and can be skipped"""
+        crud.create_session(db_session, SessionCreate(**sample_session_data))
+        assert client.get("/api/research/sessions").json()["total"] == 1
+
+        crud.create_session(db_session, SessionCreate(**sample_session_data))
+        cached = client.get("/api/research/sessions").json()
+        assert (cached["total"], cached["count"]) == (1, 2)
+
+        skipped = client.get("/api/research/sessions", params={"count": "none"}).json()
+        assert skipped["total"] is None
+        # Estimates fall back to an exact count where the database has no statistics
+        estimated = client.get("/api/research/sessions", params={"count": "estimated"}).json()
+        assert (estimated["total"], estimated["total_estimated"]) == (2, False)
+
+
+class TestResearchAnalytics:
+    """Test the analytics summary endpoint"""
+
+    def _seed(self, db_session):
+        from datetime import datetime
+        from app.models.database import Conversation, Session, SessionMetric
+
+        for session_id, user_id, created_at in (("s1", "u1", datetime(2026, 1, 1)), ("s2", "u2", datetime(2026, 2, 1))):
+            db_session.add(Session(id=session_id, user_id=user_id, assignment_text="과제", created_at=created_at))
+        db_session.add_all([
+            Conversation(session_id="s1", role="user", message="질문", metacog_elements=None),
+            Conversation(session_id="s1", role="agent", message="a", cps_stage="도전_이해", response_depth="shallow", metacog_elements=["점검"]),
+            Conversation(session_id="s1", role="agent", message="b", cps_stage="도전_이해", response_depth="deep", metacog_elements=["점검", "조절"]),
+            Conversation(session_id="s2", role="agent", message="c", cps_stage="도전_이해", response_depth="deep", metacog_elements=None),
+            Conversation(session_id="s2", role="agent", message="d", cps_stage="아이디어_생성", response_depth="medium", metacog_elements=["지식"]),
+            SessionMetric(session_id="s1", challenge_understanding_turns=2, completed=True),
+            SessionMetric(session_id="s2", challenge_understanding_turns=4, idea_generation_turns=1),
+        ])
+        db_session.commit()
+
+    def test_summary_groups_by_stage(self, client, db_session):
+        """Test depth, metacognitive element and turn aggregates per stage, with filters"""
+        self._seed(db_session)
+
+        data = client.get("/api/research/analytics/summary").json()
+        assert data["sessions"] == 2
+        assert data["completed_sessions"] == 1
+        assert data["response_depth_by_stage"] == {"도전_이해": {"shallow": 1, "deep": 2}, "아이디어_생성": {"medium": 1}}
+        assert data["metacog_elements_by_stage"] == {"도전_이해": {"점검": 2, "조절": 1}, "아이디어_생성": {"지식": 1}}
+        assert data["avg_turns_by_stage"] == {"도전_이해": 3.0, "아이디어_생성": 0.5, "실행_준비": 0.0}
+
+        by_user = client.get("/api/research/analytics/summary", params={"user_id": "u2"}).json()
+        assert by_user["response_depth_by_stage"] == {"도전_이해": {"deep": 1}, "아이디어_생성": {"medium": 1}}
+        by_date = client.get("/api/research/analytics/summary", params={"end_date": "2026-01-15T00:00:00"}).json()
+        assert by_date["sessions"] == 1
+        assert by_date["metacog_elements_by_stage"] == {"도전_이해": {"점검": 2, "조절": 1}}
+
+    def test_summary_is_cached_until_new_conversations(self, client, db_session, db_engine):
+        """Test repeated requests skip the GROUP BY queries until the max conversation id changes"""
+        from sqlalchemy import event
+        from app.models.database import Conversation
+
+        self._seed(db_session)
+        first = client.get("/api/research/analytics/summary").json()
+
+        statements = []
+        event.listen(db_engine, "before_cursor_execute", lambda conn, cursor, statement, *rest: statements.append(statement))
+        assert client.get("/api/research/analytics/summary").json() == first
+        assert not [s for s in statements if "GROUP BY" in s]
+
+        db_session.add(Conversation(session_id="s1", role="agent", message="e", cps_stage="실행_준비", response_depth="deep"))
+        db_session.commit()
+        updated = client.get("/api/research/analytics/summary").json()
+        assert updated["high_water_mark"] > first["high_water_mark"]
+        assert updated["response_depth_by_stage"]["실행_준비"] == {"deep": 1}
+
+
+class TestAdminAPI:
+    """Test operational endpoints"""
+
+    def test_db_pool_stats(self, client):
+        """Test pool statistics of both engines are reported"""
+        response = client.get("/api/admin/db/pool")
+        assert response.status_code == 200
+
+        data = response.json()
+        for name in ("sync", "async"):
+            assert {"pool_class", "checkouts", "timeouts", "wait_ms_avg", "wait_ms_max"} <= set(data[name])
+
+
+class TestMetricsAPI:
+    """Test the Prometheus scrape endpoint"""
+
+    @patch('app.services.gemini_service.gemini_service.generate_scaffolding_async')
+    def test_metrics_report_routes_and_stage_transitions(self, mock_gemini, client, db_session, sample_session_data):
+        """Test request latency is labeled by route template and transitions are counted"""
+        from prometheus_client import REGISTRY
+
+        session = crud.create_session(db_session, SessionCreate(**sample_session_data))
+        mock_gemini.return_value = {
+            "current_stage": "아이디어_생성",
+            "detected_metacog_needs": ["조절"],
+            "response_depth": "deep",
+            "scaffolding_question": "어떤 아이디어가 떠오르나요?",
+            "should_transition": True,
+            "reasoning": "이해 단계 완료"
+        }
+        transitions = {"from_stage": "도전_이해", "to_stage": "아이디어_생성"}
+        before = REGISTRY.get_sample_value("cps_stage_transitions_total", transitions) or 0.0
+
+        client.post("/api/chat/message", json={"session_id": session.id, "message": "이해했어요", "current_stage": "도전_이해"})
+        client.get(f"/api/research/sessions/{session.id}/metrics")
+
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        text = response.text
+        assert 'route="/api/chat/message",status="200"' in text
+        # Labeled by template, not by the concrete session id
+        assert 'route="/api/research/sessions/{session_id}/metrics"' in text
+        assert session.id not in text
+        assert REGISTRY.get_sample_value("cps_stage_transitions_total", transitions) == before + 1
+        assert "# TYPE cps_db_pool_checkout_wait_seconds histogram" in text
+
@@ -2,6 +2,7 @@
 Tests for CRUD operations
 """
 import pytest
+import asyncio
 from datetime import datetime
 import uuid
 
@@ -170,6 +171,20 @@ class TestConversationCRUD:
         conversations = crud.get_latest_conversations(db_session, db_session_obj.id, limit=3)
         assert len(conversations) == 3
 
+    def test_get_conversations_after_and_count(self, db_session, sample_session_data, sample_conversation_data):
+        """Test fetching conversations newer than a known id and counting them"""
+        session_data = SessionCreate(**sample_session_data)
+        db_session_obj = crud.create_session(db_session, session_data)
+
+        created = [
+            crud.create_conversation(db_session, session_id=db_session_obj.id, **sample_conversation_data)
+            for _ in range(4)
+        ]
+
+        newer = crud.get_conversations_after(db_session, db_session_obj.id, created[1].id)
+        assert [c.id for c in newer] == [created[2].id, created[3].id]
+        assert crud.count_session_conversations(db_session, db_session_obj.id) == 4
+
 
 class TestStageTransitionCRUD:
     """Test stage transition CRUD operations"""
@@ -239,6 +254,332 @@ class TestStageTransitionCRUD:
         assert latest_stage == "도전_이해_기회구성"
 
 
+class TestSessionState:
+    """Test the cached session hot state"""
+
+    @staticmethod
+    def _count_statements(db_engine):
+        from sqlalchemy import event
+
+        statements = []
+        event.listen(db_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+        return statements
+
+    def test_state_of_new_session(self, db_session, sample_session_data):
+        """Test a new session starts at the default stage with zero counts"""
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+
+        state = crud.get_session_state(db_session, db_session_obj.id)
+
+        assert state.stage == "도전_이해_기회구성"
+        assert set(state.turns.values()) == {0}
+        assert state.counters["total_messages"] == 0
+
+    def test_missing_session_has_no_state(self, db_session):
+        """Test an unknown session id yields None"""
+        assert crud.get_session_state(db_session, str(uuid.uuid4())) is None
+
+    def test_mutations_write_through(self, db_session, sample_session_data, sample_conversation_data):
+        """Test cached state follows every mutation without reloading"""
+        from app.services.session_state_cache import session_state_cache
+
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+        session_id = db_session_obj.id
+
+        crud.create_conversation(db_session, session_id=session_id, **sample_conversation_data)
+        crud.update_turn_count(db_session, session_id, "도전_이해")
+        crud.create_stage_transition(db_session, session_id=session_id, from_stage="도전_이해", to_stage="아이디어_생성")
+        crud.update_turn_count(db_session, session_id, "아이디어_생성")
+
+        cached = crud.get_session_state(db_session, session_id)
+        loaded = crud.load_session_state(db_session, session_id)
+
+        assert cached.to_dict() == loaded.to_dict()
+        assert cached.version == 4
+        assert cached.stage == "아이디어_생성"
+        assert cached.turns["아이디어_생성"] == 1
+        assert session_state_cache.stats()["write_throughs"] == 4
+        assert session_state_cache.stats()["misses"] == 0
+
+    def test_async_paths_call_blocking_backend_off_the_event_loop(self, async_session_factory, sample_session_data, monkeypatch):
+        """Test async reads and write-throughs run a network state backend in a worker thread"""
+        import threading
+        from app.services.session_state_cache import InMemoryStateBackend, session_state_cache
+
+        class RecordingBackend(InMemoryStateBackend):
+            blocking = True
+            threads = []
+
+            def get(self, session_id):
+                self.threads.append(threading.get_ident())
+                return super().get(session_id)
+
+            def set(self, session_id, value):
+                self.threads.append(threading.get_ident())
+                super().set(session_id, value)
+
+        backend = RecordingBackend()
+        monkeypatch.setattr(session_state_cache, "backend", backend)
+
+        async def scenario():
+            async with async_session_factory() as db:
+                session_id = (await crud.create_session_async(db, SessionCreate(**sample_session_data))).id
+                await crud.persist_turn_async(db, session_id, "네", "왜요?", "도전_이해", "도전_이해")
+                return await crud.get_session_state_async(db, session_id), threading.get_ident()
+
+        state, loop_thread = asyncio.run(scenario())
+
+        assert state.turns["도전_이해"] == 1
+        assert session_state_cache.stats()["write_throughs"] == 1
+        assert session_state_cache.stats()["hits"] == 1
+        assert backend.threads and loop_thread not in backend.threads
+
+    def test_cache_hit_costs_one_query(self, db_engine, db_session, sample_session_data):
+        """Test a cached read only checks the state version"""
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+        crud.get_turn_counts(db_session, db_session_obj.id)
+
+        statements = self._count_statements(db_engine)
+        crud.get_turn_counts(db_session, db_session_obj.id)
+
+        assert len(statements) == 1
+        assert "state_version" in statements[0]
+
+    def test_change_by_another_worker_is_never_served_stale(self, db_session, sample_session_data):
+        """Test a version bump the cache did not see forces a reload"""
+        from sqlalchemy import update
+        from app.services.session_state_cache import session_state_cache
+
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+        crud.update_turn_count(db_session, db_session_obj.id, "도전_이해")
+        assert crud.get_turn_counts(db_session, db_session_obj.id)["도전_이해"]["current"] == 1
+
+        # Another worker (with its own cache) records a turn
+        db_session.execute(
+            update(SessionMetric)
+            .where(SessionMetric.session_id == db_session_obj.id)
+            .values(
+                challenge_understanding_turns=SessionMetric.challenge_understanding_turns + 1,
+                state_version=SessionMetric.state_version + 1
+            )
+        )
+        db_session.commit()
+
+        assert crud.get_turn_counts(db_session, db_session_obj.id)["도전_이해"]["current"] == 2
+        assert session_state_cache.stats()["stale"] == 1
+
+        # A write-through that does not follow the cached version drops the entry
+        crud.update_turn_count(db_session, db_session_obj.id, "도전_이해")
+        session_state_cache.update(db_session_obj.id, 99, turns={"도전_이해": 0})
+        assert crud.get_turn_counts(db_session, db_session_obj.id)["도전_이해"]["current"] == 3
+
+    def test_delete_session_invalidates_state(self, db_session, sample_session_data):
+        """Test a deleted session no longer has state"""
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+        crud.get_session_state(db_session, db_session_obj.id)
+
+        crud.delete_session(db_session, db_session_obj.id)
+
+        assert crud.get_session_state(db_session, db_session_obj.id) is None
+
+
+class TestPersistTurn:
+    """Test saving a whole chat turn in one transaction"""
+
+    def test_turn_is_saved_with_one_commit(self, db_engine, db_session, sample_session_data):
+        """Test messages, transition and metrics are written by a single flush and commit"""
+        from sqlalchemy import event
+
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+        statements, commits = [], []
+        event.listen(db_engine, "before_cursor_execute", lambda conn, cursor, statement, *rest: statements.append(statement))
+        event.listen(db_session, "after_commit", lambda session: commits.append(1))
+
+        turn = crud.persist_turn(
+            db_session, db_session_obj.id, "학생들이 떠들어요", "어떤 상황인가요?", "아이디어_생성", "도전_이해",
+            metacog_elements=["점검", "조절"], response_depth="deep", reasoning="아이디어 단계로",
+            record_transition=True, message_count=3
+        )
+
+        assert len(commits) == 1
+        # Nothing is refreshed after the commit
+        assert not statements[-1].lstrip().upper().startswith("SELECT")
+        assert turn.agent_conversation_id == turn.user_conversation_id + 1
+        assert turn.turn_counts["아이디어_생성"] == {"current": 1, "max": 8}
+        assert (turn.current_turns, turn.max_turns) == (1, 8)
+
+        conversations = crud.get_session_conversations(db_session, db_session_obj.id)
+        assert [(c.role, c.cps_stage) for c in conversations] == [("user", None), ("agent", "아이디어_생성")]
+        transitions = crud.get_session_transitions(db_session, db_session_obj.id)
+        assert [(t.from_stage, t.to_stage, t.message_count) for t in transitions] == [("도전_이해", "아이디어_생성", 3)]
+
+        metric = db_session.query(SessionMetric).filter(SessionMetric.session_id == db_session_obj.id).first()
+        assert (metric.total_messages, metric.user_messages, metric.agent_messages) == (2, 1, 1)
+        assert (metric.monitoring_count, metric.control_count, metric.deep_responses) == (1, 1, 1)
+        assert metric.total_stage_transitions == 1
+        assert metric.stages_completed == ["아이디어_생성"]
+
+    def test_turn_updates_cached_state(self, db_session, sample_session_data):
+        """Test the cached session state follows persisted turns"""
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+
+        crud.persist_turn(db_session, db_session_obj.id, "네", "왜 그렇게 생각하나요?", "도전_이해", "도전_이해")
+        crud.persist_turn(
+            db_session, db_session_obj.id, "다음 단계로", "좋아요", "아이디어_생성", "도전_이해", record_transition=True
+        )
+
+        cached = crud.get_session_state(db_session, db_session_obj.id)
+        assert cached.to_dict() == crud.load_session_state(db_session, db_session_obj.id).to_dict()
+        assert cached.stage == "아이디어_생성"
+        assert cached.counters["total_messages"] == 4
+
+    def test_turn_latency_updates_response_time_metrics(self, db_session, sample_session_data):
+        """Test latencies land on the agent message and keep the running average and duration current"""
+        from datetime import timedelta
+
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+        metric = db_session.query(SessionMetric).filter(SessionMetric.session_id == db_session_obj.id).first()
+        metric.created_at -= timedelta(minutes=5)
+        db_session.commit()
+
+        crud.persist_turn(
+            db_session, db_session_obj.id, "네", "왜요?", "도전_이해", "도전_이해",
+            latency=crud.TurnLatency(llm_ms=1500, db_ms=20, total_ms=1600)
+        )
+        crud.persist_turn(
+            db_session, db_session_obj.id, "음", "좋아요", "도전_이해", "도전_이해",
+            latency=crud.TurnLatency(llm_ms=2300, db_ms=40, total_ms=2400)
+        )
+
+        agent = [c for c in crud.get_session_conversations(db_session, db_session_obj.id) if c.role == "agent"]
+        assert [c.llm_latency_ms for c in agent] == [1500, 2300]
+        # The learner message insert counts toward the database and total time
+        assert [c.total_latency_ms - c.db_latency_ms for c in agent] == [1580, 2360]
+        assert agent[0].db_latency_ms >= 20 and agent[1].db_latency_ms >= 40
+
+        db_session.expire_all()
+        metric = db_session.query(SessionMetric).filter(SessionMetric.session_id == db_session_obj.id).first()
+        assert metric.timed_replies == 2
+        assert metric.total_response_time_ms == sum(c.total_latency_ms for c in agent)
+        assert metric.avg_response_time_seconds == pytest.approx(metric.total_response_time_ms / 2 / 1000)
+        assert 299 <= metric.session_duration_seconds <= 310
+
+    def test_write_time_is_recorded_in_the_turn_transaction(self, db_session, sample_session_data, monkeypatch):
+        """Test the learner message insert time lands on the agent message, inserted or deferred, and in the average"""
+        import types
+        from sqlalchemy import event
+        from app.crud import turns
+
+        readings = iter([0.0, 0.25, 1.0, 1.5])
+        monkeypatch.setattr(turns, "time", types.SimpleNamespace(perf_counter=lambda: next(readings)))
+        session_id = crud.create_session(db_session, SessionCreate(**sample_session_data)).id
+        deferred = []
+        commits = []
+        event.listen(db_session, "after_commit", commits.append)
+
+        crud.persist_turn(
+            db_session, session_id, "네", "왜요?", "도전_이해", "도전_이해",
+            latency=crud.TurnLatency(llm_ms=1500, db_ms=20, total_ms=1600)
+        )
+        crud.persist_turn(
+            db_session, session_id, "음", "좋아요", "도전_이해", "도전_이해",
+            defer_rows=deferred.append, latency=crud.TurnLatency(llm_ms=2300, db_ms=40, total_ms=2400)
+        )
+
+        agent, = [c for c in crud.get_session_conversations(db_session, session_id) if c.role == "agent"]
+        assert (agent.llm_latency_ms, agent.db_latency_ms, agent.total_latency_ms) == (1500, 270, 1850)
+        deferred_agent = deferred[0].conversations[1]
+        assert (deferred_agent["db_latency_ms"], deferred_agent["total_latency_ms"]) == (540, 2900)
+        assert len(commits) == 2
+
+        db_session.expire_all()
+        metric = db_session.query(SessionMetric).filter(SessionMetric.session_id == session_id).first()
+        assert metric.total_response_time_ms == 4750
+        assert metric.avg_response_time_seconds == pytest.approx(2.375)
+
+    def test_average_response_time_counts_only_timed_replies(self, db_session, sample_session_data):
+        """Test replies saved without a latency do not dilute the average"""
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+
+        crud.persist_turn(db_session, db_session_obj.id, "네", "왜요?", "도전_이해", "도전_이해")
+        crud.persist_turn(
+            db_session, db_session_obj.id, "음", "좋아요", "도전_이해", "도전_이해",
+            latency=crud.TurnLatency(llm_ms=2300, db_ms=40, total_ms=2400)
+        )
+
+        db_session.expire_all()
+        metric = db_session.query(SessionMetric).filter(SessionMetric.session_id == db_session_obj.id).first()
+        assert metric.agent_messages == 2
+        assert metric.timed_replies == 1
+        assert metric.avg_response_time_seconds == pytest.approx(metric.total_response_time_ms / 1000)
+        assert metric.total_response_time_ms >= 2400
+
+
+class TestMetricCounters:
+    """Test atomic SessionMetric counter updates"""
+
+    def test_counters_are_exact_under_concurrent_turns(self, tmp_path, sample_session_data):
+        """Test parallel turns on one session from separate connections lose no increments"""
+        from concurrent.futures import ThreadPoolExecutor
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+        from app.models.database import Base
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'concurrency.db'}", connect_args={"timeout": 30})
+        Base.metadata.create_all(bind=engine)
+        SessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        with SessionFactory() as db:
+            session_id = crud.create_session(db, SessionCreate(**sample_session_data)).id
+
+        workers, turns_per_worker = 8, 10
+
+        def run_turns(worker):
+            with SessionFactory() as db:
+                for turn in range(turns_per_worker):
+                    if worker % 2:
+                        crud.persist_turn(
+                            db, session_id, "네", "왜요?", "도전_이해", "도전_이해",
+                            metacog_elements=["점검"], response_depth="medium"
+                        )
+                    else:
+                        # Per-call write path, as used before persist_turn
+                        crud.create_conversation(db, session_id=session_id, role="user", message="네")
+                        crud.update_turn_count(db, session_id, "도전_이해")
+                        crud.create_conversation(
+                            db, session_id=session_id, role="agent", message="왜요?", cps_stage="도전_이해",
+                            metacog_elements=["점검"], response_depth="medium"
+                        )
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(run_turns, range(workers)))
+
+        total_turns = workers * turns_per_worker
+        with SessionFactory() as db:
+            metric = db.query(SessionMetric).filter(SessionMetric.session_id == session_id).one()
+            assert metric.challenge_understanding_turns == total_turns
+            assert (metric.total_messages, metric.user_messages, metric.agent_messages) == (
+                2 * total_turns, total_turns, total_turns
+            )
+            assert (metric.monitoring_count, metric.medium_responses) == (total_turns, total_turns)
+            assert db.query(Conversation).filter(Conversation.session_id == session_id).count() == 2 * total_turns
+        engine.dispose()
+
+    def test_missing_metric_row_is_created(self, db_session, sample_session_data):
+        """Test a counter update upserts the metric row when it does not exist"""
+        db_session_obj = crud.create_session(db_session, SessionCreate(**sample_session_data))
+        db_session.query(SessionMetric).filter(SessionMetric.session_id == db_session_obj.id).delete()
+        db_session.commit()
+
+        crud.create_conversation(db_session, session_id=db_session_obj.id, role="user", message="안녕하세요")
+        crud.update_turn_count(db_session, db_session_obj.id, "도전_이해")
+
+        metric = db_session.query(SessionMetric).filter(SessionMetric.session_id == db_session_obj.id).one()
+        assert (metric.total_messages, metric.user_messages) == (1, 1)
+        assert metric.challenge_understanding_turns == 1
+        assert metric.state_version == 2
+
+
 class TestCascadeDelete:
     """Test cascade delete behavior"""
 
@@ -276,3 +617,179 @@ class TestCascadeDelete:
         assert len(conversations) == 0
         assert len(transitions) == 0
         assert metrics is None
+
+
+class TestAsyncCRUD:
+    """Test the async CRUD functions against the same database as the sync ones"""
+
+    def test_session_create_and_get(self, async_session_factory, sample_session_data):
+        """Test creating and reading a session"""
+        async def scenario():
+            async with async_session_factory() as db:
+                created = await crud.create_session_async(db, SessionCreate(**sample_session_data))
+                fetched = await crud.get_session_async(db, created.id)
+                missing = await crud.get_session_async(db, "missing")
+            return created, fetched, missing
+
+        created, fetched, missing = asyncio.run(scenario())
+
+        assert created.created_at is not None
+        assert fetched.id == created.id
+        assert missing is None
+
+    def test_persist_turn_matches_sync_version(self, async_session_factory, db_session, sample_session_data):
+        """Test an async turn writes the same rows, counters and cached state as a sync one"""
+        sync_id = crud.create_session(db_session, SessionCreate(**sample_session_data)).id
+        async_id = crud.create_session(db_session, SessionCreate(**sample_session_data)).id
+        turn = dict(
+            user_message="학생들이 떠들어요", agent_message="어떤 상황인가요?", cps_stage="아이디어_생성",
+            previous_stage="도전_이해", metacog_elements=["점검"], response_depth="deep",
+            record_transition=True, message_count=2, latency=crud.TurnLatency(llm_ms=900, db_ms=20, total_ms=950)
+        )
+        crud.persist_turn(db_session, sync_id, **turn)
+
+        async def scenario():
+            async with async_session_factory() as db:
+                persisted = await crud.persist_turn_async(db, async_id, **turn)
+                return (
+                    persisted,
+                    await crud.get_latest_conversations_async(db, async_id, limit=1),
+                    await crud.get_conversations_after_async(db, async_id, persisted.user_conversation_id),
+                    await crud.count_session_conversations_async(db, async_id),
+                    await crud.get_session_state_async(db, async_id),
+                )
+
+        persisted, latest, after, count, state = asyncio.run(scenario())
+
+        assert persisted.turn_counts["아이디어_생성"] == {"current": 1, "max": 8}
+        assert [c.id for c in latest] == [persisted.agent_conversation_id]
+        assert [c.role for c in after] == ["agent"]
+        assert after[0].total_latency_ms - after[0].db_latency_ms == 930
+        assert count == 2
+        assert state.stage == "아이디어_생성"
+
+        db_session.expire_all()
+        columns = ("total_messages", "agent_messages", "monitoring_count", "deep_responses", "idea_generation_turns",
+                   "total_stage_transitions", "stages_completed", "timed_replies")
+        metrics = {
+            metric.session_id: tuple(getattr(metric, column) for column in columns)
+            for metric in db_session.query(SessionMetric).filter(SessionMetric.session_id.in_([sync_id, async_id]))
+        }
+        assert metrics[async_id] == metrics[sync_id]
+        assert [t.to_stage for t in crud.get_session_transitions(db_session, async_id)] == ["아이디어_생성"]
+        assert crud.get_session_state(db_session, async_id).to_dict() == crud.load_session_state(db_session, async_id).to_dict()
+
+
+class TestEngineProfiles:
+    """Test engine options and pool statistics per database backend"""
+
+    def test_postgres_profile(self):
+        """Test pool sizing, statement_timeout and application_name come from settings"""
+        from app.core.config import Settings
+        from app.db.engine import PoolStats, engine_options
+
+        config = Settings(DB_POOL_SIZE=7, DB_MAX_OVERFLOW=3, DB_STATEMENT_TIMEOUT_MS=1500, DB_APPLICATION_NAME="cps-test")
+
+        sync = engine_options("postgresql://u:p@db/app", PoolStats(), config)
+        assert (sync["pool_size"], sync["max_overflow"], sync["echo"]) == (7, 3, False)
+        assert sync["connect_args"]["application_name"] == "cps-test"
+        assert sync["connect_args"]["options"] == "-c statement_timeout=1500"
+
+        server_settings = engine_options("postgresql+asyncpg://u:p@db/app", PoolStats(), config)["connect_args"]["server_settings"]
+        assert server_settings == {"application_name": "cps-test", "statement_timeout": "1500"}
+
+    def test_sqlite_file_gets_pragmas_and_pool_stats(self, tmp_path):
+        """Test WAL, busy_timeout and synchronous are set and checkouts are counted"""
+        from sqlalchemy import text
+        from app.core.config import Settings
+        from app.db.engine import create_db_engine
+
+        engine = create_db_engine(f"sqlite:///{tmp_path / 'profile.db'}", Settings(SQLITE_BUSY_TIMEOUT_MS=1234))
+        try:
+            with engine.connect() as connection:
+                assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+                assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 1234
+                assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+                assert engine.pool_stats.stats()["checked_out"] == 1
+
+            stats = engine.pool_stats.stats()
+            assert stats["pool_class"] == "TimedQueuePool"
+            assert (stats["checkouts"], stats["checkins"], stats["checked_out"]) == (1, 1, 0)
+            assert stats["wait_ms_max"] >= 0
+
+            # Recreated pools keep reporting to the same stats
+            engine.dispose()
+            with engine.connect():
+                pass
+            assert engine.pool_stats.stats()["checkouts"] == 2
+        finally:
+            engine.dispose()
+
+    def test_unsupported_backend_is_rejected(self):
+        """Test engines are not created for backends the counter upserts cannot handle"""
+        from app.db.engine import PoolStats, engine_options
+
+        with pytest.raises(ValueError, match="mysql"):
+            engine_options("mysql://u:p@db/app", PoolStats())
+
+    def test_sqlite_memory_uses_static_pool(self):
+        """Test an in-memory database keeps a single shared connection"""
+        from app.db.engine import create_db_engine
+
+        engine = create_db_engine("sqlite://")
+        assert engine.pool_stats.stats()["pool_class"] == "StaticPool"
+
+    def test_pool_timeout_is_counted(self, tmp_path):
+        """Test a checkout that exceeds DB_POOL_TIMEOUT_SECONDS is recorded"""
+        from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+        from app.core.config import Settings
+        from app.db.engine import create_db_engine
+
+        from prometheus_client import REGISTRY
+
+        config = Settings(DB_POOL_SIZE=1, DB_MAX_OVERFLOW=0, DB_POOL_TIMEOUT_SECONDS=0.05)
+        engine = create_db_engine(f"sqlite:///{tmp_path / 'timeout.db'}", config)
+        exported_before = REGISTRY.get_sample_value("cps_db_pool_checkout_timeouts_total", {"engine": "sync"}) or 0.0
+        try:
+            with engine.connect():
+                with pytest.raises(PoolTimeoutError):
+                    engine.connect()
+            stats = engine.pool_stats.stats()
+            assert stats["timeouts"] == 1
+            assert stats["wait_ms_max"] >= 50
+            assert REGISTRY.get_sample_value("cps_db_pool_checkout_timeouts_total", {"engine": "sync"}) == exported_before + 1
+        finally:
+            engine.dispose()
+
+
+class TestCompositeIndexes:
+    """Test composite indexes for ordered per-session and per-user reads"""
+
+    def test_session_history_is_read_without_sort(self, db_session, db_engine):
+        """Test the conversation history query walks (session_id, created_at) instead of sorting"""
+        from sqlalchemy import text
+
+        plan = db_session.execute(
+            text("EXPLAIN QUERY PLAN SELECT * FROM conversations WHERE session_id = :id ORDER BY created_at"),
+            {"id": "s1"}
+        ).all()
+        details = " ".join(row[-1] for row in plan)
+        assert "ix_conversations_session_id_created_at" in details
+        assert "TEMP B-TREE" not in details
+
+    def test_migration_adds_indexes_to_existing_tables(self, db_session, db_engine):
+        """Test the migration creates missing indexes and can be rerun"""
+        from sqlalchemy import inspect, text
+        from app.db.migrations_pg import COMPOSITE_INDEXES, migrate_add_composite_indexes_pg
+
+        for name, _, _ in COMPOSITE_INDEXES:
+            db_session.execute(text(f"DROP INDEX {name}"))
+        db_session.commit()
+
+        migrate_add_composite_indexes_pg(db_session)
+        migrate_add_composite_indexes_pg(db_session)
+
+        inspector = inspect(db_engine)
+        for name, table, columns in COMPOSITE_INDEXES:
+            indexes = {index["name"]: tuple(index["column_names"]) for index in inspector.get_indexes(table)}
+            assert indexes[name] == columns
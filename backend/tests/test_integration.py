@@ -2,7 +2,7 @@
 Integration tests for full conversation flow
 """
 import pytest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 from app import crud
 from app.models.schemas import SessionCreate
@@ -11,7 +11,7 @@ from app.models.schemas import SessionCreate
 class TestFullConversationFlow:
     """Test complete conversation flow from start to finish"""
 
-    @patch('app.services.gemini_service.gemini_service.generate_scaffolding')
+    @patch('app.services.gemini_service.gemini_service.generate_scaffolding_async', new_callable=AsyncMock)
     def test_complete_cps_journey(self, mock_gemini, client, db_session, sample_session_data):
         """Test a complete CPS problem-solving journey"""
 
@@ -145,7 +145,7 @@ class TestFullConversationFlow:
 class TestMetricsCalculation:
     """Test automatic metrics calculation"""
 
-    @patch('app.services.gemini_service.gemini_service.generate_scaffolding')
+    @patch('app.services.gemini_service.gemini_service.generate_scaffolding_async', new_callable=AsyncMock)
     def test_metrics_update_on_conversation(self, mock_gemini, client, db_session, sample_session_data):
         """Test that metrics are automatically updated when conversations are added"""
 
@@ -210,7 +210,7 @@ class TestErrorHandling:
         response = client.post("/api/chat/message", json=message)
         assert response.status_code == 404
 
-    @patch('app.services.gemini_service.gemini_service.generate_scaffolding')
+    @patch('app.services.gemini_service.gemini_service.generate_scaffolding_async', new_callable=AsyncMock)
     def test_gemini_service_failure(self, mock_gemini, client, db_session, sample_session_data):
         """Test handling of Gemini service failure"""
         # Create session
@@ -233,7 +233,7 @@ class TestErrorHandling:
 class TestDataExport:
     """Test data export functionality"""
 
-    @patch('app.services.gemini_service.gemini_service.generate_scaffolding')
+    @patch('app.services.gemini_service.gemini_service.generate_scaffolding_async', new_callable=AsyncMock)
     def test_csv_export_completeness(self, mock_gemini, client, db_session, sample_session_data):
         """Test that CSV export contains all required data"""
         # Create session and conversations
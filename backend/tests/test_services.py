@@ -0,0 +1,1258 @@
+"""
+Tests for service layer
+"""
+import pytest
+import asyncio
+import json
+import time
+from pathlib import Path
+
+from app.core.config import Settings
+from app.services.circuit_breaker import CircuitBreaker, STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN
+from app.services.context_builder import ContextBuilder, estimate_tokens, fit_to_budget
+from app.services.conversation_history import ConversationHistoryBuffer
+from app.services.intent_detector import Intent, IntentDetector, detect_intent
+from app.services.gemini_service import GeminiService, ScaffoldingParseError, gemini_service
+from app.services.llm_backends import LocalBackend, DEFAULT_LOCAL_RESPONSES, create_backend
+from app.services.llm_backends import LLMRateLimitError, LLMTransientError
+from app.services.llm_retry import DeadlineRetrier, LLMDeadlineExceededError
+from app.services.llm_dispatcher import LLMDispatcher, LLMQueueFullError, LLMQueueTimeoutError
+from app.services.research_export import stream_csv, stream_parquet, stream_session_bundles
+from app.services.response_cache import ResponseCache, InMemoryCacheBackend, normalize_message
+from app.services.stream_parser import JSONStringFieldStreamer
+from app.services.write_behind import WriteBehindWriter
+
+INTENT_CORPUS = json.loads((Path(__file__).parent / "fixtures" / "intent_corpus.json").read_text(encoding="utf-8"))
+
+SAMPLE_SCAFFOLDING = {
+    "current_stage": "도전_이해",
+    "detected_metacog_needs": ["점검"],
+    "response_depth": "medium",
+    "scaffolding_question": "해당 문제의 난이도는 어느 정도라고 판단되나요?",
+    "should_transition": False,
+    "reasoning": "문제 난이도 점검 필요"
+}
+
+
+class FakeBackend:
+    """Minimal LLMBackend for service tests"""
+
+    name = "fake"
+
+    def __init__(self, text="", error=None, delay=0.0, chunk_size=10):
+        self.text = text
+        self.error = error
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.calls = 0
+
+    def generate(self, prompt):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return self.text
+
+    async def generate_async(self, prompt):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.text
+
+    async def stream_async(self, prompt):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        for i in range(0, len(self.text), self.chunk_size):
+            yield self.text[i:i + self.chunk_size]
+
+
+class TestGeminiServiceAsync:
+    """Test async scaffolding generation"""
+
+    def test_generate_scaffolding_async(self, monkeypatch):
+        """Test async path parses the backend's response"""
+        backend = FakeBackend(text=f"```json\n{json.dumps(SAMPLE_SCAFFOLDING, ensure_ascii=False)}\n```")
+        monkeypatch.setattr(gemini_service, "backend", backend)
+
+        result = asyncio.run(gemini_service.generate_scaffolding_async("학생들이 집중을 못 해요", [], "도전_이해"))
+
+        assert result["scaffolding_question"] == SAMPLE_SCAFFOLDING["scaffolding_question"]
+        assert backend.calls == 1
+
+    def test_generate_scaffolding_async_error_falls_back(self, monkeypatch):
+        """Test async path returns the fallback response on API errors"""
+        monkeypatch.setattr(gemini_service, "backend", FakeBackend(error=Exception("boom")))
+
+        result = asyncio.run(gemini_service.generate_scaffolding_async("학생들이 집중을 못 해요", []))
+
+        assert result["reasoning"] == "시스템 오류로 인한 안전한 기본 응답 제공"
+
+    def test_concurrent_calls_do_not_serialize(self, monkeypatch):
+        """Test many in-flight async calls overlap instead of running one by one"""
+        backend = FakeBackend(text=json.dumps(SAMPLE_SCAFFOLDING, ensure_ascii=False), delay=0.2)
+        monkeypatch.setattr(gemini_service, "backend", backend)
+
+        async def run_batch():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            await asyncio.gather(*[
+                gemini_service.generate_scaffolding_async(f"메시지 {i}", []) for i in range(20)
+            ])
+            return loop.time() - started
+
+        elapsed = asyncio.run(run_batch())
+        assert elapsed < 1.0
+
+    def test_generate_scaffolding_stream(self, monkeypatch):
+        """Test streaming path yields question deltas before the final result"""
+        backend = FakeBackend(text=json.dumps(SAMPLE_SCAFFOLDING, ensure_ascii=False))
+        monkeypatch.setattr(gemini_service, "backend", backend)
+
+        async def collect():
+            return [event async for event in gemini_service.generate_scaffolding_stream("학생들이 집중을 못 해요", [])]
+
+        events = asyncio.run(collect())
+
+        assert [e["type"] for e in events][-1] == "result"
+        assert "".join(e["text"] for e in events if e["type"] == "delta") == SAMPLE_SCAFFOLDING["scaffolding_question"]
+        assert events[-1]["data"]["current_stage"] == "도전_이해"
+
+
+class TestScaffoldingParser:
+    """Test single-pass parsing and validation of model output"""
+
+    @staticmethod
+    def _parse(payload, is_question=False):
+        text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+        return GeminiService(backend=LocalBackend())._parse_result_text(text, is_question, "메시지")
+
+    def test_question_mode(self):
+        """Test a bare JSON object is validated into the scaffolding dict"""
+        assert self._parse(SAMPLE_SCAFFOLDING) == SAMPLE_SCAFFOLDING
+
+    def test_answer_mode_joins_follow_up(self):
+        """Test answer-mode output is mapped onto scaffolding_question"""
+        payload = {k: v for k, v in SAMPLE_SCAFFOLDING.items() if k != "scaffolding_question"}
+        payload.update(answer_message="CPS는 세 단계로 진행됩니다.", follow_up_question="어느 단계인가요?")
+
+        result = self._parse(payload, is_question=True)
+
+        assert result["scaffolding_question"] == "CPS는 세 단계로 진행됩니다. 어느 단계인가요?"
+        assert "answer_message" not in result
+
+    def test_lenient_fields_are_normalized(self):
+        """Test a string metacog need and capitalized depth are normalized"""
+        payload = dict(SAMPLE_SCAFFOLDING, detected_metacog_needs="조절", response_depth="Deep")
+
+        result = self._parse("```json\n" + json.dumps(payload, ensure_ascii=False) + "\n```")
+
+        assert result["detected_metacog_needs"] == ["조절"]
+        assert result["response_depth"] == "deep"
+
+    @pytest.mark.parametrize("payload", [
+        "not json",
+        "[1, 2]",
+        {k: v for k, v in SAMPLE_SCAFFOLDING.items() if k != "reasoning"},
+        dict(SAMPLE_SCAFFOLDING, response_depth="very deep"),
+        dict(SAMPLE_SCAFFOLDING, scaffolding_question="질" * 501),
+    ])
+    def test_invalid_output_raises_parse_error(self, payload):
+        """Test malformed or out-of-schema output raises ScaffoldingParseError"""
+        with pytest.raises(ScaffoldingParseError):
+            self._parse(payload)
+
+
+class TestGeminiBackend:
+    """Test the Gemini SDK backend without calling the API"""
+
+    def test_json_mode_sends_response_schema(self):
+        """Test JSON mode puts the MIME type and scaffolding schema on every request"""
+        pytest.importorskip("google.generativeai")
+        from app.services.llm_backends import GeminiBackend
+
+        backend = GeminiBackend("test-key", "gemini-1.5-flash", json_mode=True)
+        request = backend.model._prepare_request(
+            contents="학생들이 떠들어요", generation_config=backend.generation_config, tools=None, tool_config=None
+        )
+
+        config = request.generation_config
+        assert config.response_mime_type == "application/json"
+        assert set(config.response_schema.required) == {
+            "current_stage", "detected_metacog_needs", "response_depth", "should_transition", "reasoning"
+        }
+        assert list(config.response_schema.properties["response_depth"].enum) == ["shallow", "medium", "deep"]
+
+    def test_json_mode_can_be_disabled(self):
+        """Test the prompt alone asks for JSON when JSON mode is off"""
+        pytest.importorskip("google.generativeai")
+        from app.services.llm_backends import GeminiBackend
+
+        assert GeminiBackend("test-key", "gemini-1.5-flash", json_mode=False).generation_config is None
+
+
+class TestLocalBackend:
+    """Test the deterministic offline backend"""
+
+    def test_deterministic_question_and_answer_modes(self):
+        """Test same prompt gives same response and answer mode is detected"""
+        service = GeminiService(backend=LocalBackend())
+
+        first = service.generate_scaffolding("학생들이 수업에 집중하지 못해요", [], "도전_이해")
+        second = service.generate_scaffolding("학생들이 수업에 집중하지 못해요", [], "도전_이해")
+        answer = service.generate_scaffolding("CPS가 뭐예요?", [], "도전_이해")
+
+        assert first == second
+        assert first["scaffolding_question"] in [r["scaffolding_question"] for r in DEFAULT_LOCAL_RESPONSES["question"]]
+        assert answer["scaffolding_question"].startswith(DEFAULT_LOCAL_RESPONSES["answer"][0]["answer_message"])
+
+    def test_error_rate_and_latency(self):
+        """Test simulated errors fall back and latency is applied"""
+        failing = GeminiService(backend=LocalBackend(error_rate=1.0))
+        result = asyncio.run(failing.generate_scaffolding_async("학생들이 수업에 집중하지 못해요", []))
+        assert result["reasoning"] == "시스템 오류로 인한 안전한 기본 응답 제공"
+
+        slow = LocalBackend(latency_ms=50)
+        started = time.monotonic()
+        asyncio.run(slow.generate_async("prompt"))
+        assert time.monotonic() - started >= 0.05
+
+    def test_create_backend_from_settings(self, tmp_path):
+        """Test backend selection and canned responses file loading"""
+        responses_file = tmp_path / "responses.json"
+        responses_file.write_text(json.dumps({
+            "question": [SAMPLE_SCAFFOLDING],
+            "answer": DEFAULT_LOCAL_RESPONSES["answer"]
+        }, ensure_ascii=False), encoding="utf-8")
+
+        config = Settings(LLM_BACKEND="local", LOCAL_LLM_RESPONSES_PATH=str(responses_file))
+        backend = create_backend(config)
+
+        assert isinstance(backend, LocalBackend)
+        assert json.loads(backend.generate("이전 대화:\n없음")) == SAMPLE_SCAFFOLDING
+
+        with pytest.raises(ValueError):
+            create_backend(Settings(LLM_BACKEND="unknown"))
+
+
+class TestResponseCache:
+    """Test the LRU+TTL response cache"""
+
+    def _service(self, backend, **cache_options):
+        return GeminiService(backend=backend, response_cache=ResponseCache(InMemoryCacheBackend(**cache_options)))
+
+    def test_repeated_input_hits_cache(self):
+        """Test near-identical messages in the same context skip the backend"""
+        backend = FakeBackend(text=json.dumps(SAMPLE_SCAFFOLDING, ensure_ascii=False))
+        service = self._service(backend)
+
+        first = asyncio.run(service.generate_scaffolding_async("모르겠어요.", [], "도전_이해"))
+        second = asyncio.run(service.generate_scaffolding_async(" 모르겠어요 ~", [], "도전_이해"))
+
+        assert first == second
+        assert backend.calls == 1
+        assert service.response_cache.stats()["hits"] == 1
+        assert service.response_cache.stats()["misses"] == 1
+
+    def test_blocking_backend_is_called_off_the_event_loop(self):
+        """Test the async path runs a network cache backend in a worker thread"""
+        import threading
+
+        class RecordingBackend(InMemoryCacheBackend):
+            blocking = True
+            threads = []
+
+            def get(self, key):
+                self.threads.append(threading.get_ident())
+                return super().get(key)
+
+            def set(self, key, value):
+                self.threads.append(threading.get_ident())
+                super().set(key, value)
+
+        backend = FakeBackend(text=json.dumps(SAMPLE_SCAFFOLDING, ensure_ascii=False))
+        cache_backend = RecordingBackend()
+        service = GeminiService(backend=backend, response_cache=ResponseCache(cache_backend))
+
+        asyncio.run(service.generate_scaffolding_async("모르겠어요", [], "도전_이해"))
+
+        assert len(cache_backend.threads) == 2
+        assert threading.get_ident() not in cache_backend.threads
+        assert service.response_cache.stats()["misses"] == 1
+
+    def test_key_includes_stage_and_context(self):
+        """Test different stage or recent context produce separate entries"""
+        backend = FakeBackend(text=json.dumps(SAMPLE_SCAFFOLDING, ensure_ascii=False))
+        service = self._service(backend)
+        history = [{"role": "agent", "content": "어떤 아이디어가 있나요?"}]
+
+        service.generate_scaffolding("모르겠어요", [], "도전_이해")
+        service.generate_scaffolding("모르겠어요", [], "아이디어_생성")
+        service.generate_scaffolding("모르겠어요", history, "도전_이해")
+
+        assert backend.calls == 3
+
+    def test_failures_are_not_cached(self):
+        """Test fallback responses are never stored"""
+        backend = FakeBackend(text="not json")
+        service = self._service(backend)
+
+        service.generate_scaffolding("모르겠어요", [], "도전_이해")
+        service.generate_scaffolding("모르겠어요", [], "도전_이해")
+
+        assert backend.calls == 2
+
+    def test_lru_eviction_and_ttl(self, monkeypatch):
+        """Test size-based eviction and expiry"""
+        cache = InMemoryCacheBackend(max_entries=2, ttl_seconds=10)
+        cache.set("a", {"v": 1})
+        cache.set("b", {"v": 2})
+        cache.get("a")
+        cache.set("c", {"v": 3})
+
+        assert cache.get("b") is None
+        assert cache.get("a") == {"v": 1}
+        assert cache.evictions == 1
+
+        now = time.monotonic()
+        monkeypatch.setattr(time, "monotonic", lambda: now + 11)
+        assert cache.get("a") is None
+        assert cache.expirations == 1
+
+    def test_normalize_message(self):
+        """Test punctuation and whitespace are ignored"""
+        assert normalize_message("잘 모르겠어요...") == normalize_message("잘모르겠어요")
+        assert normalize_message("네!") == normalize_message("네")
+
+
+class TestLLMDispatcher:
+    """Test LLM concurrency limiting, queueing and rate limiting"""
+
+    def test_limits_in_flight_calls(self):
+        """Test no more than max_in_flight calls run at once"""
+        dispatcher = LLMDispatcher(max_in_flight=3)
+        peak = 0
+
+        async def call():
+            nonlocal peak
+            peak = max(peak, dispatcher.in_flight)
+            await asyncio.sleep(0.01)
+            return "ok"
+
+        async def run_batch():
+            return await asyncio.gather(*[dispatcher.run(call) for _ in range(12)])
+
+        assert asyncio.run(run_batch()) == ["ok"] * 12
+        assert peak == 3
+        assert dispatcher.stats()["completed"] == 12
+
+    def test_retries_after_rate_limit_hint(self):
+        """Test a 429 is retried after its retry-after delay instead of failing"""
+        dispatcher = LLMDispatcher(max_wait_seconds=2)
+        attempts = []
+
+        async def call():
+            attempts.append(time.monotonic())
+            if len(attempts) == 1:
+                raise LLMRateLimitError("429 Resource exhausted", retry_after=0.1)
+            return "ok"
+
+        assert asyncio.run(dispatcher.run(call)) == "ok"
+        assert attempts[1] - attempts[0] >= 0.1
+        assert dispatcher.stats()["rate_limited"] == 1
+
+    def test_rate_limit_beyond_wait_budget_is_raised(self):
+        """Test a retry-after longer than the wait budget is surfaced"""
+        dispatcher = LLMDispatcher(max_wait_seconds=0.5)
+
+        async def call():
+            raise LLMRateLimitError("429", retry_after=30)
+
+        with pytest.raises(LLMRateLimitError):
+            asyncio.run(dispatcher.run(call))
+
+    def test_queue_full_and_timeout(self):
+        """Test backpressure when the queue is full or the wait is too long"""
+        dispatcher = LLMDispatcher(max_in_flight=1, max_queue_size=1, max_wait_seconds=0.05)
+
+        async def slow():
+            await asyncio.sleep(0.2)
+            return "ok"
+
+        async def run_batch():
+            return await asyncio.gather(*[dispatcher.run(slow) for _ in range(3)], return_exceptions=True)
+
+        results = asyncio.run(run_batch())
+        assert results[0] == "ok"
+        assert {type(r) for r in results[1:]} == {LLMQueueFullError, LLMQueueTimeoutError}
+
+    def test_token_bucket_spaces_calls(self):
+        """Test calls beyond the burst wait for new tokens"""
+        dispatcher = LLMDispatcher(requests_per_minute=600, burst=2, max_wait_seconds=2)
+
+        async def call():
+            return time.monotonic()
+
+        async def run_batch():
+            return await asyncio.gather(*[dispatcher.run(call) for _ in range(4)])
+
+        started = time.monotonic()
+        finished = asyncio.run(run_batch())
+        assert max(finished) - started >= 0.18  # 2 extra calls at 10/s
+
+    def test_service_uses_dispatcher_fallback_on_timeout(self):
+        """Test the service falls back when the dispatcher cannot start a call"""
+        backend = FakeBackend(text=json.dumps(SAMPLE_SCAFFOLDING, ensure_ascii=False))
+        service = GeminiService(
+            backend=backend,
+            response_cache=None,
+            dispatcher=LLMDispatcher(requests_per_minute=1, burst=1, max_wait_seconds=0.1)
+        )
+
+        async def run_two():
+            first = await service.generate_scaffolding_async("첫 번째 메시지", [])
+            second = await service.generate_scaffolding_async("두 번째 메시지", [])
+            return first, second
+
+        first, second = asyncio.run(run_two())
+        assert first["scaffolding_question"] == SAMPLE_SCAFFOLDING["scaffolding_question"]
+        assert second["reasoning"] == "시스템 오류로 인한 안전한 기본 응답 제공"
+        assert backend.calls == 1
+
+
+class TestDeadlineRetrier:
+    """Test deadline-budgeted retries and hedging"""
+
+    def test_retries_transient_errors(self):
+        """Test transient failures are retried within the budget"""
+        retrier = DeadlineRetrier(deadline_seconds=2, base_delay_seconds=0.01)
+        outcomes = [LLMTransientError("503"), LLMTransientError("503"), "ok"]
+
+        async def call():
+            outcome = outcomes.pop(0)
+            if isinstance(outcome, Exception):
+                raise outcome
+            return outcome
+
+        assert asyncio.run(retrier.call(call)) == "ok"
+        assert retrier.stats()["retries"] == 2
+        assert retrier.stats()["attempts"] == 3
+
+    def test_non_retryable_error_is_raised_immediately(self):
+        """Test unexpected errors are not retried"""
+        retrier = DeadlineRetrier(deadline_seconds=2)
+        calls = []
+
+        async def call():
+            calls.append(1)
+            raise ValueError("bad request")
+
+        with pytest.raises(ValueError):
+            asyncio.run(retrier.call(call))
+        assert len(calls) == 1
+
+    def test_deadline_exceeded(self):
+        """Test a call slower than the budget is abandoned"""
+        retrier = DeadlineRetrier(deadline_seconds=0.1)
+
+        async def call():
+            await asyncio.sleep(1)
+
+        started = time.monotonic()
+        with pytest.raises(LLMDeadlineExceededError):
+            asyncio.run(retrier.call(call))
+        assert time.monotonic() - started < 0.5
+        assert retrier.stats()["deadline_exceeded"] == 1
+
+    def test_hedged_request_wins_when_first_is_slow(self):
+        """Test a hedge fired after the hedge delay can answer first"""
+        retrier = DeadlineRetrier(deadline_seconds=2, hedging_enabled=True, hedge_delay_seconds=0.05)
+        delays = [1.0, 0.01]
+
+        async def call():
+            delay = delays.pop(0)
+            await asyncio.sleep(delay)
+            return delay
+
+        started = time.monotonic()
+        assert asyncio.run(retrier.call(call)) == 0.01
+        assert time.monotonic() - started < 0.5
+        assert retrier.stats()["hedges_fired"] == 1
+        assert retrier.stats()["hedges_won"] == 1
+
+    def test_hedge_waits_for_latency_samples(self):
+        """Test percentile-based hedging needs enough samples first"""
+        retrier = DeadlineRetrier(hedging_enabled=True, hedge_min_samples=3)
+        assert retrier._hedge_delay() is None
+
+        for latency in (0.1, 0.2, 0.3):
+            retrier.latencies.record(latency)
+        assert retrier._hedge_delay() == 0.3
+
+    def test_service_retries_malformed_output(self):
+        """Test a malformed response is retried instead of falling back"""
+        responses = ["not json", json.dumps(SAMPLE_SCAFFOLDING, ensure_ascii=False)]
+
+        class FlakyBackend(FakeBackend):
+            async def generate_async(self, prompt):
+                self.calls += 1
+                return responses.pop(0)
+
+        backend = FlakyBackend()
+        service = GeminiService(
+            backend=backend,
+            response_cache=None,
+            dispatcher=None,
+            retrier=DeadlineRetrier(
+                deadline_seconds=2,
+                base_delay_seconds=0.01,
+                retryable_errors=(LLMTransientError, ScaffoldingParseError)
+            )
+        )
+
+        result = asyncio.run(service.generate_scaffolding_async("학생들이 집중을 못 해요", []))
+
+        assert result["scaffolding_question"] == SAMPLE_SCAFFOLDING["scaffolding_question"]
+        assert backend.calls == 2
+
+    def test_hedge_takes_its_own_dispatcher_slot(self):
+        """Test a hedged request waits for a free slot instead of bypassing max_in_flight"""
+        in_flight = peak = 0
+
+        class SlowBackend(FakeBackend):
+            async def generate_async(self, prompt):
+                nonlocal in_flight, peak
+                in_flight += 1
+                peak = max(peak, in_flight)
+                try:
+                    return await super().generate_async(prompt)
+                finally:
+                    in_flight -= 1
+
+        backend = SlowBackend(text=json.dumps(SAMPLE_SCAFFOLDING, ensure_ascii=False), delay=0.2)
+        dispatcher = LLMDispatcher(max_in_flight=1)
+        service = GeminiService(
+            backend=backend,
+            response_cache=None,
+            dispatcher=dispatcher,
+            retrier=DeadlineRetrier(deadline_seconds=2, hedging_enabled=True, hedge_delay_seconds=0.05),
+            circuit_breaker=None
+        )
+
+        result = asyncio.run(service.generate_scaffolding_async("학생들이 집중을 못 해요", []))
+
+        assert result["scaffolding_question"] == SAMPLE_SCAFFOLDING["scaffolding_question"]
+        assert service.retrier.stats()["hedges_fired"] == 1
+        assert peak == 1
+        assert dispatcher.stats()["max_queue_depth_seen"] == 1
+
+    def test_hedge_latencies_exclude_dispatcher_queueing(self):
+        """Test the hedge window learns backend time, not time spent waiting for a slot"""
+        backend = FakeBackend(text=json.dumps(SAMPLE_SCAFFOLDING, ensure_ascii=False), delay=0.1)
+        dispatcher = LLMDispatcher(max_in_flight=1, max_wait_seconds=5)
+        service = GeminiService(
+            backend=backend,
+            response_cache=None,
+            dispatcher=dispatcher,
+            retrier=DeadlineRetrier(deadline_seconds=2),
+            circuit_breaker=None
+        )
+
+        async def run():
+            await asyncio.gather(*(
+                service.generate_scaffolding_async(f"학생들이 집중을 못 해요 {i}", []) for i in range(3)
+            ))
+
+        asyncio.run(run())
+
+        # The third call queued behind two others for ~0.2s before its own 0.1s
+        assert len(service.retrier.latencies) == 3
+        assert service.retrier.latencies.percentile(1.0) < 0.18
+
+    def test_deadline_includes_dispatcher_queueing(self):
+        """Test time spent waiting for a slot counts against the deadline"""
+        backend = FakeBackend(text=json.dumps(SAMPLE_SCAFFOLDING, ensure_ascii=False))
+        dispatcher = LLMDispatcher(max_in_flight=1, max_wait_seconds=5)
+        service = GeminiService(
+            backend=backend,
+            response_cache=None,
+            dispatcher=dispatcher,
+            retrier=DeadlineRetrier(deadline_seconds=0.2),
+            circuit_breaker=None
+        )
+
+        async def scenario():
+            busy = asyncio.ensure_future(dispatcher.run(lambda: asyncio.sleep(0.6)))
+            await asyncio.sleep(0)
+            started = time.monotonic()
+            result = await service.generate_scaffolding_async("학생들이 집중을 못 해요", [])
+            elapsed = time.monotonic() - started
+            await busy
+            return result, elapsed
+
+        result, elapsed = asyncio.run(scenario())
+
+        assert result["reasoning"] == "시스템 오류로 인한 안전한 기본 응답 제공"
+        assert elapsed < 0.5
+        assert backend.calls == 0
+        assert service.retrier.stats()["deadline_exceeded"] == 1
+
+
+class TestConversationHistoryBuffer:
+    """Test the per-session server-side history buffer"""
+
+    @staticmethod
+    def _session_with_messages(db_session, count):
+        from app import crud
+        from app.models.schemas import SessionCreate
+
+        db_session_obj = crud.create_session(db_session, SessionCreate(assignment_text="과제"))
+        for i in range(count):
+            crud.create_conversation(db_session, session_id=db_session_obj.id, role="user" if i % 2 == 0 else "agent", message=f"메시지 {i}")
+        return db_session_obj.id
+
+    def test_warms_with_latest_messages(self, db_session):
+        """Test the first read loads only the last max_messages rows"""
+        session_id = self._session_with_messages(db_session, 5)
+        buffer = ConversationHistoryBuffer(max_messages=3)
+
+        history, count = buffer.get(db_session, session_id)
+
+        assert [m["content"] for m in history] == ["메시지 2", "메시지 3", "메시지 4"]
+        assert count == 5
+        assert buffer.stats()["warms"] == 1
+
+    def test_catches_up_with_new_rows(self, db_session):
+        """Test later reads pick up rows written since, e.g. by another worker"""
+        from app import crud
+
+        session_id = self._session_with_messages(db_session, 2)
+        buffer = ConversationHistoryBuffer(max_messages=3)
+        buffer.get(db_session, session_id)
+
+        crud.create_conversation(db_session, session_id=session_id, role="user", message="새 메시지")
+        history, count = buffer.get(db_session, session_id)
+
+        assert [m["content"] for m in history] == ["메시지 0", "메시지 1", "새 메시지"]
+        assert count == 3
+        assert buffer.stats()["warms"] == 1
+        assert buffer.stats()["catch_ups"] == 1
+
+    def test_rewarms_when_a_lower_id_commits_late(self, db_session):
+        """Test a row committed after a higher id was read is not skipped"""
+        from app.models.database import Conversation
+
+        session_id = self._session_with_messages(db_session, 2)
+        buffer = ConversationHistoryBuffer(max_messages=5)
+        # Another worker took id 100 first but commits after id 101 was read
+        db_session.add(Conversation(id=101, session_id=session_id, role="agent", message="먼저 커밋된 메시지"))
+        db_session.commit()
+        buffer.get(db_session, session_id)
+
+        db_session.add(Conversation(id=100, session_id=session_id, role="user", message="늦은 메시지"))
+        db_session.commit()
+        history, count = buffer.get(db_session, session_id)
+
+        assert [m["content"] for m in history] == ["메시지 0", "메시지 1", "늦은 메시지", "먼저 커밋된 메시지"]
+        assert count == 4
+        assert buffer.stats()["gaps"] == 1
+        assert buffer.stats()["warms"] == 2
+
+    def test_evicts_least_recently_used_sessions(self, db_session):
+        """Test buffers beyond max_sessions are dropped"""
+        buffer = ConversationHistoryBuffer(max_messages=2, max_sessions=1)
+        first = self._session_with_messages(db_session, 1)
+        second = self._session_with_messages(db_session, 1)
+
+        buffer.get(db_session, first)
+        buffer.get(db_session, second)
+        buffer.get(db_session, first)
+
+        assert buffer.stats()["warms"] == 3
+        assert buffer.stats()["evictions"] == 2
+
+    def test_async_reads_share_the_buffer(self, db_session, async_session_factory):
+        """Test the async read warms and catches up like the sync one"""
+        from app import crud
+
+        session_id = self._session_with_messages(db_session, 5)
+        buffer = ConversationHistoryBuffer(max_messages=3)
+
+        async def read():
+            async with async_session_factory() as db:
+                return await buffer.get_async(db, session_id)
+
+        first, _ = asyncio.run(read())
+        crud.create_conversation(db_session, session_id=session_id, role="user", message="새 메시지")
+        history, count = asyncio.run(read())
+
+        assert [m["content"] for m in first] == ["메시지 2", "메시지 3", "메시지 4"]
+        assert [m["content"] for m in history] == ["메시지 3", "메시지 4", "새 메시지"]
+        assert count == 6
+        assert buffer.stats()["warms"] == 1
+        assert buffer.stats()["catch_ups"] == 1
+
+
+class TestContextBuilder:
+    """Test token-budgeted history with a rolling summary of older turns"""
+
+    @staticmethod
+    def _session_with_turns(db_session, turns):
+        from app import crud
+        from app.models.schemas import SessionCreate
+
+        db_session_obj = crud.create_session(db_session, SessionCreate(assignment_text="과제"))
+        for user_message, stage in turns:
+            crud.create_conversation(db_session, session_id=db_session_obj.id, role="user", message=user_message)
+            crud.create_conversation(db_session, session_id=db_session_obj.id, role="agent", message="질문입니다", cps_stage=stage)
+        return db_session_obj.id
+
+    def test_fit_to_budget_keeps_newest_messages(self):
+        """Test the oldest messages are dropped first and the newest is always kept"""
+        history = [{"role": "user", "content": "가" * 30} for _ in range(5)]
+        per_message = estimate_tokens("가" * 30) + 4
+
+        assert fit_to_budget(history, per_message * 2) == history[-2:]
+        assert fit_to_budget(history, 1) == history[-1:]
+        assert fit_to_budget([], 100) == []
+
+    def test_short_session_has_no_summary(self, db_session):
+        """Test everything stays verbatim while it fits the budget"""
+        from app.services.conversation_history import ConversationHistoryBuffer
+
+        session_id = self._session_with_turns(db_session, [("학생들이 떠들어요", "도전_이해")])
+        history, _ = ConversationHistoryBuffer().get(db_session, session_id)
+
+        recent, summary = ContextBuilder(token_budget=1000).build(db_session, session_id, history)
+
+        assert recent == history
+        assert summary is None
+
+    def test_older_learner_messages_are_summarized_by_stage(self, db_session):
+        """Test messages beyond the budget become summary points under their stage"""
+        from app.services.conversation_history import ConversationHistoryBuffer
+
+        session_id = self._session_with_turns(db_session, [
+            ("학생들이 수업에 집중하지 않아요. 특히 오후에 심해요.", "도전_이해"),
+            ("모둠 활동을 해보면 어떨까요", "아이디어_생성"),
+            ("다음 주에 시도해 볼게요", "실행_준비"),
+        ])
+        history, _ = ConversationHistoryBuffer().get(db_session, session_id)
+        builder = ContextBuilder(token_budget=estimate_tokens("다음 주에 시도해 볼게요") + estimate_tokens("질문입니다") + 8)
+
+        recent, summary = builder.build(db_session, session_id, history)
+
+        assert [m["content"] for m in recent] == ["다음 주에 시도해 볼게요", "질문입니다"]
+        # Learner messages count toward the stage their turn was handled in
+        assert summary.splitlines() == [
+            "- 도전_이해: 학생들이 수업에 집중하지 않아요.",
+            "- 아이디어_생성: 모둠 활동을 해보면 어떨까요",
+        ]
+
+    def test_summary_is_folded_incrementally(self, db_session):
+        """Test later turns only read rows newer than the summary"""
+        from app import crud
+        from app.services.conversation_history import ConversationHistoryBuffer
+
+        session_id = self._session_with_turns(db_session, [("첫 번째 고민", "도전_이해"), ("두 번째 고민", "도전_이해")])
+        buffer = ConversationHistoryBuffer()
+        builder = ContextBuilder(token_budget=estimate_tokens("질문입니다") + 4)
+
+        builder.build(db_session, session_id, buffer.get(db_session, session_id)[0])
+        assert builder.stats()["rows_folded"] == 3
+
+        crud.create_conversation(db_session, session_id=session_id, role="user", message="세 번째 고민")
+        recent, summary = builder.build(db_session, session_id, buffer.get(db_session, session_id)[0])
+
+        assert [m["content"] for m in recent] == ["세 번째 고민"]
+        assert builder.stats()["rows_folded"] == 4
+        assert summary == "- 도전_이해: 첫 번째 고민 / 두 번째 고민"
+
+    def test_async_build_matches_sync_build(self, db_session, async_session_factory):
+        """Test the async build folds the same rows into the same summary"""
+        from app.services.conversation_history import ConversationHistoryBuffer
+
+        session_id = self._session_with_turns(db_session, [("첫 번째 고민", "도전_이해"), ("두 번째 고민", "아이디어_생성")])
+        history, _ = ConversationHistoryBuffer().get(db_session, session_id)
+        budget = estimate_tokens("질문입니다") + 4
+
+        async def build():
+            async with async_session_factory() as db:
+                return await ContextBuilder(token_budget=budget).build_async(db, session_id, history)
+
+        assert asyncio.run(build()) == ContextBuilder(token_budget=budget).build(db_session, session_id, history)
+
+    def test_summary_is_included_in_prompt(self):
+        """Test the summary is rendered ahead of the recent messages"""
+        service = GeminiService(response_cache=None, circuit_breaker=None)
+        history = [{"role": "agent", "content": "어떤 방법을 생각하셨나요?"}]
+
+        prompt, _ = service._build_prompt("모둠 활동이요", history, "아이디어_생성", "- 도전_이해: 학생들이 집중하지 않아요")
+
+        assert "[앞선 대화 요약 - 학습자가 말한 내용]" in prompt
+        assert prompt.index("학생들이 집중하지 않아요") < prompt.index("어떤 방법을 생각하셨나요?")
+
+
+class TestCircuitBreaker:
+    """Test the circuit breaker around LLM calls"""
+
+    @staticmethod
+    def _breaker(**options):
+        now = [0.0]
+        options.setdefault("window_size", 4)
+        options.setdefault("minimum_calls", 4)
+        breaker = CircuitBreaker(clock=lambda: now[0], **options)
+        return breaker, now
+
+    def test_opens_on_failure_rate_and_rejects(self):
+        """Test the circuit opens once the failure rate reaches the threshold"""
+        breaker, _ = self._breaker(failure_rate_threshold=0.5)
+
+        for outcome in (True, False, True):
+            assert breaker.allow_request()
+            breaker.record_failure() if outcome else breaker.record_success(0.1)
+        assert breaker.state == STATE_CLOSED  # below minimum_calls
+
+        assert breaker.allow_request()
+        breaker.record_success(0.1)
+        assert breaker.state == STATE_OPEN
+        assert not breaker.allow_request()
+        assert breaker.stats()["rejected"] == 1
+
+    def test_opens_on_slow_calls(self):
+        """Test successful but slow calls open the circuit"""
+        breaker, _ = self._breaker(slow_call_seconds=1.0, slow_call_rate_threshold=0.75)
+
+        for latency in (2.0, 2.0, 0.1, 2.0):
+            breaker.allow_request()
+            breaker.record_success(latency)
+
+        assert breaker.state == STATE_OPEN
+
+    def test_half_open_probes_close_or_reopen(self):
+        """Test half-open probes close the circuit on success and reopen it on failure"""
+        breaker, now = self._breaker(open_seconds=10, half_open_probes=2)
+        for _ in range(4):
+            breaker.allow_request()
+            breaker.record_failure()
+        assert breaker.state == STATE_OPEN
+
+        now[0] = 10
+        assert breaker.allow_request()
+        assert breaker.state == STATE_HALF_OPEN
+        breaker.record_failure()
+        assert breaker.state == STATE_OPEN
+
+        now[0] = 20
+        assert breaker.allow_request()
+        assert breaker.allow_request()
+        assert not breaker.allow_request()  # only two probes in flight
+        breaker.record_success(0.1)
+        breaker.record_success(0.1)
+        assert breaker.state == STATE_CLOSED
+        assert breaker.stats()["times_opened"] == 2
+
+    def test_service_degrades_without_calling_backend_while_open(self):
+        """Test an open circuit answers from the question bank immediately"""
+        backend = FakeBackend(error=LLMTransientError("503"))
+        breaker, _ = self._breaker(window_size=2, minimum_calls=2)
+        service = GeminiService(backend=backend, response_cache=None, dispatcher=None, retrier=None, circuit_breaker=breaker)
+
+        async def run_turns():
+            return [await service.generate_scaffolding_async(f"메시지 {i}", [], "아이디어_생성") for i in range(4)]
+
+        results = asyncio.run(run_turns())
+
+        assert backend.calls == 2
+        assert breaker.state == STATE_OPEN
+        assert results[0]["reasoning"] == "시스템 오류로 인한 안전한 기본 응답 제공"
+        degraded = results[3]
+        assert degraded["current_stage"] == "아이디어_생성"
+        assert degraded["should_transition"] is False
+        assert degraded["reasoning"] == "LLM 서비스 일시 장애로 질문 뱅크 기반 응답 제공"
+        assert service.stats()["circuit_breaker"]["state"] == STATE_OPEN
+
+    def test_rate_limits_do_not_trip_the_breaker(self):
+        """Test 429 responses are left to the dispatcher and not counted as failures"""
+        backend = FakeBackend(error=LLMRateLimitError("429"))
+        breaker, _ = self._breaker(window_size=2, minimum_calls=2)
+        service = GeminiService(backend=backend, response_cache=None, dispatcher=None, retrier=None, circuit_breaker=breaker)
+
+        for i in range(3):
+            asyncio.run(service.generate_scaffolding_async(f"메시지 {i}", []))
+
+        assert backend.calls == 3
+        assert breaker.state == STATE_CLOSED
+
+
+class TestIntentDetector:
+    """Test question and transition intent detection"""
+
+    @pytest.mark.parametrize("case", INTENT_CORPUS, ids=lambda case: case["message"] or "(empty)")
+    def test_golden_corpus(self, case):
+        """Test detection matches the recorded intents for the golden corpus"""
+        assert detect_intent(case["message"]) == Intent(
+            is_question=case["is_question"],
+            wants_transition=case["wants_transition"],
+            target_stage=case["target_stage"]
+        )
+
+    def test_overlapping_and_nested_patterns(self):
+        """Test overlapping matches and keywords nested in longer keywords are all found"""
+        detector = IntentDetector(
+            question_patterns=["ab"],
+            transition_keywords={"cd": "first", "bcd": "second"},
+            transition_indicators=["go"]
+        )
+
+        assert detector.detect("abcd go") == Intent(True, True, "first")
+        assert detector.detect("bcdgo") == Intent(False, True, "first")
+
+
+class TestJSONStringFieldStreamer:
+    """Test incremental JSON field extraction"""
+
+    def test_extracts_field_across_chunks(self):
+        """Test field text is emitted as soon as its chunks arrive"""
+        text = "```json\n" + json.dumps(SAMPLE_SCAFFOLDING, ensure_ascii=False, indent=2) + "\n```"
+        streamer = JSONStringFieldStreamer(["scaffolding_question"])
+
+        collected = []
+        for i in range(0, len(text), 7):
+            collected.extend(streamer.feed(text[i:i + 7]))
+
+        assert {field for field, _ in collected} == {"scaffolding_question"}
+        assert "".join(delta for _, delta in collected) == SAMPLE_SCAFFOLDING["scaffolding_question"]
+
+    def test_decodes_escapes_split_between_chunks(self):
+        """Test escape sequences and surrogate pairs split across chunk boundaries"""
+        payload = {"reasoning": "x", "scaffolding_question": "\"인용\" 줄\n바꿈 😀 끝"}
+        text = json.dumps(payload)  # ASCII-escaped, including surrogate pairs
+        streamer = JSONStringFieldStreamer(["scaffolding_question"])
+
+        collected = "".join(delta for ch in text for _, delta in streamer.feed(ch))
+
+        assert collected == payload["scaffolding_question"]
+
+    def test_ignores_values_of_other_fields(self):
+        """Test a value equal to a tracked key name is not treated as a key"""
+        text = '{"reasoning": "scaffolding_question", "scaffolding_question": "질문"}'
+        streamer = JSONStringFieldStreamer(["scaffolding_question"])
+
+        assert streamer.feed(text) == [("scaffolding_question", "질문")]
+
+
+class TestWriteBehindWriter:
+    """Test write-behind persistence of turn rows"""
+
+    @pytest.fixture
+    def chat_session(self, db_session, sample_session_data):
+        from app import crud
+        from app.models.schemas import SessionCreate
+        return crud.create_session(db_session, SessionCreate(**sample_session_data))
+
+    @staticmethod
+    def _writer(db_engine, **kwargs):
+        from sqlalchemy.orm import sessionmaker
+        return WriteBehindWriter(session_factory=sessionmaker(autoflush=False, bind=db_engine), **kwargs)
+
+    @staticmethod
+    def _persist(db_session, session_id, writer, record_transition=False):
+        from app import crud
+        return crud.persist_turn(
+            db_session, session_id, "학생들이 떠들어요", "어떤 상황인가요?", "도전_이해", "도전_이해",
+            metacog_elements=["점검"], record_transition=record_transition, defer_rows=writer.enqueue
+        )
+
+    def test_turns_are_batched(self, db_engine, db_session, chat_session):
+        """Test queued turns are inserted together once the session is waited on"""
+        from app import crud
+        writer = self._writer(db_engine, flush_interval_ms=1000)
+
+        async def scenario():
+            await writer.start()
+            for index in range(3):
+                turn = self._persist(db_session, chat_session.id, writer, record_transition=index == 0)
+                assert turn.user_conversation_id is None
+            assert writer.stats()["queue_depth"] > 0
+            await writer.wait_for_session(chat_session.id)
+            stats = writer.stats()
+            await writer.stop()
+            return stats
+
+        stats = asyncio.run(scenario())
+
+        assert stats["batches"] == 1
+        assert stats["rows_written"] == 7
+        assert stats["queue_depth"] == 0
+        conversations = crud.get_session_conversations(db_session, chat_session.id)
+        assert [c.role for c in conversations] == ["user", "agent"] * 3
+        assert conversations[0].metacog_elements is None
+        assert conversations[1].metacog_elements == ["점검"]
+        assert len(crud.get_session_transitions(db_session, chat_session.id)) == 1
+
+    def test_wait_for_session_times_out(self, db_engine, db_session, chat_session):
+        """Test a turn stops waiting for queued rows after wait_timeout_ms"""
+        from app import crud
+        writer = self._writer(db_engine, flush_interval_ms=10_000, wait_timeout_ms=50)
+
+        async def scenario():
+            await writer.start()
+            self._persist(db_session, chat_session.id, writer)
+            started = time.monotonic()
+            await writer.wait_for_session(chat_session.id)
+            waited = time.monotonic() - started
+            visible = len(crud.get_session_conversations(db_session, chat_session.id))
+            await writer.stop()
+            return waited, visible
+
+        waited, visible = asyncio.run(scenario())
+
+        assert waited < 1
+        assert visible == 0
+        assert writer.stats()["wait_timeouts"] == 1
+        assert len(crud.get_session_conversations(db_session, chat_session.id)) == 2
+
+    def test_stop_flushes_queue(self, db_engine, db_session, chat_session):
+        """Test stop() writes every queued turn before returning"""
+        from app import crud
+        writer = self._writer(db_engine, flush_interval_ms=10_000, batch_rows=4)
+
+        async def scenario():
+            await writer.start()
+            for _ in range(5):
+                self._persist(db_session, chat_session.id, writer)
+            await writer.stop()
+
+        asyncio.run(scenario())
+
+        assert not writer.running
+        assert writer.rows_written == 10
+        assert len(crud.get_session_conversations(db_session, chat_session.id)) == 10
+
+    def test_writes_synchronously_when_not_running(self, db_engine, db_session, chat_session):
+        """Test rows are inserted by the caller when the background task is not running"""
+        from app import crud
+        writer = self._writer(db_engine)
+
+        self._persist(db_session, chat_session.id, writer)
+
+        assert writer.sync_writes == 1
+        assert len(crud.get_session_conversations(db_session, chat_session.id)) == 2
+
+    def test_full_queue_falls_back_to_sync_write(self, db_engine, db_session, chat_session):
+        """Test a turn that does not fit in the queue is written synchronously"""
+        from app import crud
+        writer = self._writer(db_engine, queue_size=1, flush_interval_ms=10_000)
+
+        async def scenario():
+            await writer.start()
+            # The writer task has not run yet, so the first turn fills the queue
+            self._persist(db_session, chat_session.id, writer)
+            self._persist(db_session, chat_session.id, writer)
+            await writer.stop()
+
+        asyncio.run(scenario())
+
+        assert writer.sync_writes == 1
+        assert writer.turns_queued == 1
+        assert len(crud.get_session_conversations(db_session, chat_session.id)) == 4
+
+    def test_failed_batch_only_drops_bad_rows(self, db_engine, db_session, chat_session, sample_session_data):
+        """Test a row that cannot be inserted does not take the other turns of its batch with it"""
+        from datetime import datetime
+        from app import crud
+        from app.models.schemas import SessionCreate
+        other_session = crud.create_session(db_session, SessionCreate(**sample_session_data))
+        writer = self._writer(db_engine, flush_interval_ms=1000, max_attempts=1)
+
+        def turn(session_id, to_stage):
+            now = datetime.utcnow()
+            return crud.TurnRows(
+                session_id,
+                [
+                    {"session_id": session_id, "role": "user", "message": "학생들이 떠들어요", "created_at": now},
+                    {"session_id": session_id, "role": "agent", "message": "어떤 상황인가요?", "created_at": now},
+                ],
+                {"session_id": session_id, "from_stage": "도전_이해", "to_stage": to_stage, "created_at": now}
+            )
+
+        async def scenario():
+            await writer.start()
+            writer.enqueue(turn(chat_session.id, "아이디어_생성"))
+            writer.enqueue(turn(other_session.id, None))  # to_stage is NOT NULL
+            await writer.stop()
+
+        asyncio.run(scenario())
+
+        stats = writer.stats()
+        assert (stats["rows_written"], stats["rows_dropped"], stats["turns_split"]) == (5, 1, 1)
+        assert len(crud.get_session_conversations(db_session, chat_session.id)) == 2
+        assert len(crud.get_session_transitions(db_session, chat_session.id)) == 1
+        assert len(crud.get_session_conversations(db_session, other_session.id)) == 2
+        assert crud.get_session_transitions(db_session, other_session.id) == []
+
+
+class TestResearchExport:
+    """Test streaming CSV exports"""
+
+    def test_csv_is_streamed_per_chunk(self, db_engine, db_session, sample_session_data):
+        """Test each chunk of rows becomes its own piece of the response"""
+        import csv
+        import io
+        from sqlalchemy.orm import sessionmaker
+        from app import crud
+        from app.models.schemas import SessionCreate
+
+        session_id = crud.create_session(db_session, SessionCreate(**sample_session_data)).id
+        for index in range(5):
+            crud.create_conversation(
+                db_session, session_id, "agent", f"질문 {index}", metacog_elements=["점검", "조절"], should_transition=False
+            )
+
+        pieces = list(stream_csv(
+            sessionmaker(bind=db_engine),
+            crud.conversation_export_query(),
+            crud.CONVERSATION_EXPORT_COLUMNS,
+            chunk_size=2
+        ))
+
+        assert len(pieces) == 4  # Header, then chunks of 2, 2 and 1 rows
+        rows = list(csv.DictReader(io.StringIO("".join(pieces))))
+        assert [row["message"] for row in rows] == [f"질문 {index}" for index in range(5)]
+        assert rows[0]["user_id"] == sample_session_data["user_id"]
+        assert rows[0]["metacog_elements"] == "점검,조절"
+        assert rows[0]["should_transition"] == "False"
+
+    def test_parquet_keeps_column_types_and_row_groups(self, db_engine, db_session, sample_session_data):
+        """Test Parquet columns are typed and chunks are grouped into row groups"""
+        pa = pytest.importorskip("pyarrow")
+        import io
+        import pyarrow.parquet as pq
+        from sqlalchemy.orm import sessionmaker
+        from app import crud
+        from app.models.schemas import SessionCreate
+
+        session_id = crud.create_session(db_session, SessionCreate(**sample_session_data)).id
+        for index in range(5):
+            crud.create_conversation(
+                db_session, session_id, "agent", f"질문 {index}", metacog_elements=["점검", "조절"], should_transition=False
+            )
+
+        pieces = list(stream_parquet(
+            sessionmaker(bind=db_engine),
+            crud.conversation_export_query(),
+            crud.CONVERSATION_EXPORT_COLUMNS,
+            chunk_size=2,
+            row_group_rows=4
+        ))
+
+        assert len(pieces) == 2  # The first row group once 4 rows are read, then the rest and the footer
+        parquet_file = pq.ParquetFile(io.BytesIO(b"".join(pieces)))
+        assert parquet_file.metadata.num_rows == 5
+        assert [parquet_file.metadata.row_group(i).num_rows for i in range(parquet_file.num_row_groups)] == [4, 1]
+
+        schema = parquet_file.schema_arrow
+        assert schema.field("created_at").type == pa.timestamp("us")
+        assert schema.field("should_transition").type == pa.bool_()
+        assert schema.field("metacog_elements").type == pa.list_(pa.string())
+
+        table = parquet_file.read()
+        assert table.column("message").to_pylist() == [f"질문 {index}" for index in range(5)]
+        assert table.column("metacog_elements").to_pylist()[0] == ["점검", "조절"]
+        assert table.column("should_transition").to_pylist()[0] is False
+
+    def test_session_bundles_load_children_per_chunk(self, db_engine, db_session, sample_session_data):
+        """Test children are loaded with one query per relationship and chunk of sessions"""
+        from sqlalchemy import event
+        from sqlalchemy.orm import sessionmaker
+        from app import crud
+        from app.models.schemas import SessionCreate
+
+        session_ids = []
+        for index in range(5):
+            session_id = crud.create_session(db_session, SessionCreate(**sample_session_data)).id
+            session_ids.append(session_id)
+            crud.update_turn_count(db_session, session_id, "도전_이해")
+            for turn in range(index + 1):
+                crud.create_conversation(db_session, session_id, "user", f"메시지 {turn}")
+            crud.create_stage_transition(db_session, session_id, None, "도전_이해", "시작", 0)
+
+        statements = []
+        event.listen(db_engine, "before_cursor_execute", lambda conn, cursor, statement, *rest: statements.append(statement))
+
+        pieces = list(stream_session_bundles(sessionmaker(bind=db_engine), crud.session_bundle_query(), chunk_size=2))
+
+        assert len(pieces) == 3  # Chunks of 2, 2 and 1 sessions
+        # The session query, then conversations, transitions and metrics for each chunk
+        assert len([s for s in statements if s.lstrip().upper().startswith("SELECT")]) == 1 + 3 * 3
+
+        bundles = [json.loads(line) for line in "".join(pieces).splitlines()]
+        assert sorted(b["session_id"] for b in bundles) == sorted(session_ids)
+        by_id = {b["session_id"]: b for b in bundles}
+        for index, session_id in enumerate(session_ids):
+            bundle = by_id[session_id]
+            assert [c["message"] for c in bundle["conversations"]] == [f"메시지 {turn}" for turn in range(index + 1)]
+            assert [t["to_stage"] for t in bundle["transitions"]] == ["도전_이해"]
+            assert bundle["metrics"]["total_messages"] == index + 1
+
+
+class TestPrometheusMetrics:
+    """Test Prometheus instrumentation of the LLM pipeline and multiprocess aggregation"""
+
+    @staticmethod
+    def _sample(name, **labels):
+        from prometheus_client import REGISTRY
+        return REGISTRY.get_sample_value(name, labels) or 0.0
+
+    def test_llm_outcomes_and_modes_are_counted(self):
+        """Test ok, parse_error and fallback outcomes are counted per question/answer mode"""
+        ok = GeminiService(backend=LocalBackend(), response_cache=None, dispatcher=None, retrier=None, circuit_breaker=None)
+        broken = GeminiService(
+            backend=FakeBackend(text="not json"), response_cache=None, dispatcher=None, retrier=None, circuit_breaker=None
+        )
+        failing = GeminiService(
+            backend=FakeBackend(error=RuntimeError("down")), response_cache=None, dispatcher=None, retrier=None, circuit_breaker=None
+        )
+        before = {
+            key: self._sample("cps_llm_requests_total", outcome=key[0], mode=key[1])
+            for key in (("ok", "question"), ("ok", "answer"), ("parse_error", "question"), ("fallback", "question"))
+        }
+        latency_before = self._sample("cps_llm_request_duration_seconds_count", outcome="ok")
+
+        asyncio.run(ok.generate_scaffolding_async("학생들이 수업에 집중하지 못해요", []))
+        asyncio.run(ok.generate_scaffolding_async("CPS가 뭐예요?", []))
+        asyncio.run(broken.generate_scaffolding_async("학생들이 수업에 집중하지 못해요", []))
+        asyncio.run(failing.generate_scaffolding_async("학생들이 수업에 집중하지 못해요", []))
+
+        for key, value in before.items():
+            assert self._sample("cps_llm_requests_total", outcome=key[0], mode=key[1]) == value + 1
+        assert self._sample("cps_llm_request_duration_seconds_count", outcome="ok") == latency_before + 2
+
+    def test_multiprocess_samples_are_aggregated(self, tmp_path):
+        """Test samples written by separate worker processes are summed for a scrape"""
+        import os
+        import subprocess
+        import sys
+        from prometheus_client import CollectorRegistry, generate_latest
+        from prometheus_client.multiprocess import MultiProcessCollector
+
+        worker = (
+            "from app.services.metrics import count_stage_transition, observe_request\n"
+            "count_stage_transition('도전_이해', '아이디어_생성')\n"
+            "observe_request('POST', '/api/chat/message', 200, 1.5)\n"
+        )
+        env = {**os.environ, "PROMETHEUS_MULTIPROC_DIR": str(tmp_path)}
+        for _ in range(2):
+            subprocess.run([sys.executable, "-c", worker], env=env, check=True, cwd=Path(__file__).parent.parent)
+
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry, path=str(tmp_path))
+        text = generate_latest(registry).decode("utf-8")
+
+        assert 'cps_stage_transitions_total{from_stage="도전_이해",to_stage="아이디어_생성"} 2.0' in text
+        assert registry.get_sample_value(
+            "cps_http_request_duration_seconds_bucket",
+            {"method": "POST", "route": "/api/chat/message", "status": "200", "le": "2.0"}
+        ) == 2.0
+
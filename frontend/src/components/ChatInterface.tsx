@@ -75,7 +75,6 @@ export default function ChatInterface() {
       const response = await chatApi.sendMessage({
         session_id: currentSessionId,
         message: currentInput,
-        conversation_history: messages,
         current_stage: currentStage || undefined,
       });
 
@@ -41,7 +41,8 @@ export interface ChatResponse {
 export interface ChatRequest {
   session_id?: string;
   message: string;
-  conversation_history: Message[];
+  /** @deprecated Ignored by the server, which builds history from stored messages */
+  conversation_history?: Message[];
   current_stage?: string;
 }
 